@@ -1,6 +1,20 @@
 """cloudfile-mover package initialisation."""
 
 # Expose the main API at package level for convenience
-from .core import move_file
+from .core import move_file, move_prefix
+from .batch import move_batch, read_manifest
+from .cancel import CancellationToken, TransferCancelled
+from .retry import RetryPolicy, RetryError
+from .checksums import ChecksumError
+from .ratelimit import set_bandwidth_limit
 
-__all__ = ["move_file"]
+__all__ = ["move_file", "move_prefix", "move_batch", "read_manifest", "move_file_async", "CancellationToken", "TransferCancelled", "RetryPolicy", "RetryError", "ChecksumError",
+           "set_bandwidth_limit"]
+
+
+def __getattr__(name):
+    # asyncio is only imported by callers that use the async API.
+    if name == "move_file_async":
+        from .aio import move_file_async
+        return move_file_async
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,24 +1,128 @@
 import argparse
 import logging
-from .core import move_file
+import signal
+from .cancel import CancellationToken
+from .batch import BATCH_FILES, BATCH_TOTAL_THREADS, move_batch, read_manifest
+from .core import SMALL_OBJECT_SIZE, move_file, move_prefix
+from .listing import LIST_THREADS, is_prefix_url
+from .ratelimit import limiter, load_limits, parse_limit_spec
+from .retry import RetryPolicy
 
 def main():
     parser = argparse.ArgumentParser(prog="cloudfile-mover",
-        description="Move large files between AWS S3, Google Cloud Storage, and Azure Blob Storage.")
-    parser.add_argument("source", help="Source file URL (s3://, gs://, or azure://)")
-    parser.add_argument("destination", help="Destination file URL (s3://, gs://, or azure://)")
+        usage="%(prog)s [options] SOURCE DESTINATION\n       %(prog)s [options] batch MANIFEST",
+        description="Move large files between AWS S3, Google Cloud Storage, and Azure Blob Storage.",
+        epilog="'batch MANIFEST' moves every pair of a JSON Lines file (- for stdin) of "
+               "{\"src\": ..., \"dst\": ...} objects, as it is read.")
+    parser.add_argument("source", help="Source file URL (s3://, gs://, or azure://); a prefix ending in / "
+                                       "moves every object under it, and with --glob so does a pattern "
+                                       "such as s3://bucket/logs/*.gz")
+    parser.add_argument("destination", nargs="?",
+                        help="Destination file URL (s3://, gs://, or azure://), or a prefix "
+                             "ending in / when the source is a prefix or glob")
     parser.add_argument("-t", "--threads", type=int, default=4, help="Number of threads for parallel transfer")
+    parser.add_argument("--files", type=int, default=BATCH_FILES,
+                        help="Objects moved at once in a batch or when the source is a prefix or glob "
+                             f"(default {BATCH_FILES})")
+    parser.add_argument("--total-threads", type=int, default=BATCH_TOTAL_THREADS,
+                        help="Requests per side in flight across all objects of a batch or prefix move "
+                             f"(default {BATCH_TOTAL_THREADS}); --threads then applies to each object")
+    parser.add_argument("--glob", action="store_true",
+                        help="Treat *, ? and [ in the source key as a glob pattern instead of literal characters")
+    parser.add_argument("--list-threads", type=int, default=LIST_THREADS,
+                        help=f"Listing requests in flight when the source is a prefix or glob (default {LIST_THREADS})")
+    parser.add_argument("--download-threads", type=int, help="Threads reading from the source (defaults to --threads)")
+    parser.add_argument("--upload-threads", type=int, help="Threads writing to the destination (defaults to --threads)")
+    parser.add_argument("--read-ahead", type=int, help="Maximum downloaded chunks buffered ahead of the uploaders")
+    parser.add_argument("--chunk-size", default="auto",
+                        help="Part size such as 64MiB or 1GiB, or 'auto' to fit the provider part limits (default)")
+    parser.add_argument("--no-native-copy", action="store_true",
+                        help="Stream data through this host even when the providers can copy server-side")
+    parser.add_argument("--ingest-from-url", action="store_true",
+                        help="For moves into Azure, presign the source and let Azure pull each block from it")
+    parser.add_argument("--max-attempts", type=int, default=5,
+                        help="Attempts per download or upload of a part before the move fails (default 5)")
+    parser.add_argument("--max-memory", metavar="SIZE",
+                        help="Cap on part data held in memory, e.g. 2GiB; smaller parts are planned to fit")
+    parser.add_argument("--stream-parts", action="store_true",
+                        help="Pipe each part from the source response into its upload instead of buffering "
+                             "whole parts, so large --chunk-size values need little memory")
+    parser.add_argument("--autotune", action="store_true",
+                        help="Adjust how many threads are active from measured throughput and throttling, "
+                             "treating the thread counts as ceilings")
+    parser.add_argument("--min-threads", type=int, default=1,
+                        help="Fewest active threads per side --autotune may back off to (default 1)")
+    parser.add_argument("--small-object-size", metavar="SIZE", default=SMALL_OBJECT_SIZE,
+                        help="Objects up to this size move with one GET and one PUT instead of a multipart "
+                             f"upload (default {SMALL_OBJECT_SIZE // 2**20}MiB; 0 disables)")
+    parser.add_argument("--no-verify", action="store_true",
+                        help="Skip CRC32C checksums of parts and the end-to-end comparison with the source")
+    parser.add_argument("--if-identical", choices=("overwrite", "skip", "delete-source"), default="overwrite",
+                        help="When the destination already holds an object of the same size and checksum: move "
+                             "again (default), skip it, or only delete the source. Costs one HEAD of the destination")
+    parser.add_argument("--no-hedge", action="store_true",
+                        help="Do not split the last parts into subranges or re-issue reads that fall behind")
+    parser.add_argument("--bandwidth", metavar="[PROVIDER:][read|write=]RATE", action="append", default=[],
+                        help="Cap streamed traffic, e.g. 2Gbit, write=1Gbit or s3:read=200MiB; repeatable")
+    parser.add_argument("--bandwidth-file", metavar="PATH",
+                        help="File of --bandwidth specs, one per line, re-read on SIGHUP to change limits mid-transfer")
+    parser.add_argument("--prewarm", action="store_true",
+                        help="Open one connection per worker before the first parts start")
+    parser.add_argument("--resume", action="store_true",
+                        help="Journal committed parts and continue an interrupted move of the same source instead of restarting")
+    parser.add_argument("--journal", metavar="PATH",
+                        help="Resume journal location (default ~/.cache/cloudfile-mover/journal.sqlite)")
     parser.add_argument("--no-progress", action="store_true", help="Disable progress bar")
     parser.add_argument("-v", "--verbose", action="store_true", help="Enable verbose logging output")
     args = parser.parse_args()
+    if args.destination is None:
+        parser.error("the following arguments are required: destination")
     # Configure logging to console
     logging.basicConfig(format="%(message)s", level=logging.DEBUG if args.verbose else logging.INFO)
+    # A scheduler's SIGTERM stops in-flight parts and aborts the partial upload.
+    cancel_token = CancellationToken()
+    signal.signal(signal.SIGTERM, lambda signum, frame: cancel_token.cancel("SIGTERM"))
+    if args.bandwidth_file:
+        load_limits(args.bandwidth_file)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda signum, frame: reload_limits(args.bandwidth_file))
+    for spec in args.bandwidth:
+        limiter.set_limit(*parse_limit_spec(spec))
+    options = dict(threads=args.threads, verbose=args.verbose,
+                   download_threads=args.download_threads, upload_threads=args.upload_threads,
+                   read_ahead=args.read_ahead, chunk_size=args.chunk_size,
+                   native_copy=not args.no_native_copy, ingest_from_url=args.ingest_from_url,
+                   cancel_token=cancel_token, retry=RetryPolicy(max_attempts=args.max_attempts),
+                   resume=args.resume, journal_path=args.journal, prewarm_connections=args.prewarm,
+                   max_memory=args.max_memory, stream_parts=args.stream_parts,
+                   autotune=args.autotune, min_threads=args.min_threads,
+                   hedge_tail=not args.no_hedge, verify_checksums=not args.no_verify,
+                   if_identical=args.if_identical, small_object_size=args.small_object_size)
     try:
-        move_file(args.source, args.destination, threads=args.threads, 
-                  show_progress=not args.no_progress, verbose=args.verbose)
+        if args.source == "batch" or is_prefix_url(args.source, glob=args.glob):
+            batch_options = dict(files=args.files, total_threads=args.total_threads,
+                                 show_progress=not args.no_progress, **options)
+            if args.source == "batch":
+                result = move_batch(read_manifest(args.destination), **batch_options)
+            else:
+                result = move_prefix(args.source, args.destination, list_threads=args.list_threads,
+                                     glob=args.glob, **batch_options)
+            if result["failed"]:
+                for url, error in result["failed"].items():
+                    logging.error(f"Failed to move {url}: {error}")
+                exit(1)
+        else:
+            move_file(args.source, args.destination, show_progress=not args.no_progress, **options)
     except Exception as e:
         logging.error(f"Failed to move file: {e}")
         exit(1)
 
+def reload_limits(path):
+    try:
+        load_limits(path)
+        logging.info(f"Bandwidth limits reloaded from {path}: {limiter.limits()}")
+    except (OSError, ValueError) as e:
+        logging.error(f"Keeping current bandwidth limits, cannot load {path}: {e}")
+
 if __name__ == "__main__":
     main()
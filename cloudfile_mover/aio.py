@@ -0,0 +1,391 @@
+"""asyncio transfer engine and the ``move_file_async`` coroutine."""
+
+import asyncio
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from .autotune import ConcurrencyTuner
+from . import checksums as _checksums
+from .buffers import PASSTHROUGH_WINDOW, BufferPool, accepts, accepts_buffer
+from .cancel import CancellationToken, TransferCancelled
+from .core import SMALL_OBJECT_SIZE, Transfer
+from .ratelimit import limiter
+from .retry import RetryPolicy
+
+logger = logging.getLogger("cloudfile_mover")
+
+# Sentinel telling an upload task that no more chunks will arrive.
+_DONE = object()
+
+
+class AsyncTransferPipeline:
+    """The asyncio counterpart of ``TransferPipeline``.
+
+    Download and upload tasks are joined by an ``asyncio.Queue`` of at most
+    ``read_ahead`` chunks and hold up to ``download_concurrency`` and
+    ``upload_concurrency`` requests in flight. A handler method with an
+    ``_async`` twin (``read_range_async``, ``upload_part_async``,
+    ``copy_part_async``, ``copy_from_async``) is awaited directly, so handlers
+    built on an async transport keep hundreds of requests in flight on one
+    thread; plain methods run on a private thread pool with a thread for
+    each request only they can make. A handler's ``aclose()`` coroutine, if it has one, is awaited
+    once the parts are done, to close what its async methods opened on the
+    loop. The first failure cancels ``cancel_token`` and every task.
+    ``autotune`` treats the concurrencies as ceilings, ``checksums`` hashes
+    each part (on the thread pool) and ``single_request`` moves a one-part
+    object with ``put_object`` once ``before_put`` accepts it, as in
+    ``TransferPipeline``.
+    """
+
+    def __init__(self, src, dest, parts, download_concurrency=4, upload_concurrency=4,
+                 read_ahead=None, progress=None, retry=None, server_side=False,
+                 cancel_token=None, on_part=None, memory=None, passthrough=False,
+                 autotune=False, min_concurrency=1, checksums=(), single_request=False, before_put=None):
+        self.src, self.dest = src, dest
+        self.before_put = before_put
+        self.server_side = server_side
+        self.parts = list(parts)
+        self.single_request = (single_request and not server_side and len(self.parts) == 1
+                               and hasattr(dest, "put_object"))
+        self.download_concurrency = max(1, min(download_concurrency, len(self.parts)))
+        self.upload_concurrency = max(1, min(upload_concurrency, len(self.parts)))
+        self.read_ahead = max(1, read_ahead if read_ahead is not None else self.upload_concurrency)
+        self.progress = progress
+        self.on_part = on_part
+        self.memory = memory
+        self.passthrough = (passthrough and not server_side and hasattr(src, "open_range")
+                            and hasattr(dest, "upload_part_stream"))
+        read_range = getattr(src, "read_range_async", None) or getattr(src, "read_range", None)
+        self.buffers = None
+        if (not server_side and not self.passthrough and not self.single_request and self.parts and read_range
+                and accepts_buffer(read_range)):
+            self.buffers = BufferPool(max(length for _, _, length in self.parts),
+                                      self.download_concurrency + self.read_ahead + self.upload_concurrency)
+        self.retry = retry or RetryPolicy()
+        self.retries = {"download": 0, "upload": 0, "copy": 0}
+        self.checksums = tuple(checksums)
+        self.part_checksums = {}
+        self._send_checksum = "crc32c" in self.checksums and accepts(dest.upload_part, "checksum")
+        self.tuners = {}
+        if autotune:
+            self.tuners["download"] = ConcurrencyTuner("download", self.download_concurrency, min_concurrency)
+            self.tuners["upload"] = self.tuners["copy"] = ConcurrencyTuner("upload", self.upload_concurrency,
+                                                                           min_concurrency)
+        self.cancel_token = cancel_token or CancellationToken()
+        src.cancel_token = dest.cancel_token = self.cancel_token
+        src.throttle = limiter.throttle(getattr(src, "provider", None), "read", self.cancel_token)
+        dest.throttle = limiter.throttle(getattr(dest, "provider", None), "write", self.cancel_token)
+        self._error = None
+        self._tasks = []
+
+    async def run(self):
+        if not self.parts:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._pending = asyncio.Queue()
+        for part in self.parts:
+            self._pending.put_nowait(part)
+        self._executor = ThreadPoolExecutor(max_workers=self._threads_needed(), thread_name_prefix="aio")
+        # A cancel from another thread (or a failing worker) stops every task.
+        handle = self.cancel_token.register(lambda: self._loop.call_soon_threadsafe(self._stop))
+        try:
+            if self.single_request:
+                await asyncio.wait([self._spawn(self._put_whole)])
+            elif self.server_side:
+                await self._run_server_side()
+            elif self.passthrough:
+                await asyncio.wait([self._spawn(self._passthrough_loop) for _ in range(self.upload_concurrency)])
+            else:
+                try:
+                    await self._run_streaming()
+                finally:
+                    self._drain()
+        except asyncio.CancelledError:
+            self.cancel_token.cancel("task cancelled")
+            self._stop()
+            raise
+        finally:
+            self.cancel_token.unregister(handle)
+            self._executor.shutdown(wait=False)
+            for handler in (self.src, self.dest):
+                if hasattr(handler, "aclose"):
+                    await handler.aclose()
+        if self._error is not None:
+            raise self._error
+        self.cancel_token.raise_if_cancelled()
+
+    async def _run_streaming(self):
+        self._chunks = asyncio.Queue(maxsize=self.read_ahead)
+        downloaders = [self._spawn(self._download_loop) for _ in range(self.download_concurrency)]
+        uploaders = [self._spawn(self._upload_loop) for _ in range(self.upload_concurrency)]
+        await asyncio.wait(downloaders)
+        if not self.cancel_token.cancelled:
+            for _ in uploaders:
+                await self._chunks.put(_DONE)
+        await asyncio.wait(uploaders)
+
+    async def _run_server_side(self):
+        if len(self.parts) == 1 or not hasattr(self.dest, "copy_part"):
+            copy = lambda: self._call(self.dest, "copy_from", self.src, progress=self._advance_threadsafe)
+            await asyncio.wait([self._spawn(lambda: self._attempt(copy, "copy", 1))])
+            return
+        await asyncio.wait([self._spawn(self._copy_loop) for _ in range(self.upload_concurrency)])
+
+    async def _put_whole(self):
+        part_number, offset, length = self.parts[0]
+        reserved = await self._reserve(length)
+        try:
+            async with self._slot("download"):
+                data = await self._attempt(lambda: self._call(self.src, "read_range", offset, length),
+                                           "download", part_number, length)
+            extra = {}
+            if self.checksums:
+                self.part_checksums[part_number] = await self._loop.run_in_executor(
+                    self._executor, _checksums.digest, data, self.checksums)
+                if "crc32c" in self.checksums and accepts(self.dest.put_object, "checksum"):
+                    extra["checksum"] = self.part_checksums[part_number]["crc32c"]
+            if self.before_put:
+                self.before_put(self.part_checksums)
+            async with self._slot("upload"):
+                await self._attempt(lambda: self._call(self.dest, "put_object", data, **extra),
+                                    "upload", part_number, length)
+        finally:
+            self._release(reserved)
+        self._committed(part_number)
+        self._advance(length)
+
+    async def _copy_loop(self):
+        while not self._pending.empty() and not self.cancel_token.cancelled:
+            part_number, offset, length = self._pending.get_nowait()
+            async with self._slot("copy"):
+                await self._attempt(lambda: self._call(self.dest, "copy_part", part_number, self.src, offset, length),
+                                    "copy", part_number, length)
+            logger.debug(f"Copied part {part_number} ({length} bytes)")
+            self._committed(part_number)
+            self._advance(length)
+
+    async def _passthrough_loop(self):
+        while not self._pending.empty() and not self.cancel_token.cancelled:
+            part_number, offset, length = self._pending.get_nowait()
+            async with self._slot("upload"):
+                reserved = await self._reserve(min(length, getattr(self.src, "stream_window", PASSTHROUGH_WINDOW)))
+                try:
+                    pipe = functools.partial(self._pipe, part_number, offset, length)
+                    await self._attempt(lambda: self._loop.run_in_executor(self._executor, pipe),
+                                        "upload", part_number, length)
+                finally:
+                    self._release(reserved)
+            logger.debug(f"Streamed part {part_number} ({length} bytes)")
+            self._committed(part_number)
+            self._advance(length)
+
+    def _pipe(self, part_number, offset, length):
+        stream = self.src.open_range(offset, length)
+        if self.checksums:
+            stream = _checksums.ChecksumReader(stream, self.checksums)
+        try:
+            self.dest.upload_part_stream(part_number, stream, length)
+        finally:
+            stream.close()
+        if self.checksums:
+            self.part_checksums[part_number] = stream.digests()
+
+    async def _download_loop(self):
+        while not self._pending.empty() and not self.cancel_token.cancelled:
+            part_number, offset, length = self._pending.get_nowait()
+            async with self._slot("download"):
+                reserved = await self._reserve(length)
+                # Never blocks: there is a buffer for every part that can be in flight.
+                buffer = self.buffers.get() if self.buffers else None
+                extra = {} if buffer is None else {"buffer": buffer}
+                try:
+                    data = await self._attempt(lambda: self._call(self.src, "read_range", offset, length, **extra),
+                                               "download", part_number, length)
+                except BaseException:
+                    self._release(reserved, buffer)
+                    raise
+            logger.debug(f"Downloaded part {part_number} ({len(data)} bytes)")
+            try:
+                if self.checksums:
+                    self.part_checksums[part_number] = await self._loop.run_in_executor(
+                        self._executor, _checksums.digest, data, self.checksums)
+                await self._chunks.put((part_number, data, reserved, buffer))
+            except BaseException:
+                self._release(reserved, buffer)
+                raise
+
+    async def _upload_loop(self):
+        while True:
+            item = await self._chunks.get()
+            if item is _DONE:
+                return
+            part_number, data, reserved, buffer = item
+            try:
+                async with self._slot("upload"):
+                    extra = ({"checksum": self.part_checksums[part_number]["crc32c"]}
+                             if self._send_checksum else {})
+                    await self._attempt(lambda: self._call(self.dest, "upload_part", part_number, data, **extra),
+                                        "upload", part_number, len(data))
+            finally:
+                self._release(reserved, buffer)
+            logger.debug(f"Uploaded part {part_number} ({len(data)} bytes)")
+            self._committed(part_number)
+            self._advance(len(data))
+
+    async def _reserve(self, nbytes):
+        # Polled rather than blocking so waiting for memory never stalls the loop.
+        if not self.memory:
+            return 0
+        while True:
+            reserved = self.memory.try_acquire(nbytes)
+            if reserved is not None:
+                return reserved
+            self.cancel_token.raise_if_cancelled()
+            await asyncio.sleep(0.01)
+
+    def _release(self, reserved, buffer=None):
+        if reserved:
+            self.memory.release(reserved)
+        if buffer is not None:
+            self.buffers.put(buffer)
+
+    def _drain(self):
+        while not self._chunks.empty():
+            item = self._chunks.get_nowait()
+            if item is not _DONE:
+                self._release(item[2], item[3])
+
+    def _threads_needed(self):
+        # A thread for each request a handler can only make synchronously, and
+        # enough for the hashing; native async requests need none.
+        if self.server_side:
+            blocking = 0 if hasattr(self.dest, "copy_part_async") else self.upload_concurrency
+        elif self.passthrough:
+            blocking = self.upload_concurrency
+        else:
+            blocking = ((0 if hasattr(self.src, "read_range_async") else self.download_concurrency)
+                        + (0 if hasattr(self.dest, "upload_part_async") else self.upload_concurrency))
+        return max(blocking, os.cpu_count() or 1)
+
+    def _call(self, handler, name, *args, **kwargs):
+        method = getattr(handler, f"{name}_async", None)
+        if method is not None:
+            return method(*args, **kwargs)
+        return self._loop.run_in_executor(self._executor, functools.partial(getattr(handler, name), *args, **kwargs))
+
+    def _spawn(self, loop):
+        task = asyncio.ensure_future(self._guard(loop))
+        self._tasks.append(task)
+        return task
+
+    async def _guard(self, loop):
+        try:
+            await loop()
+        except asyncio.CancelledError:
+            pass
+        except BaseException as e:
+            if self._error is None:
+                self._error = e
+            self.cancel_token.cancel(str(e))
+
+    def _stop(self):
+        for task in self._tasks:
+            task.cancel()
+
+    def _committed(self, part_number):
+        if self.on_part:
+            self.on_part(part_number)
+
+    def _advance(self, nbytes):
+        if self.progress:
+            self.progress.update(nbytes)
+
+    def _advance_threadsafe(self, nbytes):
+        # copy_from reports progress from an executor thread.
+        if self.progress:
+            self._loop.call_soon_threadsafe(self.progress.update, nbytes)
+
+    @asynccontextmanager
+    async def _slot(self, stage):
+        # Polled like memory, so a task waiting for a slot never stalls the loop.
+        tuner = self.tuners.get(stage)
+        if tuner is None:
+            yield
+            return
+        while not tuner.try_acquire():
+            self.cancel_token.raise_if_cancelled()
+            await asyncio.sleep(0.01)
+        try:
+            yield
+        finally:
+            tuner.release()
+
+    async def _attempt(self, action, stage, part_number, nbytes=0):
+        tuner = self.tuners.get(stage)
+
+        def on_retry(error, info):
+            self.retries[stage] += 1
+            if tuner and info.throttled:
+                tuner.throttled()
+        started = time.monotonic()
+        result = await self.retry.call_async(action, f"{stage} part {part_number}",
+                                             cancel_token=self.cancel_token, on_retry=on_retry)
+        if tuner:
+            tuner.record(nbytes, time.monotonic() - started)
+        return result
+
+
+async def move_file_async(src_url, dst_url, threads=4, show_progress=True, verbose=False,
+                          download_threads=None, upload_threads=None, read_ahead=None, chunk_size="auto",
+                          native_copy=True, ingest_from_url=False, cancel_token=None, retry=None,
+                          resume=False, journal_path=None, prewarm_connections=False, max_memory=None,
+                          stream_parts=False, autotune=False, min_threads=1, verify_checksums=True,
+                          if_identical="overwrite", small_object_size=SMALL_OBJECT_SIZE):
+    """Move one object like ``move_file``, without blocking the running event loop.
+
+    Takes the same arguments; ``threads`` and its per-side variants set how
+    many requests each side keeps in flight. Handler setup, completion and
+    cleanup run on the loop's default executor.
+    """
+    if verbose:
+        logger.setLevel(logging.DEBUG)
+    loop = asyncio.get_running_loop()
+    transfer = Transfer(src_url, dst_url, download_threads=download_threads or threads,
+                        upload_threads=upload_threads or threads, chunk_size=chunk_size,
+                        native_copy=native_copy, ingest_from_url=ingest_from_url, resume=resume,
+                        journal_path=journal_path, prewarm_connections=prewarm_connections,
+                        show_progress=show_progress, read_ahead=read_ahead, max_memory=max_memory,
+                        stream_parts=stream_parts, verify_checksums=verify_checksums,
+                        if_identical=if_identical, small_object_size=small_object_size)
+    try:
+        await loop.run_in_executor(None, transfer.open)
+        if transfer.identical:
+            await loop.run_in_executor(None, transfer.skip)
+            return True
+        pipeline = AsyncTransferPipeline(transfer.src, transfer.dest, transfer.parts,
+                                         download_concurrency=transfer.download_threads,
+                                         upload_concurrency=transfer.upload_threads,
+                                         read_ahead=read_ahead, progress=transfer.progress,
+                                         server_side=transfer.server_side, cancel_token=cancel_token,
+                                         retry=retry, on_part=transfer.on_part, memory=transfer.memory,
+                                         passthrough=stream_parts, autotune=autotune,
+                                         min_concurrency=min_threads, checksums=transfer.checksums,
+                                         single_request=transfer.single_request,
+                                         before_put=transfer.verify_source)
+        await pipeline.run()
+        if any(pipeline.retries.values()):
+            logger.debug(f"Retries by phase: {pipeline.retries}")
+        await loop.run_in_executor(None, transfer.finish, pipeline.part_checksums)
+        return True
+    except BaseException as e:
+        error = TransferCancelled("Transfer cancelled") if isinstance(e, asyncio.CancelledError) else e
+        # Cleanup runs to completion in its thread even if this task is
+        # cancelled again while waiting for it.
+        await asyncio.shield(loop.run_in_executor(None, transfer.fail, error))
+        raise
+    finally:
+        transfer.close()
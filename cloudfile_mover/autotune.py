@@ -0,0 +1,133 @@
+"""Closed-loop control of how many workers of a transfer stage run at once."""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger("cloudfile_mover")
+
+# Seconds of traffic measured before each adjustment.
+TUNE_INTERVAL = 2.0
+# A step up is kept only if throughput grew by at least this fraction...
+MIN_GAIN = 0.05
+# ...and per-request latency did not grow by more than this factor over the best seen.
+MAX_LATENCY_GROWTH = 2.0
+# Throttling reported within this many seconds of a cut is the same burst.
+THROTTLE_COOLDOWN = 1.0
+
+
+class ConcurrencyTuner:
+    """AIMD limit on the number of concurrent requests of one stage.
+
+    Workers hold a slot (``acquire()``/``release()``) while working on a part
+    and ``record()`` each request that succeeds. Every ``interval`` seconds
+    the tuner compares the stage's throughput with the previous interval. It
+    adds one worker while that keeps paying off, and takes one back when a
+    step up brought no gain or inflated latency. A throttling error from the provider (S3
+    SlowDown, GCS 429, Azure ServerBusy) halves the limit at once, and the
+    retries of the same burst, within ``THROTTLE_COOLDOWN`` seconds, do not
+    halve it again. The limit stays within ``[min_workers, max_workers]``.
+    """
+
+    def __init__(self, name, max_workers, min_workers=1, initial=None, interval=TUNE_INTERVAL,
+                 clock=time.monotonic):
+        self.name = name
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        initial = initial if initial is not None else min(4, self.max_workers)
+        self.limit = min(self.max_workers, max(self.min_workers, initial))
+        self.interval = interval
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._active = 0
+        self._window_start = clock()
+        self._bytes = 0
+        self._latency_total = 0.0
+        self._requests = 0
+        self._throttled = False
+        self._last_cut = None
+        self._last_rate = None
+        self._best_latency = None
+        self._stepped_up = False
+
+    def try_acquire(self):
+        with self._cond:
+            if self._active >= self.limit:
+                return False
+            self._active += 1
+            return True
+
+    def acquire(self, cancel_token=None):
+        with self._cond:
+            while self._active >= self.limit:
+                if cancel_token:
+                    cancel_token.raise_if_cancelled()
+                self._cond.wait(0.1)
+            self._active += 1
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def record(self, nbytes, latency):
+        """Account one finished request of ``nbytes`` that took ``latency`` seconds."""
+        with self._cond:
+            self._bytes += nbytes
+            self._latency_total += latency
+            self._requests += 1
+            now = self._clock()
+            if now - self._window_start >= self.interval:
+                self._adjust(now)
+                self._cond.notify_all()
+
+    def throttled(self):
+        """Halve the limit on a throttling error, once per burst."""
+        with self._cond:
+            now = self._clock()
+            if self._last_cut is not None and now - self._last_cut < THROTTLE_COOLDOWN:
+                # The same burst: the window that saw it must not step up.
+                self._throttled = True
+                return
+            self._last_cut = now
+            old = self.limit
+            self.limit = max(self.min_workers, self.limit // 2)
+            if self.limit != old:
+                logger.debug(f"{self.name} concurrency {old} -> {self.limit} (throttled)")
+            # Measure the reduced limit from scratch.
+            self._last_rate = None
+            self._stepped_up = False
+            self._reset_window(now)
+
+    def _adjust(self, now):
+        # Called with the condition held at the end of a measurement window.
+        rate = self._bytes / max(now - self._window_start, 1e-9)
+        latency = self._latency_total / self._requests if self._requests else None
+        old = self.limit
+        if self._throttled:
+            # Already cut by throttled(); hold until a clean window.
+            self._stepped_up = False
+        elif self._last_rate is not None and self._stepped_up and (
+                rate < self._last_rate * (1 + MIN_GAIN)
+                or (latency and self._best_latency and latency > self._best_latency * MAX_LATENCY_GROWTH)):
+            # The last extra worker bought nothing: give it back and hold there.
+            self.limit = max(self.min_workers, self.limit - 1)
+            self._stepped_up = False
+        elif self.limit < self.max_workers:
+            self.limit += 1
+            self._stepped_up = True
+        else:
+            self._stepped_up = False
+        if latency is not None:
+            self._best_latency = latency if self._best_latency is None else min(self._best_latency, latency)
+        if self.limit != old:
+            logger.debug(f"{self.name} concurrency {old} -> {self.limit} ({rate / 1e6:.1f} MB/s)")
+        self._last_rate = rate
+        self._reset_window(now)
+
+    def _reset_window(self, now):
+        self._window_start = now
+        self._bytes = 0
+        self._latency_total = 0.0
+        self._requests = 0
+        self._throttled = False
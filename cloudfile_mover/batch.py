@@ -0,0 +1,168 @@
+"""Batches of moves run concurrently, with request slots shared across the batch."""
+
+import json
+import logging
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+from .cancel import CancellationToken
+from . import core
+
+logger = logging.getLogger("cloudfile_mover")
+
+# Defaults for move_batch: objects open at once, requests per object per
+# side, and requests per side across the whole batch.
+BATCH_FILES = 8
+BATCH_THREADS = 16
+BATCH_TOTAL_THREADS = 64
+
+
+class SharedSlots:
+    """Request slots shared by every transfer of a batch, ``limit`` per side.
+
+    Pipeline workers hold one for each read or write on top of their own
+    transfer's limits, so however many objects are open, at most ``limit``
+    reads and ``limit`` writes are in flight across the batch. A large
+    object whose neighbours have finished can then use every slot its own
+    thread count allows, while many small ones share the same total.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._sides = {"download": threading.Semaphore(limit), "upload": threading.Semaphore(limit)}
+
+    @contextmanager
+    def hold(self, stage, cancel_token=None):
+        # Copies and streamed parts are paced by the destination side.
+        side = self._sides["download" if stage == "download" else "upload"]
+        while not side.acquire(timeout=0.1):
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+        try:
+            yield
+        finally:
+            side.release()
+
+
+class SharedProgress:
+    """One byte-count progress bar for a batch, whose total grows as objects are opened."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bar = tqdm(total=0, unit="B", unit_scale=True, desc="Moving")
+
+    def add(self, nbytes):
+        with self._lock:
+            self.bar.total += nbytes
+            self.bar.refresh()
+
+    def update(self, nbytes):
+        with self._lock:
+            self.bar.update(nbytes)
+
+    def close(self):
+        self.bar.close()
+
+
+def read_manifest(path):
+    """Yield ``(src, dst)`` from a JSON Lines manifest as it is read.
+
+    Each line is an object such as ``{"src": "s3://a/k", "dst": "gs://b/k"}``;
+    blank lines are skipped and ``"-"`` reads standard input.
+    """
+    f = sys.stdin if path == "-" else open(path)
+    try:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                yield entry["src"], entry["dst"]
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"{path}, line {line_number}: expected {{\"src\": ..., \"dst\": ...}}: {e}") from e
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def _move_one(src, dst, batch_token, **options):
+    # A failure cancels its own object's token, not the batch's; stopping the
+    # batch still reaches every object.
+    token = CancellationToken()
+    handle = batch_token.register(lambda: token.cancel(batch_token.reason))
+    try:
+        return core.move_file(src, dst, cancel_token=token, **options)
+    finally:
+        batch_token.unregister(handle)
+
+
+def move_batch(pairs, files=BATCH_FILES, threads=BATCH_THREADS, total_threads=BATCH_TOTAL_THREADS,
+               show_progress=True, verbose=False, cancel_token=None, **options):
+    """Move every ``(src, dst)`` pair of ``pairs``, which is consumed as the batch runs.
+
+    Up to ``files`` objects are open at once, so the setup requests of one
+    overlap the data of others. Each moves with ``move_file(threads=threads,
+    **options)``, and all of them draw their reads and writes from
+    ``total_threads`` slots per side (``None`` for no shared limit). One
+    failed object does not stop the others. Returns ``{"moved": count,
+    "failed": {src: error}}``.
+
+    Each open object runs its own worker pools, so the batch starts up to
+    ``files * 2 * threads`` workers, plus GCS compose and cleanup threads
+    (no more than ``threads`` each per object), of which at most
+    ``total_threads`` per side are making requests at any moment.
+    ``threads`` and any ``download_threads`` or ``upload_threads`` are
+    capped at ``total_threads``, since workers beyond it could only wait.
+    """
+    if verbose:
+        logger.setLevel(logging.DEBUG)
+    if total_threads:
+        threads = min(threads, total_threads)
+        for side in ("download_threads", "upload_threads"):
+            if options.get(side):
+                options[side] = min(options[side], total_threads)
+    slots = SharedSlots(total_threads) if total_threads else None
+    progress = SharedProgress() if show_progress and tqdm else None
+    token = cancel_token or CancellationToken()
+    moved, failed, in_flight = 0, {}, {}
+
+    def settle(futures):
+        nonlocal moved
+        for future in futures:
+            src = in_flight.pop(future)
+            if future.exception() is None:
+                moved += 1
+            else:
+                failed[src] = future.exception()
+
+    pool = ThreadPoolExecutor(max_workers=files, thread_name_prefix="cloudfile-file")
+    try:
+        for src, dst in pairs:
+            # Pairs are only taken as objects finish, so a manifest or
+            # listing of millions is never held in memory.
+            if len(in_flight) >= 2 * files:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                settle(done)
+            future = pool.submit(_move_one, src, dst, token, threads=threads, show_progress=False,
+                                 slots=slots, progress=progress, **options)
+            in_flight[future] = src
+        settle(wait(in_flight).done)
+    except BaseException:
+        # Stops the objects still moving, which abort their uploads.
+        token.cancel("Batch stopped")
+        raise
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        if progress: progress.close()
+    if failed:
+        logger.error(f"{len(failed)} of {moved + len(failed)} objects failed to move.")
+    else:
+        logger.info(f"Moved {moved} objects.")
+    return {"moved": moved, "failed": failed}
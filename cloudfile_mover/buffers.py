@@ -0,0 +1,292 @@
+"""Reusable part buffers and file-like views over them."""
+
+import io
+import queue
+import threading
+
+
+class BufferPool:
+    """Chunk-sized ``bytearray`` buffers recycled between parts.
+
+    A source that can fill a caller's buffer (``read_range(..., buffer=)``)
+    reads each part into one of these and the upload is handed a
+    ``memoryview`` of it, so no part is allocated or copied as ``bytes``.
+    Buffers are created on demand up to ``max_buffers``; ``get()`` blocks
+    while all of them are in use.
+    """
+
+    def __init__(self, buffer_size, max_buffers):
+        self.buffer_size = buffer_size
+        self.max_buffers = max_buffers
+        self._free = queue.LifoQueue()  # the most recently used buffer is the one still in cache
+        self._lock = threading.Lock()
+        self._allocated = 0
+
+    def get(self, timeout=None):
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._allocated < self.max_buffers:
+                self._allocated += 1
+                return bytearray(self.buffer_size)
+        return self._free.get(timeout=timeout)
+
+    def put(self, buffer):
+        self._free.put(buffer)
+
+
+class BufferWriter:
+    """Write-only file object that fills ``view`` in place, for SDKs that download into a file."""
+
+    def __init__(self, view, token=None, throttle=None):
+        self.view, self.token, self.throttle = view, token, throttle
+        self.written = 0
+
+    def write(self, data):
+        if self.token:
+            self.token.raise_if_cancelled()
+        n = len(data)
+        if self.throttle:
+            self.throttle.consume(n)
+        if self.written + n > len(self.view):
+            raise ValueError(f"Received more than the {len(self.view)} bytes requested")
+        self.view[self.written:self.written + n] = data
+        self.written += n
+        return n
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.written
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # Only used by SDKs restarting a download from the beginning.
+        self.written = offset if whence == io.SEEK_SET else self.written + offset
+        return self.written
+
+    def filled(self):
+        return self.view[:self.written]
+
+
+class BufferReader(io.RawIOBase):
+    """Seekable read-only file object over a memoryview, for SDK upload bodies.
+
+    ``io.BytesIO`` would copy a ``memoryview``; this reads straight from it.
+    """
+
+    def __init__(self, view):
+        self.view = memoryview(view).cast("B")
+        self.pos = 0
+
+    def __len__(self):
+        return len(self.view)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.pos, io.SEEK_END: len(self.view)}[whence]
+        self.pos = max(0, base + offset)
+        return self.pos
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self.view) - self.pos))
+        b[:n] = self.view[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+    def read(self, size=-1):
+        end = len(self.view) if size is None or size < 0 else min(len(self.view), self.pos + size)
+        data = self.view[self.pos:end].tobytes()
+        self.pos = max(self.pos, end)
+        return data
+
+
+# Bytes a passthrough worker reads from the source per step.
+PASSTHROUGH_WINDOW = 1024 * 1024
+
+
+class RangeStream(io.RawIOBase):
+    """Forward-only reader over exactly ``length`` bytes of a source response.
+
+    Lets a destination upload pull a part straight from the source's ranged
+    response, at most ``window`` bytes at a time, so the whole part is never
+    resident. Closing it (or cancelling ``token``) closes ``raw``.
+    """
+
+    def __init__(self, raw, length, token=None, window=PASSTHROUGH_WINDOW, throttle=None):
+        self.raw, self.length, self.token, self.window = raw, length, token, window
+        self.throttle = throttle
+        self.pos = 0
+        self._handle = token.register(raw.close) if token else None
+
+    def __len__(self):
+        return self.length
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        if self.token:
+            self.token.raise_if_cancelled()
+        remaining = self.length - self.pos
+        if size is None or size < 0:
+            size = remaining
+        size = min(size, remaining, self.window)
+        if size <= 0:
+            return b""
+        data = self.raw.read(size)
+        if not data:
+            raise ConnectionError(f"Source stream ended after {self.pos} of {self.length} bytes")
+        self.pos += len(data)
+        if self.throttle:
+            self.throttle.consume(len(data))
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if self._handle is not None:
+            self.token.unregister(self._handle)
+            self._handle = None
+        try:
+            self.raw.close()
+        finally:
+            super().close()
+
+
+class ChunkReader(io.RawIOBase):
+    """File-like ``read()`` over an iterator of byte chunks (e.g. Azure's ``chunks()``)."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._pending = b""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while not self._pending:
+            try:
+                self._pending = next(self._chunks)
+            except StopIteration:
+                return b""
+        if size is None or size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+class ThrottledReader(io.RawIOBase):
+    """Upload body that charges the bytes read from ``raw`` to ``throttle``.
+
+    Only bytes beyond the furthest point read so far are charged, so an SDK
+    reading the body once to checksum it and again to send it (or rewinding
+    to retry) is not charged twice.
+    """
+
+    def __init__(self, raw, throttle):
+        self.raw, self.throttle = raw, throttle
+        self.charged = raw.tell() if raw.seekable() else 0
+
+    def __len__(self):
+        try:
+            return len(self.raw)
+        except TypeError:
+            # io.BytesIO has no len(); HTTP stacks size the body with it.
+            pos = self.raw.tell()
+            end = self.raw.seek(0, io.SEEK_END)
+            self.raw.seek(pos)
+            return end
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self.raw.seekable()
+
+    def tell(self):
+        return self.raw.tell()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.raw.seek(offset, whence)
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self._charge(len(data))
+        return data
+
+    def readinto(self, b):
+        n = self.raw.readinto(b)
+        self._charge(n or 0)
+        return n
+
+    def _charge(self, n):
+        end = self.raw.tell() if self.raw.seekable() else self.charged + n
+        if end > self.charged:
+            self.throttle.consume(end - self.charged)
+            self.charged = end
+
+
+def throttled(stream, throttle):
+    """``stream`` with its reads charged to ``throttle``, or unchanged without one."""
+    return ThrottledReader(stream, throttle) if throttle else stream
+
+
+async def async_body(data, throttle=None, block_size=256 * 1024):
+    """Part ``data``, or a file over it, as an async request body for aiohttp.
+
+    aiohttp pulls each block as the previous one has been written to the
+    socket, and the block is charged to ``throttle`` just before, so writes
+    are paced on the wire rather than when the body is first read.
+    """
+    if hasattr(data, "read"):
+        data.seek(0)
+        blocks = iter(lambda: data.read(block_size), b"")
+    else:
+        view = memoryview(data)
+        blocks = (view[start:start + block_size] for start in range(0, len(view), block_size))
+    for block in blocks:
+        if throttle:
+            await throttle.consume_async(len(block))
+        yield block
+
+
+def accepts(function, parameter):
+    """Whether ``function`` takes a keyword argument named ``parameter``."""
+    import inspect
+    try:
+        return parameter in inspect.signature(function).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def accepts_buffer(read_range):
+    """Whether a source's ``read_range`` can fill a caller's buffer."""
+    return accepts(read_range, "buffer")
+
+
+def as_file(data, throttle=None):
+    """A seekable file object over part ``data``, without copying it."""
+    # BytesIO shares a bytes object's memory until written to.
+    return throttled(io.BytesIO(data) if isinstance(data, bytes) else BufferReader(data), throttle)
@@ -0,0 +1,162 @@
+"""Cooperative cancellation shared by every worker of a transfer."""
+
+import threading
+
+
+class TransferCancelled(Exception):
+    """Raised inside workers once their transfer has been cancelled."""
+
+
+class CancellationToken:
+    """A flag that workers poll, plus hooks that interrupt blocking I/O.
+
+    ``cancel()`` sets the flag and runs every registered callback, which is
+    how in-flight reads are interrupted: a reader registers the close method
+    of its response stream, so a worker blocked on the socket wakes up with
+    an error instead of finishing a 64 MiB range nobody needs.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self._next_handle = 0
+        self.reason = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason=None):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise TransferCancelled(f"Transfer cancelled: {self.reason}" if self.reason else "Transfer cancelled")
+
+    def wait(self, timeout):
+        """Sleep for ``timeout`` seconds, returning early (True) if cancelled."""
+        return self._event.wait(timeout)
+
+    def register(self, callback):
+        """Run ``callback`` on cancellation; returns a handle for ``unregister``."""
+        with self._lock:
+            if not self._event.is_set():
+                handle = self._next_handle
+                self._next_handle += 1
+                self._callbacks[handle] = callback
+                return handle
+        callback()
+        return None
+
+    def unregister(self, handle):
+        with self._lock:
+            self._callbacks.pop(handle, None)
+
+
+def read_stream(stream, length, token=None, block_size=1024 * 1024, throttle=None):
+    """Read up to ``length`` bytes from ``stream`` in blocks, honouring ``token``.
+
+    The stream's ``close`` is registered with the token so a cancel issued by
+    another thread breaks a read that is blocked on the network. Each block
+    is charged to ``throttle``, if given.
+    """
+    if token is None and not throttle:
+        return stream.read()
+    handle = token.register(stream.close) if token else None
+    try:
+        pieces, remaining = [], length
+        while remaining > 0:
+            if token:
+                token.raise_if_cancelled()
+            piece = stream.read(min(block_size, remaining))
+            if not piece:
+                break
+            pieces.append(piece)
+            remaining -= len(piece)
+            if throttle:
+                throttle.consume(len(piece))
+        if token:
+            token.raise_if_cancelled()
+        return b"".join(pieces)
+    except Exception:
+        if token:
+            token.raise_if_cancelled()
+        raise
+    finally:
+        if handle is not None:
+            token.unregister(handle)
+
+
+def read_stream_into(stream, view, token=None, block_size=1024 * 1024, throttle=None):
+    """Fill ``view`` from ``stream`` with ``readinto``, honouring ``token``; returns the bytes read."""
+    handle = token.register(stream.close) if token else None
+    try:
+        filled = 0
+        while filled < len(view):
+            if token:
+                token.raise_if_cancelled()
+            n = stream.readinto(view[filled:filled + block_size])
+            if not n:
+                break
+            filled += n
+            if throttle:
+                throttle.consume(n)
+        if token:
+            token.raise_if_cancelled()
+        return filled
+    except Exception:
+        if token:
+            token.raise_if_cancelled()
+        raise
+    finally:
+        if handle is not None:
+            token.unregister(handle)
+
+
+async def read_chunks_async(chunks, length, buffer=None, token=None, throttle=None):
+    """Collect an async iterator of body ``chunks`` like ``read_stream``, on the event loop.
+
+    With ``buffer`` the chunks fill its first ``length`` bytes, as with
+    ``read_stream_into``, and a view of what was filled is returned.
+    """
+    view = memoryview(buffer)[:length] if buffer is not None else None
+    pieces, filled = [], 0
+    async for piece in chunks:
+        if token:
+            token.raise_if_cancelled()
+        if throttle:
+            await throttle.consume_async(len(piece))
+        if view is None:
+            pieces.append(piece)
+        else:
+            view[filled:filled + len(piece)] = piece
+        filled += len(piece)
+    if token:
+        token.raise_if_cancelled()
+    return b"".join(pieces) if view is None else view[:filled]
+
+
+class CancellableWriter:
+    """File-like sink that aborts a streaming download once ``token`` is cancelled."""
+
+    def __init__(self, target, token, throttle=None):
+        self.target, self.token, self.throttle = target, token, throttle
+
+    def write(self, data):
+        if self.token:
+            self.token.raise_if_cancelled()
+        if self.throttle:
+            self.throttle.consume(len(data))
+        return self.target.write(data)
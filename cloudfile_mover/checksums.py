@@ -0,0 +1,175 @@
+"""CRC32C part checksums and their combination into a whole-object CRC32C."""
+
+import base64
+import hashlib
+import io
+from functools import lru_cache
+
+try:
+    import google_crc32c
+except ImportError:
+    google_crc32c = None
+
+# Reflected Castagnoli polynomial.
+_POLY = 0x82F63B78
+# google_crc32c only takes bytes, so part buffers are hashed through copies this large.
+_BLOCK = 1024 * 1024
+
+
+class ChecksumError(RuntimeError):
+    """The data moved does not match a checksum stored by the source or destination."""
+
+
+def available():
+    return google_crc32c is not None
+
+
+def crc32c(data, crc=0):
+    """CRC32C of ``data`` (bytes or a buffer), continuing from ``crc``.
+
+    The C implementation releases the GIL, so workers hash parts in parallel.
+    """
+    if isinstance(data, bytes):
+        return google_crc32c.extend(crc, data)
+    view = memoryview(data).cast("B")
+    for start in range(0, len(view), _BLOCK):
+        crc = google_crc32c.extend(crc, view[start:start + _BLOCK].tobytes())
+    return crc
+
+
+def digest(data, algorithms=("crc32c",)):
+    """Checksums of ``data`` keyed by algorithm (``"crc32c"`` and/or ``"md5"``)."""
+    found = {}
+    if "crc32c" in algorithms:
+        found["crc32c"] = crc32c(data)
+    if "md5" in algorithms:
+        # hashlib releases the GIL for large inputs too.
+        found["md5"] = hashlib.md5(data).digest()
+    return found
+
+
+def _apply(matrix, vector):
+    result, row = 0, 0
+    while vector:
+        if vector & 1:
+            result ^= matrix[row]
+        vector >>= 1
+        row += 1
+    return result
+
+
+@lru_cache(maxsize=16)
+def _zeros_operator(nbytes):
+    # The GF(2) matrix that advances a CRC over ``nbytes`` zero bytes, built by
+    # squaring, as in zlib's crc32_combine. Parts mostly share one length, so
+    # it is built once per transfer.
+    op = (_POLY,) + tuple(1 << n for n in range(31))  # one zero bit
+    for _ in range(3):
+        op = tuple(_apply(op, column) for column in op)
+    result = None
+    while nbytes:
+        if nbytes & 1:
+            result = op if result is None else tuple(_apply(op, column) for column in result)
+        nbytes >>= 1
+        if nbytes:
+            op = tuple(_apply(op, column) for column in op)
+    return result
+
+
+def crc32c_combine(crc1, crc2, len2):
+    """CRC32C of ``A + B`` from ``crc1 = crc32c(A)``, ``crc2 = crc32c(B)`` and ``len2 = len(B)``."""
+    if len2 <= 0:
+        return crc1
+    return _apply(_zeros_operator(len2), crc1) ^ crc2
+
+
+def combine_parts(parts):
+    """Whole-object CRC32C from ``(crc, length)`` pairs in part order."""
+    crc = 0
+    for part_crc, length in parts:
+        crc = crc32c_combine(crc, part_crc, length)
+    return crc
+
+
+def encode_crc32c(crc):
+    """The base64 big-endian form used by S3 and GCS headers and metadata."""
+    return base64.b64encode(crc.to_bytes(4, "big")).decode()
+
+
+def decode_crc32c(value):
+    raw = base64.b64decode(value)
+    if len(raw) != 4:
+        raise ValueError(f"Not a CRC32C: {value!r}")
+    return int.from_bytes(raw, "big")
+
+
+def multipart_etag(part_md5s):
+    """The ETag S3 gives a multipart upload of parts with these MD5s."""
+    return f"{hashlib.md5(b''.join(part_md5s)).hexdigest()}-{len(part_md5s)}"
+
+
+def same_content(size, stored, other_size, other_stored):
+    """Whether two objects hold the same bytes, judged from sizes and stored checksums.
+
+    ``stored`` maps ``"crc32c"``, ``"md5"`` or ``"etag"`` (an S3 multipart
+    ETag) to values as returned by the handlers' ``stored_checksums``.
+    Returns ``None`` when the checksums cannot tell, e.g. multipart ETags
+    of different part layouts.
+    """
+    if size != other_size:
+        return False
+    for algorithm in ("crc32c", "md5"):
+        if algorithm in stored and algorithm in other_stored:
+            return stored[algorithm] == other_stored[algorithm]
+    if stored.get("etag") is not None and stored.get("etag") == other_stored.get("etag"):
+        return True
+    for etag_side, md5_side in ((stored, other_stored), (other_stored, stored)):
+        # A one-part multipart ETag can be rebuilt from the whole object's MD5.
+        if etag_side.get("etag", "").endswith("-1") and "md5" in md5_side:
+            return multipart_etag([md5_side["md5"]]) == etag_side["etag"]
+    return None
+
+
+class ChecksumReader(io.RawIOBase):
+    """Forward-only reader that checksums what passes through it, for streamed parts."""
+
+    def __init__(self, raw, algorithms=("crc32c",)):
+        self.raw = raw
+        self.crc = 0 if "crc32c" in algorithms else None
+        self.md5 = hashlib.md5() if "md5" in algorithms else None
+
+    def __len__(self):
+        return len(self.raw)
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self.raw.tell()
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        if self.crc is not None:
+            self.crc = google_crc32c.extend(self.crc, bytes(data))
+        if self.md5 is not None:
+            self.md5.update(data)
+        return data
+
+    def digests(self):
+        found = {}
+        if self.crc is not None:
+            found["crc32c"] = self.crc
+        if self.md5 is not None:
+            found["md5"] = self.md5.digest()
+        return found
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        try:
+            self.raw.close()
+        finally:
+            super().close()
@@ -0,0 +1,137 @@
+"""Process-wide registry of SDK clients and credentials shared by all transfers."""
+
+import importlib.util
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("cloudfile_mover")
+
+# botocore's default connection pool size, used until a transfer asks for more.
+DEFAULT_POOL_SIZE = 10
+# Cached tokens are renewed this long before they expire.
+TOKEN_REFRESH_MARGIN = 300
+TOKEN_RETRY_INTERVAL = 30
+
+
+class ClientRegistry:
+    """Caches one client per ``(provider, account, region)`` key for the whole process.
+
+    Building a client walks the credential chain and opens a fresh connection
+    pool, which dominates moves of small objects. Handlers fetch their clients
+    here instead, so every handler and every ``move_file`` call in the process
+    shares them. ``reserve(provider, n)`` records that a transfer will run
+    ``n`` concurrent requests; a client built with a smaller pool is replaced
+    on its next lookup, while handlers holding the old one keep using it.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clients = {}     # key -> (pool size, client)
+        self._pool_sizes = {}  # provider -> largest reserved pool
+
+    def reserve(self, provider, connections):
+        with self._lock:
+            self._pool_sizes[provider] = max(self._pool_sizes.get(provider, 0), connections)
+
+    def pool_size(self, provider):
+        with self._lock:
+            return max(DEFAULT_POOL_SIZE, self._pool_sizes.get(provider, 0))
+
+    def get(self, key, factory):
+        """Return the client for ``key``, building it with ``factory(pool_size)`` if needed."""
+        with self._lock:
+            pool_size = self.pool_size(key[0])
+            cached = self._clients.get(key)
+            if cached is None or cached[0] < pool_size:
+                logger.debug(f"Creating client for {key} with a pool of {pool_size} connections")
+                cached = (pool_size, factory(pool_size))
+                self._clients[key] = cached
+            return cached[1]
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+            self._pool_sizes.clear()
+
+
+registry = ClientRegistry()
+
+
+def async_available():
+    """Whether aiohttp, the transport of the built-in handlers' ``*_async`` methods, is installed."""
+    return importlib.util.find_spec("aiohttp") is not None
+
+
+class AsyncSession:
+    """Gives a handler one aiohttp session for its ``*_async`` methods.
+
+    A session is bound to the event loop it was opened on, so it is opened by
+    the first async call and closed by the asyncio engine with ``aclose()``.
+    """
+
+    _aio_session = None
+
+    def _async_session(self):
+        if self._aio_session is None:
+            import aiohttp
+            # The asyncio engine bounds the requests in flight, not the connector.
+            self._aio_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+        return self._aio_session
+
+    async def aclose(self):
+        if self._aio_session is not None:
+            session, self._aio_session = self._aio_session, None
+            await session.close()
+
+
+def keep_token_fresh(credential, scope):
+    """Renew ``credential``'s token for ``scope`` in a background thread.
+
+    The SDK's own token cache then always holds a valid token, so no request
+    has to stop and walk the credential chain when the old one expires.
+    """
+    def refresh():
+        while True:
+            try:
+                token = credential.get_token(scope)
+                delay = max(TOKEN_RETRY_INTERVAL, token.expires_on - time.time() - TOKEN_REFRESH_MARGIN)
+            except Exception as e:
+                logger.debug(f"Background token refresh failed: {e}")
+                delay = TOKEN_RETRY_INTERVAL
+            time.sleep(delay)
+    threading.Thread(target=refresh, name="token-refresh", daemon=True).start()
+    return credential
+
+
+def mount_pool(session, pool_size):
+    """Give a requests ``session`` room for ``pool_size`` connections per host.
+
+    requests keeps 10 connections per host by default; with more workers than
+    that, the extra connections are opened and thrown away on every request.
+    """
+    from requests.adapters import HTTPAdapter
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def prewarm(probe, connections):
+    """Open ``connections`` pooled connections up front by running ``probe`` concurrently.
+
+    The first wave of parts then starts on established TLS connections
+    instead of every worker handshaking at once. ``probe`` should be a cheap
+    request; its errors are ignored since only the connection matters.
+    """
+    def attempt():
+        try:
+            probe()
+        except Exception as e:
+            logger.debug(f"Pre-warm request failed: {e}")
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="prewarm") as executor:
+        for _ in range(connections):
+            executor.submit(attempt)
+    logger.debug(f"Pre-warmed {connections} connections in {time.monotonic() - started:.2f}s")
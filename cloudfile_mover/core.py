@@ -1,26 +1,59 @@
-import os
 import re
-import math
+import sys
 import logging
-import base64
-import uuid
-import io
-import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-import boto3
-from google.cloud import storage
-from azure.storage.blob import BlobServiceClient
-from azure.identity import DefaultAzureCredential
 
 try:
     from tqdm import tqdm
 except ImportError:
     tqdm = None
 
+from . import providers
+from .clients import prewarm, registry
+from .buffers import accepts
+from .cancel import CancellationToken, TransferCancelled
+from .checksums import ChecksumError, combine_parts
+from . import checksums as _checksums
+from .listing import LIST_THREADS, PrefixURL, list_objects
+from .memory import MemoryBudget, shared_budget
+from .pipeline import TransferPipeline
+from .planner import PartPlan, parse_size, plan_parts
+
 logger = logging.getLogger("cloudfile_mover")
 logger.setLevel(logging.INFO)
 
+# Handlers and helpers that used to live in this module, now imported from
+# their provider module on first use so that importing the package (and
+# starting the CLI) never loads an SDK the transfer does not need.
+_PROVIDER_ATTRS = {
+    "S3Source": "s3", "S3Dest": "s3", "S3Lister": "s3", "s3_client": "s3",
+    "GCSSource": "gcs", "GCSDest": "gcs", "GCSLister": "gcs", "GCSComposeTree": "gcs",
+    "COMPOSE_FAN_IN": "gcs", "gcs_client": "gcs",
+    "AzureSource": "azure", "AzureDest": "azure", "AzureLister": "azure", "azure_service": "azure",
+    "AZURE_SYNC_COPY_LIMIT": "azure", "AZURE_COPY_POLL_INTERVAL": "azure",
+}
+
+# Built-in handlers are resolved through this module so they can be replaced
+# here, as the tests do.
+_BUILTIN_HANDLERS = {
+    "s3": ("S3Source", "S3Dest", "S3Lister"),
+    "gcs": ("GCSSource", "GCSDest", "GCSLister"),
+    "azure": ("AzureSource", "AzureDest", "AzureLister"),
+}
+
+# Objects up to this size that fit in one part move with a single GET and a
+# single PUT (S3 PutObject, a GCS simple upload, Azure Put Blob), skipping the
+# requests that open, complete and clean up a multipart upload.
+SMALL_OBJECT_SIZE = 8 * 1024 * 1024
+
+# What to do when the destination already holds an identical object: move it
+# again anyway, leave both copies alone, or only delete the source.
+IF_IDENTICAL = ("overwrite", "skip", "delete-source")
+
+def __getattr__(name):
+    if name in _PROVIDER_ATTRS:
+        return getattr(providers.load(_PROVIDER_ATTRS[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 def parse_cloud_url(url: str):
     if url.startswith("s3://"):
         m = re.match(r'^s3://([^/]+)/(.+)$', url)
@@ -41,215 +74,380 @@ def parse_cloud_url(url: str):
         account = parsed.netloc.split(".")[0]
         container, blob = parsed.path.lstrip('/').split('/', 1)
         return ("azure", (account, container), blob)
+    # Providers installed through the entry point group use <name>://<location>/<key>.
+    m = re.match(r'^(\w+)://([^/]+)/(.+)$', url)
+    if m and m.group(1) not in providers.BUILTIN and providers.is_registered(m.group(1)):
+        return m.groups()
     raise ValueError(f"Unsupported URL format: {url}")
 
+def open_handler(provider, role, location, key):
+    """Open the ``"source"`` or ``"dest"`` handler of ``provider`` for one object."""
+    index = 0 if role == "source" else 1
+    if provider in _BUILTIN_HANDLERS:
+        handler = getattr(sys.modules[__name__], _BUILTIN_HANDLERS[provider][index])
+    else:
+        handler = getattr(providers.load(provider), ("Source", "Dest")[index])
+    if provider == "azure":
+        return handler(*location, key)
+    return handler(location, key)
+
+def open_lister(provider, location):
+    """Open the handler that lists ``provider``'s objects at ``location`` (a bucket or container)."""
+    if provider in _BUILTIN_HANDLERS:
+        lister = getattr(sys.modules[__name__], _BUILTIN_HANDLERS[provider][2])
+    else:
+        lister = getattr(providers.load(provider), "Lister", None)
+        if lister is None:
+            raise ValueError(f"The {provider} provider cannot list objects, so its URLs must name one object")
+    if provider == "azure":
+        return lister(*location)
+    return lister(location)
+
 # ====================
-# Source Handlers
+# Core Transfer Logic
 # ====================
 
-class S3Source:
-    def __init__(self, bucket: str, key: str):
-        self.bucket, self.key = bucket, key
-        self.client = boto3.client('s3')
-        self.size = self.client.head_object(Bucket=bucket, Key=key)['ContentLength']
-
-    def get_size(self):
-        return self.size
-
-    def read_range(self, offset, length):
-        end = offset + length - 1
-        resp = self.client.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={offset}-{end}")
-        return resp['Body'].read()
-
-    def delete(self):
-        self.client.delete_object(Bucket=self.bucket, Key=self.key)
-
-class GCSSource:
-    def __init__(self, bucket: str, blob_name: str):
-        self.client = storage.Client()
-        self.bucket = self.client.bucket(bucket)
-        self.blob = self.bucket.blob(blob_name)
-        self.blob.reload()
-        if self.blob.size is None:
-            raise FileNotFoundError(f"GCS object gs://{bucket}/{blob_name} not found")
-        self.size = self.blob.size
-
-    def get_size(self):
-        return self.size
-
-    def read_range(self, offset, length):
-        buffer = io.BytesIO()
-        self.blob.download_to_file(buffer, start=offset, end=offset+length-1)
-        buffer.seek(0)
-        return buffer.read()
-
-    def delete(self):
-        self.blob.delete()
-
-class AzureSource:
-    def __init__(self, account, container, blob_name):
-        if account is None:
-            account = os.environ.get("AZURE_STORAGE_ACCOUNT")
-            if not account:
-                raise ValueError("Azure storage account not provided")
-        service = BlobServiceClient(account_url=f"https://{account}.blob.core.windows.net", credential=DefaultAzureCredential())
-        self.blob_client = service.get_blob_client(container, blob_name)
-        self.size = self.blob_client.get_blob_properties().size
-
-    def get_size(self):
-        return self.size
-
-    def read_range(self, offset, length):
-        return self.blob_client.download_blob(offset=offset, length=length).readall()
-
-    def delete(self):
-        self.blob_client.delete_blob()
+class Transfer:
+    """Everything about moving one object except the engine that moves its parts.
+
+    ``open()`` resolves the handlers, plans the parts, checks for an identical
+    destination, reattaches to a journalled upload and starts the progress
+    bar (or adds to the shared ``progress``). ``finish()`` verifies, completes
+    and deletes the source; ``skip()`` settles an identical destination;
+    ``fail()`` cleans up.
+    """
+
+    def __init__(self, src_url, dst_url, download_threads=4, upload_threads=4, chunk_size="auto",
+                 native_copy=True, ingest_from_url=False, resume=False, journal_path=None,
+                 prewarm_connections=False, show_progress=True, read_ahead=None, max_memory=None,
+                 stream_parts=False, verify_checksums=True, if_identical="overwrite", progress=None,
+                 small_object_size=SMALL_OBJECT_SIZE):
+        self.src_url, self.dst_url = src_url, dst_url
+        self.download_threads, self.upload_threads = download_threads, upload_threads
+        self.chunk_size = chunk_size
+        self.native_copy, self.ingest_from_url = native_copy, ingest_from_url
+        self.resume, self.journal_path = resume, journal_path
+        self.prewarm_connections = prewarm_connections
+        self.show_progress = show_progress
+        self.read_ahead = read_ahead
+        self.stream_parts = stream_parts
+        self.verify_checksums = verify_checksums
+        self.small_object_size = parse_size(small_object_size) if small_object_size else 0
+        # Set by open() when the object moves in a single GET and PUT.
+        self.single_request = False
+        if if_identical not in IF_IDENTICAL:
+            raise ValueError(f"if_identical must be one of {', '.join(IF_IDENTICAL)}, got {if_identical!r}")
+        self.if_identical = if_identical
+        # Set by open() when the destination already holds the source's bytes.
+        self.identical = False
+        # Algorithms the engine hashes each part with; empty when not verifying.
+        self.checksums = ()
+        # A shared MemoryBudget, or a limit for the process-wide one.
+        if max_memory is not None and not isinstance(max_memory, MemoryBudget):
+            max_memory = shared_budget(max_memory)
+        self.memory = max_memory
+        self.src = self.dest = self.plan = self.journal = None
+        self.progress, self._shared_progress = progress, progress is not None
+        self.parts, self.server_side, self.on_part = [], False, None
+        self.transfer_id = None
+        # Set once the destination is complete and verified; it then outlives any later failure.
+        self.delivered = False
+        # Parts an earlier run moved, and the CRC32Cs the destination holds for
+        # spans of them, keyed by (first, last) part number.
+        self.resumed_parts, self.resumed_checksums = set(), {}
+
+    def open(self):
+        provider_src, bucket_src, key_src = parse_cloud_url(self.src_url)
+        provider_dst, bucket_dst, key_dst = parse_cloud_url(self.dst_url)
+        download_threads, upload_threads = self.download_threads, self.upload_threads
+
+        # Size the shared connection pools for this transfer before any handler
+        # fetches a client.
+        if provider_src == provider_dst:
+            registry.reserve(provider_src, download_threads + upload_threads)
+        else:
+            registry.reserve(provider_src, download_threads)
+            registry.reserve(provider_dst, upload_threads)
 
-# ====================
-# Destination Handlers
-# ====================
+        src = self.src = open_handler(provider_src, "source", bucket_src, key_src)
 
-class S3Dest:
-    def __init__(self, bucket, key):
-        self.bucket, self.key = bucket, key
-        self.client = boto3.client('s3')
-        self.upload_id = self.client.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
-        self.parts = []
-
-    def upload_part(self, part_number, data):
-        resp = self.client.upload_part(Bucket=self.bucket, Key=self.key,
-                                       UploadId=self.upload_id, PartNumber=part_number,
-                                       Body=data)
-        etag = resp['ETag'].strip('"')
-        self.parts.append({'ETag': etag, 'PartNumber': part_number})
-
-    def complete(self):
-        self.parts.sort(key=lambda p: p['PartNumber'])
-        self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key,
-                                              UploadId=self.upload_id,
-                                              MultipartUpload={'Parts': self.parts})
-
-    def abort(self):
-        self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
-
-class GCSDest:
-    def __init__(self, bucket, blob_name):
-        self.client = storage.Client()
-        self.bucket = self.client.bucket(bucket)
-        self.final_blob_name = blob_name
-        self.part_prefix = f"{blob_name}.part-{uuid.uuid4().hex}-"
-        self.part_count = 0
-
-    def upload_part(self, part_number, data):
-        part_name = f"{self.part_prefix}{part_number}"
-        blob = self.bucket.blob(part_name)
-        blob.upload_from_file(io.BytesIO(data), size=len(data))
-        self.part_count += 1
-
-    def complete(self):
-        if self.part_count == 0:
-            self.bucket.blob(self.final_blob_name).upload_from_string(b"")
-            return
-        blobs = [self.bucket.blob(f"{self.part_prefix}{i}") for i in range(1, self.part_count + 1)]
-        self.bucket.blob(self.final_blob_name).compose(blobs)
-        for blob in blobs:
-            try:
-                blob.delete()
-            except Exception:
-                pass
-
-    def abort(self):
-        for i in range(1, self.part_count + 1):
-            try:
-                self.bucket.blob(f"{self.part_prefix}{i}").delete()
-            except Exception:
-                pass
-
-class AzureDest:
-    def __init__(self, account, container, blob_name):
-        if account is None:
-            account = os.environ.get("AZURE_STORAGE_ACCOUNT")
-        self.blob_client = BlobServiceClient(
-            account_url=f"https://{account}.blob.core.windows.net",
-            credential=DefaultAzureCredential()
-        ).get_blob_client(container, blob_name)
-        self.block_ids = []
-
-    def upload_part(self, part_number, data):
-        block_id = base64.b64encode(f"{part_number:06d}".encode()).decode()
-        self.blob_client.stage_block(block_id=block_id, data=data)
-        self.block_ids.append(block_id)
-
-    def complete(self):
-        if not self.block_ids:
-            self.blob_client.upload_blob(b"", overwrite=True)
+        file_size = src.get_size()
+        logger.info(f"Transferring: {self.src_url} -> {self.dst_url} ({file_size} bytes)")
+
+        journal = record = None
+        if self.resume:
+            from .journal import TransferJournal
+            journal = self.journal = TransferJournal(self.journal_path)
+            record = journal.find(self.src_url, src.identity(), self.dst_url)
+
+        if record is not None and record.size == file_size:
+            # Keep the interrupted transfer's layout so its parts line up.
+            plan = PartPlan(file_size, record.chunk_size)
+        else:
+            record = None
+            max_chunk_size = None
+            if self.memory is not None and not self.stream_parts:
+                # Room for every worker's part plus the read-ahead queue.
+                read_ahead = self.read_ahead if self.read_ahead is not None else upload_threads
+                max_chunk_size = self.memory.limit // (download_threads + read_ahead + upload_threads)
+            plan = plan_parts(file_size, provider_src, provider_dst,
+                              parallelism=max(download_threads, upload_threads), chunk_size=self.chunk_size,
+                              max_chunk_size=max_chunk_size)
+        self.plan = plan
+        logger.debug(f"Part layout: {plan.num_parts} parts of {plan.chunk_size} bytes")
+        if self.memory is not None and not self.stream_parts and plan.chunk_size > self.memory.limit:
+            logger.warning(f"Parts of {plan.chunk_size} bytes exceed the {self.memory.limit} byte memory budget; "
+                           f"they will be moved one at a time")
+
+        # Opened only once the layout is known to be valid, so a rejected chunk size
+        # never leaves a multipart upload behind.
+        dest = self.dest = open_handler(provider_dst, "dest", bucket_dst, key_dst)
+        if hasattr(dest, "compose_threads"):
+            # Compose calls are writes too, so they get no more threads than the uploads.
+            dest.compose_threads = min(dest.compose_threads, upload_threads)
+
+        if self.if_identical != "overwrite" and hasattr(dest, "existing"):
+            found = dest.existing()
+            stored = src.stored_checksums() if hasattr(src, "stored_checksums") else {}
+            if found is not None and _checksums.same_content(file_size, stored, *found):
+                logger.info(f"{self.dst_url} already holds an identical object; no data will be moved.")
+                self.identical = True
+                # Never aborted: that would delete the identical object.
+                self.dest = None
+                if record is not None:
+                    # An earlier run completed the upload but not the delete.
+                    journal.finish(record.id)
+                return
+
+        # Same-provider copies are server-side by default; having one cloud pull
+        # from another's presigned URL is opt-in.
+        allowed = self.native_copy if provider_src == provider_dst else self.ingest_from_url
+        self.server_side = allowed and hasattr(dest, "can_copy_from") and dest.can_copy_from(src)
+        if self.server_side:
+            logger.info("Using server-side copy; no data will pass through this host.")
+        elif self.verify_checksums and not _checksums.available():
+            logger.warning("google-crc32c is not installed; checksums will not be verified.")
+        elif self.verify_checksums:
+            stored = src.stored_checksums() if hasattr(src, "stored_checksums") else {}
+            # MD5 does not combine across parts, so it is only worth computing
+            # for a single-part object whose source has nothing better.
+            single_md5 = plan.num_parts == 1 and "md5" in stored and "crc32c" not in stored
+            self.checksums = ("crc32c", "md5") if single_md5 else ("crc32c",)
+            if hasattr(dest, "send_checksums"):
+                # Before session_state() below opens the upload.
+                dest.send_checksums = True
+
+        # A journalled upload being resumed stays multipart; otherwise a small
+        # object needs no upload session, so nothing is journalled for it.
+        self.single_request = (not self.server_side and record is None and plan.num_parts == 1
+                               and file_size <= self.small_object_size and hasattr(dest, "put_object"))
+        if self.single_request:
+            logger.debug("Small object: moving it with a single GET and PUT.")
+
+        parts, done_bytes = list(plan), 0
+        if journal is not None and not self.single_request:
+            if record is not None:
+                # The destination, not the journal, is the record of what landed:
+                # parts may have committed after the last journal write.
+                lengths = {n: length for n, _, length in plan}
+                present = dest.resume(record.state, plan)
+                done = {n for n, size in present.items() if lengths.get(n) == size}
+                journal.reset_parts(record.id, done)
+                journal.update_state(record.id, dest.session_state())
+                self.transfer_id = record.id
+                self.resumed_parts = done
+                self.resumed_checksums = {
+                    (first, last): crc for (first, last), crc in getattr(dest, "resumed_checksums", {}).items()
+                    if all(n in done for n in range(first, last + 1))}
+                parts = [p for p in plan if p[0] not in done]
+                done_bytes = sum(lengths[n] for n in done)
+                logger.info(f"Resuming: {len(done)} of {plan.num_parts} parts already transferred.")
+            else:
+                self.transfer_id = journal.begin(self.src_url, src.identity(), self.dst_url, file_size,
+                                                 plan.chunk_size, dest.session_state()).id
+            self.on_part = lambda part_number: journal.record_part(self.transfer_id, part_number)
+        self.parts = parts
+
+        if self.prewarm_connections and parts:
+            if not self.server_side and hasattr(src, "probe"):
+                prewarm(src.probe, min(download_threads, len(parts)))
+            if hasattr(dest, "probe"):
+                prewarm(dest.probe, min(upload_threads, len(parts)))
+
+        if self._shared_progress:
+            self.progress.add(file_size - done_bytes)
         else:
-            self.block_ids.sort()
-            self.blob_client.commit_block_list(self.block_ids)
+            self.progress = tqdm(total=file_size, initial=done_bytes, unit="B", unit_scale=True,
+                                 desc="Moving") if self.show_progress and tqdm else None
+
+    def finish(self, part_checksums=None):
+        if self.memory is not None:
+            logger.debug(f"Peak part data in memory: {self.memory.peak} of {self.memory.limit} bytes")
+        moved = self._moved_checksums(part_checksums)
+        if moved is not None and not self.single_request and hasattr(self.src, "stored_checksums"):
+            # Before completing, so a corrupted read never becomes the object;
+            # a single-request move was checked before its write.
+            self._verify("source", self.src.stored_checksums(), moved)
+        if moved is not None and accepts(self.dest.complete, "checksum"):
+            self.dest.complete(checksum=moved["crc32c"])
+        else:
+            self.dest.complete()
+        if moved is not None and hasattr(self.dest, "stored_checksums"):
+            self._verify("destination", self.dest.stored_checksums(), moved)
+        self.delivered = True
+        if self.transfer_id is not None:
+            self.journal.finish(self.transfer_id)
+        if moved is None and self.checksums and self.resumed_parts:
+            self._close_progress()
+            logger.warning("Source kept: parts moved by an earlier run could not be verified against it.")
+            return
+        if not getattr(self.dest, "consumed_source", False):
+            self.src.delete()
+        self._close_progress()
+        logger.info("Transfer completed successfully.")
 
-    def abort(self):
-        try:
-            self.blob_client.delete_blob()
-        except Exception:
-            pass
+    def verify_source(self, part_checksums):
+        """Compare the data read against the source's stored checksum.
 
-# ====================
-# Core Transfer Logic
-# ====================
+        A single-request move calls this before ``put_object`` writes the
+        object; other moves through ``finish()`` before completing.
+        """
+        moved = self._moved_checksums(part_checksums)
+        if moved is not None and hasattr(self.src, "stored_checksums"):
+            self._verify("source", self.src.stored_checksums(), moved)
+
+    def skip(self):
+        if self.if_identical == "delete-source":
+            self.src.delete()
+            logger.info("Source deleted; the move had already been made.")
+        else:
+            logger.info("Transfer skipped; the source was left in place.")
+
+    def _moved_checksums(self, part_checksums):
+        # Whole-object checksums of what was moved, or None if some part is
+        # covered neither by this run's hashes nor by a checksum the
+        # destination holds for what an earlier run uploaded.
+        if not self.checksums or part_checksums is None:
+            return None
+        lengths = {n: length for n, _, length in self.plan}
+        spans = {first: (last, crc) for (first, last), crc in self.resumed_checksums.items()}
+        segments, n = [], 1
+        while n <= self.plan.num_parts:
+            if n in part_checksums:
+                segments.append((part_checksums[n]["crc32c"], lengths[n]))
+                n += 1
+            elif n in spans:
+                last, crc = spans[n]
+                segments.append((crc, sum(lengths[m] for m in range(n, last + 1))))
+                n = last + 1
+            else:
+                logger.info("Checksums not verified: the destination holds no checksum for "
+                            f"part {n}, moved by an earlier run.")
+                return None
+        moved = {"crc32c": combine_parts(segments)}
+        if self.plan.num_parts == 1 and "md5" in part_checksums.get(1, {}):
+            moved["md5"] = part_checksums[1]["md5"]
+        return moved
+
+    def _verify(self, role, stored, moved):
+        for algorithm in ("crc32c", "md5"):
+            if algorithm in stored and algorithm in moved:
+                if stored[algorithm] != moved[algorithm]:
+                    raise ChecksumError(f"{algorithm.upper()} of the data moved does not match the {role}'s; "
+                                        f"the source has not been deleted")
+                logger.debug(f"Verified the {role}'s {algorithm.upper()}")
+                return
+        logger.debug(f"The {role} stores no checksum to compare against")
 
-def move_file(src_url, dst_url, threads=4, show_progress=True, verbose=False):
+    def fail(self, error):
+        # Also reached on KeyboardInterrupt, so an interrupted move still
+        # cleans up its partial upload.
+        if isinstance(error, (TransferCancelled, KeyboardInterrupt)):
+            logger.error("Transfer cancelled.")
+        else:
+            logger.error(f"Transfer failed: {error}")
+        if self.journal is not None and not self.single_request and not isinstance(error, ChecksumError):
+            # Leave the partial upload in place for the next --resume run.
+            logger.info("Partial upload kept; run again with --resume to continue.")
+        else:
+            # Data that failed verification must never be picked up by a resumed run.
+            if self.transfer_id is not None:
+                self.journal.finish(self.transfer_id)
+            if self.dest is not None and not self.delivered:
+                self.dest.abort()
+        self._close_progress()
+
+    def _close_progress(self):
+        if self.progress and not self._shared_progress:
+            self.progress.close()
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+
+
+def move_file(src_url, dst_url, threads=4, show_progress=True, verbose=False,
+              download_threads=None, upload_threads=None, read_ahead=None, chunk_size="auto",
+              native_copy=True, ingest_from_url=False, cancel_token=None, retry=None,
+              resume=False, journal_path=None, prewarm_connections=False, max_memory=None,
+              stream_parts=False, autotune=False, min_threads=1,
+              hedge_tail=True, verify_checksums=True, if_identical="overwrite", slots=None, progress=None,
+              small_object_size=SMALL_OBJECT_SIZE):
     if verbose:
         logger.setLevel(logging.DEBUG)
 
-    provider_src, bucket_src, key_src = parse_cloud_url(src_url)
-    provider_dst, bucket_dst, key_dst = parse_cloud_url(dst_url)
-
-    src = {
-        "s3": S3Source,
-        "gcs": GCSSource,
-        "azure": lambda b, k: AzureSource(*b, k)
-    }[provider_src](bucket_src, key_src)
-
-    dest = {
-        "s3": S3Dest,
-        "gcs": GCSDest,
-        "azure": lambda b, k: AzureDest(*b, k)
-    }[provider_dst](bucket_dst, key_dst)
-
-    file_size = src.get_size()
-    logger.info(f"Transferring: {src_url} -> {dst_url} ({file_size} bytes)")
-
-    chunk_size = min(file_size, 64 * 1024 * 1024)
-    num_parts = math.ceil(file_size / chunk_size)
-    threads = min(threads, num_parts)
-
-    progress = tqdm(total=file_size, unit="B", unit_scale=True, desc="Moving") if show_progress and tqdm else None
-
-    def transfer_part(i):
-        offset = i * chunk_size
-        length = min(chunk_size, file_size - offset)
-        for attempt in range(3):
-            try:
-                data = src.read_range(offset, length)
-                dest.upload_part(i + 1, data)
-                if progress:
-                    progress.update(len(data))
-                return
-            except Exception as e:
-                logger.warning(f"Retry {i+1}, attempt {attempt+1}: {e}")
-                time.sleep(1 + attempt)
-        raise RuntimeError(f"Failed to transfer part {i+1}")
-
+    transfer = Transfer(src_url, dst_url, download_threads=download_threads or threads,
+                        upload_threads=upload_threads or threads, chunk_size=chunk_size,
+                        native_copy=native_copy, ingest_from_url=ingest_from_url, resume=resume,
+                        journal_path=journal_path, prewarm_connections=prewarm_connections,
+                        show_progress=show_progress, read_ahead=read_ahead, max_memory=max_memory,
+                        stream_parts=stream_parts, verify_checksums=verify_checksums,
+                        if_identical=if_identical, progress=progress, small_object_size=small_object_size)
     try:
-        with ThreadPoolExecutor(max_workers=threads) as executor:
-            for future in as_completed([executor.submit(transfer_part, i) for i in range(num_parts)]):
-                future.result()
-        dest.complete()
-        src.delete()
-        if progress: progress.close()
-        logger.info("Transfer completed successfully.")
-    except Exception as e:
-        logger.error(f"Transfer failed: {e}")
-        dest.abort()
-        if progress: progress.close()
+        transfer.open()
+        if transfer.identical:
+            transfer.skip()
+            return True
+        pipeline = TransferPipeline(transfer.src, transfer.dest, transfer.parts,
+                                    download_threads=transfer.download_threads,
+                                    upload_threads=transfer.upload_threads,
+                                    read_ahead=read_ahead, progress=transfer.progress,
+                                    server_side=transfer.server_side, cancel_token=cancel_token,
+                                    retry=retry, on_part=transfer.on_part, memory=transfer.memory,
+                                    passthrough=stream_parts, autotune=autotune,
+                                    min_threads=min_threads, hedge_tail=hedge_tail,
+                                    checksums=transfer.checksums, slots=slots,
+                                    single_request=transfer.single_request,
+                                    before_put=transfer.verify_source)
+        pipeline.run()
+        if any(pipeline.retries.values()):
+            logger.debug(f"Retries by phase: {pipeline.retries}")
+        transfer.finish(pipeline.part_checksums)
+        return True
+    except BaseException as e:
+        transfer.fail(e)
         raise
+    finally:
+        transfer.close()
+
+
+def move_prefix(src_url, dst_url, list_threads=LIST_THREADS, retry=None, cancel_token=None, glob=False,
+                **options):
+    """Move every object under a prefix (``s3://bucket/2024/``), or with ``glob``
+    matching a pattern (``gs://bucket/logs/*.gz``), into the destination prefix ``dst_url``.
+
+    Keys keep their path below the source prefix's last ``/``. Objects join
+    a ``move_batch`` (which takes the remaining ``options``) as soon as the
+    listing finds them. Returns its ``{"moved": count, "failed": {source URL: error}}``.
+    """
+    from .batch import move_batch
+    if not dst_url.endswith("/") or PrefixURL(dst_url).pattern is not None:
+        raise ValueError(f"The destination of a prefix or glob move must be a prefix ending in '/': {dst_url}")
+    source = PrefixURL(src_url, glob=glob)
+    lister = open_lister(source.provider, source.location)
+    token = cancel_token or CancellationToken()
+    logger.info(f"Moving objects under {src_url} -> {dst_url}")
+    pairs = ((source.url(key), dst_url + source.relative(key))
+             for key, _ in list_objects(lister, source.prefix, threads=list_threads, retry=retry, cancel_token=token)
+             if source.matches(key))
+    return move_batch(pairs, retry=retry, cancel_token=token, **options)
@@ -0,0 +1,108 @@
+"""Local checkpoint journal that makes interrupted transfers resumable."""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+
+def default_journal_path():
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache, "cloudfile-mover", "journal.sqlite")
+
+
+JournalRecord = namedtuple("JournalRecord", ["id", "size", "chunk_size", "state", "parts"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transfers (
+    id INTEGER PRIMARY KEY,
+    src_url TEXT NOT NULL,
+    src_identity TEXT NOT NULL,
+    dst_url TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    updated REAL NOT NULL,
+    UNIQUE (src_url, src_identity, dst_url)
+);
+CREATE TABLE IF NOT EXISTS parts (
+    transfer_id INTEGER NOT NULL REFERENCES transfers(id) ON DELETE CASCADE,
+    part_number INTEGER NOT NULL,
+    PRIMARY KEY (transfer_id, part_number)
+);
+"""
+
+
+class TransferJournal:
+    """SQLite journal of in-progress transfers and the parts they have committed.
+
+    A transfer is keyed by source URL, source identity (ETag or generation,
+    so a changed source never resumes onto stale parts) and destination URL.
+    Its row holds the part layout and the destination session (S3 upload ID,
+    GCS part prefix, Azure block ID session) needed to pick up the upload
+    again. Each part is recorded as soon as it commits. WAL mode keeps these
+    small writes cheap while surviving a crash of the process.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_journal_path()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(_SCHEMA)
+
+    def find(self, src_url, src_identity, dst_url):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, size, chunk_size, state FROM transfers WHERE src_url=? AND src_identity=? AND dst_url=?",
+                (src_url, src_identity, dst_url)).fetchone()
+            if row is None:
+                return None
+            parts = {r[0] for r in self._db.execute(
+                "SELECT part_number FROM parts WHERE transfer_id=?", (row[0],))}
+        return JournalRecord(row[0], row[1], row[2], json.loads(row[3]), parts)
+
+    def begin(self, src_url, src_identity, dst_url, size, chunk_size, state):
+        with self._lock:
+            # A transfer of an older version of the source to the same
+            # destination can never be resumed, so it is dropped.
+            self._db.execute("DELETE FROM transfers WHERE src_url=? AND dst_url=?", (src_url, dst_url))
+            cursor = self._db.execute(
+                "INSERT INTO transfers (src_url, src_identity, dst_url, size, chunk_size, state, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (src_url, src_identity, dst_url, size, chunk_size, json.dumps(state), time.time()))
+        return JournalRecord(cursor.lastrowid, size, chunk_size, state, set())
+
+    def update_state(self, transfer_id, state):
+        with self._lock:
+            self._db.execute("UPDATE transfers SET state=?, updated=? WHERE id=?",
+                             (json.dumps(state), time.time(), transfer_id))
+
+    def reset_parts(self, transfer_id, part_numbers):
+        """Replace the recorded parts with what the destination actually holds."""
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM parts WHERE transfer_id=?", (transfer_id,))
+            self._db.executemany("INSERT INTO parts (transfer_id, part_number) VALUES (?, ?)",
+                                 [(transfer_id, n) for n in part_numbers])
+            self._db.execute("COMMIT")
+
+    def record_part(self, transfer_id, part_number):
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO parts (transfer_id, part_number) VALUES (?, ?)",
+                             (transfer_id, part_number))
+
+    def finish(self, transfer_id):
+        with self._lock:
+            self._db.execute("DELETE FROM transfers WHERE id=?", (transfer_id,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
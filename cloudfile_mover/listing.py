@@ -0,0 +1,122 @@
+"""Prefix and glob URLs, and concurrent listing of the objects they match."""
+
+import logging
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+
+from .retry import RetryPolicy
+
+logger = logging.getLogger("cloudfile_mover")
+
+# Listing requests kept in flight, one per prefix being paged through.
+LIST_THREADS = 8
+# Pages listed ahead of the consumer before the listing threads wait for it.
+MAX_PENDING_PAGES = 64
+
+_GLOB_CHARS = re.compile(r"[*?\[]")
+
+
+def is_prefix_url(url, glob=False):
+    """Whether ``url`` names many objects: a prefix ending in ``/``, or with
+    ``glob`` a pattern. Keys may contain ``*``, ``?`` and ``[``, so globbing
+    is opt-in."""
+    return url.endswith("/") or (glob and _GLOB_CHARS.search(url) is not None)
+
+
+class PrefixURL:
+    """A parsed prefix or glob URL.
+
+    ``root`` is the URL up to the start of the key, ``base`` the part of the
+    key that is replaced by the destination prefix, ``prefix`` what is listed
+    (the key up to its first glob character) and ``pattern`` the glob that
+    listed keys must match, or ``None``. ``*`` matches across ``/``. Without
+    ``glob`` the key is a literal prefix, whatever characters it holds.
+    """
+
+    def __init__(self, url, glob=False):
+        from .core import parse_cloud_url
+        try:
+            self.provider, self.location, key = parse_cloud_url(url)
+        except ValueError:
+            # A whole bucket or container ("s3://bucket/") has an empty key.
+            if not url.endswith("/"):
+                raise
+            self.provider, self.location, key = parse_cloud_url(url + "_")
+            key = key[:-1]
+        self.root = url[:len(url) - len(key)]
+        m = _GLOB_CHARS.search(key) if glob else None
+        self.pattern = key if m else None
+        self.prefix = key[:m.start()] if m else key
+        self.base = self.prefix[:self.prefix.rfind("/") + 1]
+
+    def matches(self, key):
+        # Zero-byte keys ending in "/" are folder placeholders, not objects.
+        if key.endswith("/"):
+            return False
+        return self.pattern is None or fnmatchcase(key, self.pattern)
+
+    def url(self, key):
+        return self.root + key
+
+    def relative(self, key):
+        return key[len(self.base):]
+
+
+def list_objects(lister, prefix, threads=LIST_THREADS, retry=None, cancel_token=None, delimiter="/"):
+    """Yield ``(key, size)`` for every object under ``prefix`` as its page arrives.
+
+    Listing is split at ``delimiter``: each sub-prefix a page reports is paged
+    through by its own request, so a deep tree is listed ``threads`` requests
+    at a time instead of one page after another. Keys are yielded in no
+    particular order. The listing threads stay at most ``MAX_PENDING_PAGES``
+    pages ahead of the caller.
+    """
+    retry = retry or RetryPolicy()
+    pages = queue.Queue(maxsize=MAX_PENDING_PAGES)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set() and not (cancel_token and cancel_token.cancelled):
+            try:
+                pages.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def fetch(sub_prefix, token):
+        try:
+            objects, prefixes, next_token = retry.call(
+                lambda: lister.list_page(sub_prefix, delimiter, token), f"list {sub_prefix!r}", cancel_token)
+            follow_ups = [(p, None) for p in prefixes] + ([(sub_prefix, next_token)] if next_token else [])
+        except BaseException as e:
+            put(([], 0, e))
+            return
+        # Counted by the consumer before any follow-up can report back.
+        put((objects, len(follow_ups), None))
+        try:
+            for follow_up in follow_ups:
+                pool.submit(fetch, *follow_up)
+        except BaseException as e:
+            put(([], 0, e))
+
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="cloudfile-list")
+    outstanding = 1
+    try:
+        pool.submit(fetch, prefix, None)
+        while outstanding:
+            try:
+                objects, follow_ups, error = pages.get(timeout=0.1)
+            except queue.Empty:
+                if cancel_token:
+                    cancel_token.raise_if_cancelled()
+                continue
+            if error is not None:
+                raise error
+            outstanding += follow_ups - 1
+            yield from objects
+    finally:
+        stopped.set()
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,78 @@
+"""Process-wide budget for the part data transfers hold in memory."""
+
+import threading
+
+from .planner import parse_size
+
+
+class MemoryBudget:
+    """A byte-counting semaphore bounding the part data held in memory.
+
+    A download worker reserves a part's length before reading it, and the
+    reservation is released as soon as that part has been uploaded (or
+    dropped because the transfer failed). Every transfer given the same
+    budget draws on the same pool, so several ``move_file`` calls in one
+    process together stay under ``limit``. A part larger than the whole
+    budget may still proceed, but only while nothing else is reserved.
+    ``peak`` records the most ever reserved at once.
+    """
+
+    def __init__(self, limit):
+        if limit <= 0:
+            raise ValueError(f"Memory budget must be positive, got {limit}")
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self._cond = threading.Condition()
+
+    def _grant(self, nbytes):
+        # Called with the condition held; returns the bytes reserved or None.
+        nbytes = min(nbytes, self.limit)
+        if self.used + nbytes > self.limit:
+            return None
+        self.used += nbytes
+        self.peak = max(self.peak, self.used)
+        return nbytes
+
+    def try_acquire(self, nbytes):
+        """Reserve ``nbytes`` if they fit right now; returns the reservation or None."""
+        with self._cond:
+            return self._grant(nbytes)
+
+    def acquire(self, nbytes, cancel_token=None):
+        """Block until ``nbytes`` fit in the budget; returns the reservation to release."""
+        with self._cond:
+            while True:
+                granted = self._grant(nbytes)
+                if granted is not None:
+                    return granted
+                if cancel_token:
+                    cancel_token.raise_if_cancelled()
+                self._cond.wait(0.1)
+
+    def release(self, nbytes):
+        with self._cond:
+            self.used -= nbytes
+            self._cond.notify_all()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_budget(limit):
+    """Return the process-wide budget, created with (or reset to) ``limit`` bytes.
+
+    ``limit`` may be a size string such as ``"2GiB"``. Reservations already
+    held keep counting against the new limit.
+    """
+    global _shared
+    limit = parse_size(limit)
+    with _shared_lock:
+        if _shared is None:
+            _shared = MemoryBudget(limit)
+        else:
+            with _shared._cond:
+                _shared.limit = limit
+                _shared._cond.notify_all()
+        return _shared
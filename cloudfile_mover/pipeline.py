@@ -0,0 +1,594 @@
+"""Pipelined download/upload engine used by move_file."""
+
+import copy
+import logging
+import queue
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from .autotune import ConcurrencyTuner
+from . import checksums as _checksums
+from .buffers import PASSTHROUGH_WINDOW, BufferPool, accepts, accepts_buffer
+from .cancel import CancellationToken
+from .ratelimit import limiter
+from .retry import RetryPolicy
+
+logger = logging.getLogger("cloudfile_mover")
+
+# Sentinel telling an upload worker that no more chunks will arrive.
+_DONE = object()
+
+# Tail parts are read as subranges of at least this size...
+SPLIT_MIN_SIZE = 8 * 1024 * 1024
+# ...and a subrange is hedged once it has taken this many times longer than
+# the median read rate predicts, and at least HEDGE_MIN_DELAY seconds.
+HEDGE_FACTOR = 3.0
+HEDGE_MIN_DELAY = 1.0
+
+
+class _Piece:
+    """A range of a part, read by whichever worker gets to it first."""
+
+    def __init__(self, part, offset, length):
+        self.part, self.offset, self.length = part, offset, length
+        self.started = None
+        self.hedged = False
+        self.done = False
+        self.readers = []  # tokens of the reads in progress, cancelled once one wins
+
+
+class _SplitPart:
+    """A part whose subranges are read concurrently and assembled before upload.
+
+    A ``whole`` part is one read of the full range by the worker that took
+    it. Once that read falls behind, ``hedge`` is a split of the same range
+    that idle workers read in its place (its ``hedged_read`` points back),
+    and whichever finishes first is uploaded.
+    """
+
+    def __init__(self, part_number, offset, length, reserved, buffer, whole=False):
+        self.part_number, self.offset, self.length = part_number, offset, length
+        self.reserved, self.buffer = reserved, buffer
+        self.whole = whole
+        self.hedge = self.hedged_read = None
+        if whole:
+            # Read in place by its own worker.
+            self.view, count = None, 1
+        else:
+            self.view = memoryview(buffer if buffer is not None else bytearray(length))[:length]
+            count = max(1, length // SPLIT_MIN_SIZE)
+        size = -(-length // count)
+        self.pieces = [_Piece(self, start, min(size, offset + length - start))
+                       for start in range(offset, offset + length, size)]
+        self.remaining = len(self.pieces)
+
+
+class TransferPipeline:
+    """Moves parts from ``src`` to ``dest`` through two independent worker pools.
+
+    Download workers hand parts to upload workers through a queue of at most
+    ``read_ahead`` chunks, so peak memory is about ``download_threads +
+    read_ahead + upload_threads`` parts. A source whose ``read_range`` takes
+    a ``buffer`` reads into a fixed ``BufferPool``, so destinations must not
+    keep ``data`` after ``upload_part`` returns. ``memory`` (a
+    ``MemoryBudget``) is charged for each part while it is held.
+
+    ``passthrough`` pipes each ranged response straight into its upload
+    (``open_range`` / ``upload_part_stream``) with no download stage.
+    ``checksums`` names the algorithms each part is hashed with into
+    ``part_checksums``; the CRC32C is sent with the upload when accepted.
+    ``autotune`` makes the thread counts ceilings for a ``ConcurrencyTuner``
+    per side. ``hedge_tail`` lets workers with nothing left to start split
+    the last part, or a whole part that falls far behind, into subranges
+    they share, and re-issue subrange reads that do. ``single_request``
+    moves a one-part object with ``put_object``, after passing its
+    ``part_checksums`` to ``before_put``, which may refuse it. ``slots`` (a
+    ``batch.SharedSlots``) caps requests across a batch.
+
+    Each phase retries through ``retry`` and counts retries in ``retries``;
+    ``on_part(part_number)`` runs once a part is committed. The first failure
+    cancels ``cancel_token``, which stops every worker within one read block.
+    """
+
+    def __init__(self, src, dest, parts, download_threads=4, upload_threads=4,
+                 read_ahead=None, progress=None, retry=None, server_side=False,
+                 cancel_token=None, on_part=None, memory=None, passthrough=False,
+                 autotune=False, min_threads=1, hedge_tail=True, checksums=(), slots=None,
+                 single_request=False, before_put=None):
+        self.src, self.dest = src, dest
+        self.before_put = before_put
+        self.slots = slots
+        self.server_side = server_side
+        self.parts = list(parts)
+        self.single_request = (single_request and not server_side and len(self.parts) == 1
+                               and hasattr(dest, "put_object"))
+        self.hedge_tail = hedge_tail and not server_side and not passthrough
+        # A split last part gives idle download workers something to read.
+        readable = len(self.parts)
+        if self.hedge_tail and self.parts:
+            readable += max(1, self.parts[-1][2] // SPLIT_MIN_SIZE) - 1
+        self.download_threads = max(1, min(download_threads, readable))
+        self.upload_threads = max(1, min(upload_threads, len(self.parts)))
+        self.read_ahead = max(1, read_ahead if read_ahead is not None else self.upload_threads)
+        self.progress = progress
+        self.on_part = on_part
+        self.memory = memory
+        self.passthrough = (passthrough and not server_side and hasattr(src, "open_range")
+                            and hasattr(dest, "upload_part_stream"))
+        self.buffers = None
+        if (not server_side and not self.passthrough and not self.single_request and self.parts
+                and accepts_buffer(src.read_range)):
+            self.buffers = BufferPool(max(length for _, _, length in self.parts),
+                                      self.download_threads + self.read_ahead + self.upload_threads)
+        self.retry = retry or RetryPolicy()
+        self.retries = {"download": 0, "upload": 0, "copy": 0}
+        self.tuners = {}
+        if autotune:
+            self.tuners["download"] = ConcurrencyTuner("download", self.download_threads, min_threads)
+            # Copies and streamed parts are paced by the destination side.
+            self.tuners["upload"] = self.tuners["copy"] = ConcurrencyTuner("upload", self.upload_threads, min_threads)
+        self.cancel_token = cancel_token or CancellationToken()
+        # Handlers poll the token inside their own streaming reads, and
+        # charge the bytes they stream to the process-wide bandwidth limits.
+        src.cancel_token = dest.cancel_token = self.cancel_token
+        src.throttle = limiter.throttle(getattr(src, "provider", None), "read", self.cancel_token)
+        dest.throttle = limiter.throttle(getattr(dest, "provider", None), "write", self.cancel_token)
+        self._pending = queue.Queue()
+        for part in self.parts:
+            self._pending.put(part)
+        self._chunks = queue.Queue(maxsize=self.read_ahead)
+        self.hedges = {"issued": 0, "won": 0}
+        self.checksums = tuple(checksums)
+        self.part_checksums = {}
+        self._send_checksum = "crc32c" in self.checksums and accepts(dest.upload_part, "checksum")
+        self._pieces = deque()
+        self._reading = set()
+        self._busy = 0  # download workers holding a whole part
+        self._rates = deque(maxlen=64)
+        self._lock = threading.Lock()
+        self._error = None
+
+    def run(self):
+        if not self.parts:
+            return
+        if self.single_request:
+            self._guard(self._put_whole)
+        elif self.server_side:
+            self._run_server_side()
+        elif self.passthrough:
+            self._run_pool(self._passthrough_loop, "stream")
+        else:
+            self._run_streaming()
+            self._drain()
+        if self._error is not None:
+            raise self._error
+        # Cancelled from outside between parts: nothing failed, but the transfer is incomplete.
+        self.cancel_token.raise_if_cancelled()
+
+    def _run_streaming(self):
+        with ThreadPoolExecutor(max_workers=self.download_threads, thread_name_prefix="download") as downloads, \
+                ThreadPoolExecutor(max_workers=self.upload_threads, thread_name_prefix="upload") as uploads:
+            try:
+                downloaders = [downloads.submit(self._guard, self._download_loop) for _ in range(self.download_threads)]
+                uploaders = [uploads.submit(self._guard, self._upload_loop) for _ in range(self.upload_threads)]
+                wait(downloaders)
+                for _ in uploaders:
+                    self._offer(_DONE)
+                wait(uploaders)
+            except BaseException as e:
+                # e.g. KeyboardInterrupt in the calling thread: stop the workers
+                # before the executors wait for them.
+                self.cancel_token.cancel(repr(e))
+                raise
+
+    def _run_server_side(self):
+        # The destination pulls each range from the source itself, so there is
+        # no download stage: one pool issues the copy calls. Destinations that
+        # can only copy whole objects get a single call that reports progress.
+        if len(self.parts) == 1 or not hasattr(self.dest, "copy_part"):
+            self._guard(lambda: self._attempt(lambda: self.dest.copy_from(self.src, progress=self._advance), "copy", 1))
+            return
+        self._run_pool(self._copy_loop, "copy")
+
+    def _put_whole(self):
+        part_number, offset, length = self.parts[0]
+        reserved = self.memory.acquire(length, self.cancel_token) if self.memory else 0
+        try:
+            with self._slot("download"):
+                data = self._attempt(lambda: self.src.read_range(offset, length), "download", part_number, length)
+            extra = {}
+            if self.checksums:
+                self.part_checksums[part_number] = _checksums.digest(data, self.checksums)
+                if "crc32c" in self.checksums and accepts(self.dest.put_object, "checksum"):
+                    extra["checksum"] = self.part_checksums[part_number]["crc32c"]
+            if self.before_put:
+                # The write replaces the object, so a bad read is refused here.
+                self.before_put(self.part_checksums)
+            with self._slot("upload"):
+                self._attempt(lambda: self.dest.put_object(data, **extra), "upload", part_number, length)
+        finally:
+            self._release(reserved)
+        logger.debug(f"Moved {length} bytes in a single request")
+        self._committed(part_number)
+        self._advance(length)
+
+    def _run_pool(self, loop, name):
+        with ThreadPoolExecutor(max_workers=self.upload_threads, thread_name_prefix=name) as pool:
+            try:
+                wait([pool.submit(self._guard, loop) for _ in range(self.upload_threads)])
+            except BaseException as e:
+                self.cancel_token.cancel(repr(e))
+                raise
+
+    def _passthrough_loop(self):
+        for part_number, offset, length in self._take_parts():
+            with self._slot("upload"):
+                window = min(length, getattr(self.src, "stream_window", PASSTHROUGH_WINDOW))
+                reserved = self.memory.acquire(window, self.cancel_token) if self.memory else 0
+                try:
+                    self._attempt(lambda: self._pipe(part_number, offset, length), "upload", part_number, length)
+                finally:
+                    self._release(reserved)
+            logger.debug(f"Streamed part {part_number} ({length} bytes)")
+            self._committed(part_number)
+            self._advance(length)
+
+    def _pipe(self, part_number, offset, length):
+        stream = self.src.open_range(offset, length)
+        if self.checksums:
+            stream = _checksums.ChecksumReader(stream, self.checksums)
+        try:
+            self.dest.upload_part_stream(part_number, stream, length)
+        finally:
+            stream.close()
+        if self.checksums:
+            with self._lock:
+                self.part_checksums[part_number] = stream.digests()
+
+    def _copy_loop(self):
+        for part_number, offset, length in self._take_parts():
+            with self._slot("copy"):
+                self._attempt(lambda: self.dest.copy_part(part_number, self.src, offset, length),
+                              "copy", part_number, length)
+            logger.debug(f"Copied part {part_number} ({length} bytes)")
+            self._committed(part_number)
+            self._advance(length)
+
+    def _download_loop(self):
+        while not self.cancel_token.cancelled:
+            piece = self._next_piece()
+            if piece is not None:
+                self._read_piece(piece)
+                continue
+            with self._lock:
+                try:
+                    part_number, offset, length = self._pending.get_nowait()
+                except queue.Empty:
+                    part_number = None
+                else:
+                    self._busy += 1
+                    # Only the last part, and only while some worker has
+                    # nothing else to read.
+                    split = (self.hedge_tail and length >= 2 * SPLIT_MIN_SIZE and self._pending.empty()
+                             and self._busy < self.download_threads)
+            if part_number is None:
+                # Nothing left to start: help with the slowest read still running.
+                if self.hedge_tail and self._hedge_straggler():
+                    continue
+                return
+            try:
+                if split:
+                    self._split(part_number, offset, length)
+                else:
+                    self._read_part(part_number, offset, length)
+            finally:
+                with self._lock:
+                    self._busy -= 1
+
+    def _read_part(self, part_number, offset, length):
+        with self._slot("download"):
+            reserved = self.memory.acquire(length, self.cancel_token) if self.memory else 0
+            buffer = self.buffers.get() if self.buffers else None
+            part = _SplitPart(part_number, offset, length, reserved, buffer, whole=True)
+            piece = part.pieces[0]
+            # In flight where idle workers can see it, and hedge it if it falls behind.
+            with self._lock:
+                piece.started = time.monotonic()
+                self._reading.add(piece)
+            try:
+                with self._reader(piece) as (reader, token):
+                    extra = {} if buffer is None else {"buffer": buffer}
+                    data = self._attempt(lambda: reader.read_range(offset, length, **extra),
+                                         "download", part_number, length, token)
+            except BaseException:
+                with self._lock:
+                    self._reading.discard(piece)
+                self._release(reserved, buffer)
+                # A hedge that already delivered the part makes the failure moot.
+                if piece.done and not self.cancel_token.cancelled:
+                    return
+                raise
+        if not self._deliver(piece, data):
+            # The hedge won; this read's buffer is only free now that it returned.
+            self._release(reserved, buffer)
+
+    def _split(self, part_number, offset, length):
+        with self._slot("download"):
+            reserved = self.memory.acquire(length, self.cancel_token) if self.memory else 0
+            buffer = self.buffers.get() if self.buffers else None
+        part = _SplitPart(part_number, offset, length, reserved, buffer)
+        with self._lock:
+            self._pieces.extend(part.pieces)
+            self._reading.update(part.pieces)
+
+    def _next_piece(self):
+        with self._lock:
+            while self._pieces:
+                piece = self._pieces.popleft()
+                if not piece.done:
+                    piece.started = time.monotonic()
+                    return piece
+        return None
+
+    @contextmanager
+    def _reader(self, piece):
+        # A shallow copy of the source with its own token, so the read that
+        # loses the race can be interrupted without cancelling the transfer.
+        token = CancellationToken()
+        handle = self.cancel_token.register(lambda: token.cancel(self.cancel_token.reason))
+        reader = copy.copy(self.src)
+        reader.cancel_token = token
+        with self._lock:
+            piece.readers.append(token)
+        try:
+            yield reader, token
+        finally:
+            self.cancel_token.unregister(handle)
+
+    def _read_piece(self, piece):
+        with self._slot("download"), self._reader(piece) as (reader, token):
+            try:
+                data = self._attempt(lambda: reader.read_range(piece.offset, piece.length),
+                                     "download", piece.part.part_number, piece.length, token)
+            except BaseException:
+                # A hedge that already delivered this subrange makes the failure moot.
+                if piece.done and not self.cancel_token.cancelled:
+                    return
+                raise
+        self._deliver(piece, data)
+
+    def _hedge_straggler(self):
+        # Returns False once no part or subrange is being read, so the worker
+        # can exit; until then the last part may still be split.
+        with self._lock:
+            if not self._reading and not self._busy:
+                return False
+            now = time.monotonic()
+            rate = statistics.median(self._rates) if self._rates else None
+            piece = None
+            if rate:
+                late = [p for p in self._reading if p.started is not None and not p.hedged
+                        and now - p.started > max(HEDGE_MIN_DELAY, HEDGE_FACTOR * p.length / rate)]
+                piece = max(late, key=lambda p: now - p.started, default=None)
+            if piece is not None:
+                piece.hedged = True
+                self.hedges["issued"] += 1
+        if piece is None:
+            self.cancel_token.wait(0.05)
+            return True
+        reserved = self.memory.try_acquire(piece.length) if self.memory else 0
+        if reserved is None:
+            return True
+        logger.debug(f"Hedging read of part {piece.part.part_number} at offset {piece.offset} "
+                     f"after {now - piece.started:.1f}s")
+        if piece.part.whole:
+            return self._hedge_whole(piece, reserved)
+        try:
+            with self._slot("download"), self._reader(piece) as (reader, token):
+                data = reader.read_range(piece.offset, piece.length)
+            if self._deliver(piece, data):
+                with self._lock:
+                    self.hedges["won"] += 1
+        except Exception as e:
+            # The original read is still running and has its own retries.
+            logger.debug(f"Hedged read of part {piece.part.part_number} failed: {e}")
+        finally:
+            self._release(reserved)
+        return True
+
+    def _hedge_whole(self, piece, reserved):
+        # A whole part keeps being written into its buffer until its read
+        # returns, so the hedge reads the range as subranges into memory of
+        # its own, which every idle worker can help with.
+        whole = piece.part
+        split = _SplitPart(whole.part_number, whole.offset, whole.length, reserved, None)
+        split.hedged_read = whole
+        with self._lock:
+            if not piece.done and not self.cancel_token.cancelled:
+                whole.hedge = split
+                self._pieces.extend(split.pieces)
+                self._reading.update(split.pieces)
+                return True
+        self._release(reserved)
+        return True
+
+    def _deliver(self, piece, data):
+        # The first read of a subrange to finish fills its slice of the part;
+        # the one that finishes the last subrange hands the part to the uploaders.
+        part = piece.part
+        released = 0
+        with self._lock:
+            if piece.done or self.cancel_token.cancelled:
+                return False
+            piece.done = True
+            self._reading.discard(piece)
+            if not part.whole:
+                start = piece.offset - part.offset
+                part.view[start:start + piece.length] = data
+            part.remaining -= 1
+            complete = part.remaining == 0
+            losers = list(piece.readers)
+            # A whole read and the split hedging it race; the loser is dropped.
+            rival = (part.hedge or part.hedged_read) if complete else None
+            if rival is not None:
+                for lost in rival.pieces:
+                    lost.done = True
+                    self._reading.discard(lost)
+                    losers.extend(lost.readers)
+                if part.hedged_read is not None:
+                    # The whole read's own worker frees its buffer once the read returns.
+                    self.hedges["won"] += 1
+                else:
+                    released = rival.reserved
+        for token in losers:
+            token.cancel("another read of the range finished first")
+        self._release(released)
+        if complete and part.whole:
+            logger.debug(f"Downloaded part {part.part_number} ({len(data)} bytes)")
+            self._hand_over(part.part_number, data, part.reserved, part.buffer)
+        elif complete:
+            logger.debug(f"Downloaded part {part.part_number} ({part.length} bytes) in {len(part.pieces)} ranges")
+            self._hand_over(part.part_number, part.view, part.reserved, part.buffer)
+        return True
+
+    def _hand_over(self, part_number, data, reserved, buffer):
+        # Parts are hashed by the download worker, in parallel, before they
+        # are queued for upload.
+        try:
+            if self.checksums:
+                digests = _checksums.digest(data, self.checksums)
+                with self._lock:
+                    self.part_checksums[part_number] = digests
+        except BaseException:
+            self._release(reserved, buffer)
+            raise
+        if not self._offer((part_number, data, reserved, buffer)):
+            self._release(reserved, buffer)
+
+    def _upload_loop(self):
+        while not self.cancel_token.cancelled:
+            try:
+                item = self._chunks.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            part_number, data, reserved, buffer = item
+            try:
+                with self._slot("upload"):
+                    self._attempt(lambda: self._upload(part_number, data), "upload", part_number, len(data))
+            finally:
+                self._release(reserved, buffer)
+            logger.debug(f"Uploaded part {part_number} ({len(data)} bytes)")
+            self._committed(part_number)
+            self._advance(len(data))
+
+    def _upload(self, part_number, data):
+        if self._send_checksum:
+            self.dest.upload_part(part_number, data, checksum=self.part_checksums[part_number]["crc32c"])
+        else:
+            self.dest.upload_part(part_number, data)
+
+    def _guard(self, loop):
+        # The first failure is the one reported; the errors it causes in other
+        # workers once the token is cancelled are only echoes of it.
+        try:
+            loop()
+        except BaseException as e:
+            with self._lock:
+                if self._error is None:
+                    self._error = e
+            self.cancel_token.cancel(str(e))
+
+    def _take_parts(self):
+        # Parts still queued when the token is cancelled are never started.
+        while not self.cancel_token.cancelled:
+            try:
+                yield self._pending.get_nowait()
+            except queue.Empty:
+                return
+
+    def _committed(self, part_number):
+        if self.on_part:
+            self.on_part(part_number)
+
+    def _advance(self, nbytes):
+        if self.progress:
+            self.progress.update(nbytes)
+
+    def _offer(self, item):
+        # Block while the queue is full, but give up once the transfer has been
+        # cancelled so a stalled upload stage cannot wedge the download workers.
+        while not self.cancel_token.cancelled:
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _release(self, reserved, buffer=None):
+        if reserved:
+            self.memory.release(reserved)
+        if buffer is not None:
+            self.buffers.put(buffer)
+
+    def _drain(self):
+        # Chunks still queued when the transfer stopped give back their memory,
+        # and so do parts whose subranges were never all read.
+        with self._lock:
+            unfinished = {piece.part for piece in self._reading}
+            self._reading.clear()
+            self._pieces.clear()
+        for part in unfinished:
+            self._release(part.reserved, part.buffer)
+        while True:
+            try:
+                item = self._chunks.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _DONE:
+                self._release(item[2], item[3])
+
+    @contextmanager
+    def _slot(self, stage):
+        # With autotuning, holds one of the stage's concurrency slots, and in a
+        # batch one of the slots shared with the other transfers.
+        tuner = self.tuners.get(stage)
+        if tuner is not None:
+            tuner.acquire(self.cancel_token)
+        try:
+            if self.slots is None:
+                yield
+            else:
+                with self.slots.hold(stage, self.cancel_token):
+                    yield
+        finally:
+            if tuner is not None:
+                tuner.release()
+
+    def _attempt(self, action, stage, part_number, nbytes=0, token=None):
+        # Download and upload are separate phases with their own retries, so a
+        # failed upload is replayed from the chunk already in memory instead of
+        # fetching the range from the source again.
+        tuner = self.tuners.get(stage)
+
+        def on_retry(error, info):
+            with self._lock:
+                self.retries[stage] += 1
+            if tuner and info.throttled:
+                tuner.throttled()
+        started = time.monotonic()
+        result = self.retry.call(action, f"{stage} part {part_number}",
+                                 cancel_token=token or self.cancel_token, on_retry=on_retry)
+        elapsed = time.monotonic() - started
+        if tuner:
+            tuner.record(nbytes, elapsed)
+        if stage == "download" and nbytes and elapsed > 0:
+            with self._lock:
+                self._rates.append(nbytes / elapsed)
+        return result
@@ -0,0 +1,131 @@
+"""Part layout planning that respects each provider's multipart limits."""
+
+import math
+import re
+from collections import namedtuple
+
+KiB = 1024
+MiB = 1024 * KiB
+GiB = 1024 * MiB
+TiB = 1024 * GiB
+
+DEFAULT_CHUNK_SIZE = 64 * MiB
+# Below this size an object is moved as a single part instead of being split.
+MIN_AUTO_CHUNK_SIZE = 8 * MiB
+
+PartLimits = namedtuple("PartLimits", ["min_part_size", "max_part_size", "max_parts", "max_object_size"])
+
+PROVIDER_LIMITS = {
+    # Multipart upload: 5 MiB to 5 GiB per part (the last part may be smaller), 10,000 parts.
+    "s3": PartLimits(5 * MiB, 5 * GiB, 10000, 5 * TiB),
+    # Parts are temporary objects combined by a tree of 32-way composes; the part
+    # count is capped only to bound the number of temporary objects.
+    "gcs": PartLimits(1, 5 * TiB, 10000, 5 * TiB),
+    # Block blobs: up to 50,000 committed blocks of at most 4000 MiB each.
+    "azure": PartLimits(1, 4000 * MiB, 50000, 50000 * 4000 * MiB),
+}
+
+
+class PartPlan:
+    """A layout of ``num_parts`` consecutive byte ranges of ``chunk_size`` bytes."""
+
+    def __init__(self, size, chunk_size):
+        self.size = size
+        self.chunk_size = chunk_size
+        self.num_parts = math.ceil(size / chunk_size)
+
+    def __iter__(self):
+        for i in range(self.num_parts):
+            offset = i * self.chunk_size
+            yield i + 1, offset, min(self.chunk_size, self.size - offset)
+
+    def __len__(self):
+        return self.num_parts
+
+    def __repr__(self):
+        return f"PartPlan(size={self.size}, chunk_size={self.chunk_size}, num_parts={self.num_parts})"
+
+
+_SIZE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:I?B)?\s*$', re.IGNORECASE)
+_UNITS = {"": 1, "K": KiB, "M": MiB, "G": GiB, "T": TiB}
+
+
+def parse_size(value):
+    """Parse ``value`` such as ``67108864``, ``"64MiB"``, ``"64M"`` or ``"auto"``.
+
+    Units are binary (``M`` and ``MB`` both mean MiB). ``"auto"`` and ``None``
+    are returned as ``"auto"``.
+    """
+    if value is None or (isinstance(value, str) and value.strip().lower() == "auto"):
+        return "auto"
+    if isinstance(value, int):
+        return value
+    m = _SIZE_RE.match(str(value))
+    if not m:
+        raise ValueError(f"Invalid size: {value!r}")
+    number, unit = m.groups()
+    return int(float(number) * _UNITS[unit.upper()])
+
+
+def provider_limits(src_provider, dst_provider):
+    # Ranged reads impose no limits of their own, so the destination decides.
+    return PROVIDER_LIMITS[dst_provider]
+
+
+def plan_parts(size, src_provider, dst_provider, parallelism=4, chunk_size="auto", limits=None,
+               max_chunk_size=None):
+    """Choose a part layout for moving ``size`` bytes between two providers.
+
+    In ``auto`` mode small objects go as a single part, medium objects are
+    split so every worker gets a part, and large objects use
+    ``DEFAULT_CHUNK_SIZE`` parts, grown as needed to stay under the
+    destination's part-count limit. ``max_chunk_size`` (from a memory budget)
+    caps ``auto`` parts unless the part-count limit needs them larger. An
+    explicit ``chunk_size`` is validated against the same limits and raises
+    ``ValueError`` if it cannot work.
+    """
+    limits = limits or provider_limits(src_provider, dst_provider)
+    if limits.max_object_size and size > limits.max_object_size:
+        raise ValueError(f"Object of {size} bytes exceeds the {dst_provider} limit of {limits.max_object_size} bytes")
+    if size == 0:
+        return PartPlan(0, 1)
+
+    chunk_size = parse_size(chunk_size)
+    if chunk_size == "auto":
+        chunk_size = _auto_chunk_size(size, limits, parallelism, max_chunk_size)
+    elif chunk_size <= 0:
+        raise ValueError(f"Chunk size must be positive, got {chunk_size}")
+    else:
+        # A chunk size at or above the object's size is one part of the whole
+        # object, which must still fit in a part.
+        if min(chunk_size, size) > limits.max_part_size:
+            raise ValueError(f"Chunk size {chunk_size} exceeds the {dst_provider} maximum part size "
+                             f"of {limits.max_part_size} bytes")
+        # Only the last part may be smaller than the minimum.
+        if chunk_size < size and chunk_size < limits.min_part_size:
+            raise ValueError(f"Chunk size {chunk_size} is below the {dst_provider} minimum part size "
+                             f"of {limits.min_part_size} bytes")
+        if math.ceil(size / chunk_size) > limits.max_parts:
+            raise ValueError(f"Chunk size {chunk_size} needs {math.ceil(size / chunk_size)} parts, more than the "
+                             f"{dst_provider} limit of {limits.max_parts}; use a larger chunk size or 'auto'")
+    return PartPlan(size, min(chunk_size, size))
+
+
+def _auto_chunk_size(size, limits, parallelism, max_chunk_size=None):
+    if size <= MIN_AUTO_CHUNK_SIZE and (not max_chunk_size or size <= max_chunk_size):
+        return size
+    # Split mid-sized objects so every worker has a part to move.
+    chunk_size = min(DEFAULT_CHUNK_SIZE, max(MIN_AUTO_CHUNK_SIZE, math.ceil(size / max(1, parallelism))))
+    if max_chunk_size:
+        # Whole MiB when possible, but never below the provider's minimum part.
+        cap = max_chunk_size // MiB * MiB or max_chunk_size
+        chunk_size = min(chunk_size, max(cap, limits.min_part_size))
+    # Grow parts until the object fits in the part-count limit.
+    chunk_size = max(chunk_size, math.ceil(size / limits.max_parts), limits.min_part_size)
+    if chunk_size >= MiB:
+        chunk_size = math.ceil(chunk_size / MiB) * MiB
+    chunk_size = min(chunk_size, limits.max_part_size)
+    if math.ceil(size / chunk_size) > limits.max_parts:
+        raise ValueError(f"Object of {size} bytes cannot be split into at most {limits.max_parts} parts "
+                         f"of at most {limits.max_part_size} bytes")
+    return chunk_size
@@ -0,0 +1,71 @@
+"""Registry of storage providers, each imported only when a URL needs it.
+
+A provider is a module exposing ``Source`` and ``Dest`` handler classes that
+are constructed with the location and key returned by ``parse_cloud_url``,
+and optionally a ``Lister`` constructed with the location, which makes
+prefix and glob URLs usable as sources.
+The built-in providers are listed here; others are discovered through the
+``cloudfile_mover.providers`` entry point group, e.g. in a plugin's setup.py::
+
+    entry_points={"cloudfile_mover.providers": ["sftp = mypackage.sftp_provider"]}
+
+which makes ``sftp://host/path`` URLs usable as sources and destinations.
+"""
+
+import importlib
+import threading
+
+ENTRY_POINT_GROUP = "cloudfile_mover.providers"
+
+BUILTIN = {
+    "s3": "cloudfile_mover.providers.s3",
+    "gcs": "cloudfile_mover.providers.gcs",
+    "azure": "cloudfile_mover.providers.azure",
+}
+
+# Lifetime of presigned source URLs handed to a destination that pulls data itself.
+PRESIGNED_URL_EXPIRY = 6 * 60 * 60
+
+_lock = threading.Lock()
+_loaded = {}
+_entry_points = None
+
+
+def _plugins():
+    # Scanning installed distributions costs tens of milliseconds, so it is
+    # only done once a URL names a provider that is not built in.
+    global _entry_points
+    if _entry_points is None:
+        try:
+            from importlib.metadata import entry_points
+        except ImportError:  # Python 3.7
+            try:
+                from importlib_metadata import entry_points
+            except ImportError:
+                entry_points = None
+        found = {}
+        if entry_points is not None:
+            eps = entry_points()
+            group = eps.select(group=ENTRY_POINT_GROUP) if hasattr(eps, "select") else eps.get(ENTRY_POINT_GROUP, [])
+            found = {ep.name: ep for ep in group}
+        _entry_points = found
+    return _entry_points
+
+
+def is_registered(name):
+    return name in BUILTIN or name in _plugins()
+
+
+def load(name):
+    """Import and return the module for provider ``name``."""
+    with _lock:
+        module = _loaded.get(name)
+        if module is None:
+            if name in BUILTIN:
+                module = importlib.import_module(BUILTIN[name])
+            elif name in _plugins():
+                module = _plugins()[name].load()
+            else:
+                raise ValueError(f"Unknown storage provider: {name}")
+            _loaded[name] = module
+        return module
@@ -0,0 +1,382 @@
+"""Azure Blob Storage source and destination handlers."""
+
+import base64
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import requests
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from azure.core.pipeline.policies import SansIOHTTPPolicy
+from azure.core.pipeline.transport import RequestsTransport
+from azure.identity import DefaultAzureCredential
+from azure.storage.blob import BlobPrefix, BlobServiceClient, BlobSasPermissions, generate_blob_sas
+
+from ..buffers import BufferWriter, ChunkReader, RangeStream, as_file, async_body, throttled
+from ..cancel import read_chunks_async
+from ..clients import AsyncSession, async_available, keep_token_fresh, mount_pool, registry
+from . import PRESIGNED_URL_EXPIRY
+
+logger = logging.getLogger("cloudfile_mover")
+
+AZURE_STORAGE_SCOPE = "https://storage.azure.com/.default"
+
+# Azure completes copies of blobs up to this size synchronously; larger ones are polled.
+AZURE_SYNC_COPY_LIMIT = 256 * 1024 * 1024
+AZURE_COPY_POLL_INTERVAL = 2
+
+# Stands in for the CRC32C in the IDs of blocks staged without one.
+NO_CHECKSUM = "........"
+
+def azure_service(account):
+    if account is None:
+        account = os.environ.get("AZURE_STORAGE_ACCOUNT")
+        if not account:
+            raise ValueError("Azure storage account not provided")
+    credential = registry.get(("azure-credential", None, None),
+                              lambda pool: keep_token_fresh(DefaultAzureCredential(), AZURE_STORAGE_SCOPE))
+    account_url = f"https://{account}.blob.core.windows.net"
+    def build(pool):
+        transport = RequestsTransport(session=mount_pool(requests.Session(), pool), session_owner=False)
+        return BlobServiceClient(account_url=account_url, credential=credential, transport=transport)
+    return registry.get(("azure", account, None), build)
+
+class _SharedCredential:
+    """The process-wide credential behind the async credential interface.
+
+    ``keep_token_fresh`` renews its token in the background, so ``get_token``
+    answers from the SDK's cache without blocking the event loop.
+    """
+
+    def __init__(self, credential):
+        self._credential = credential
+
+    async def get_token(self, *scopes, **kwargs):
+        return self._credential.get_token(*scopes, **kwargs)
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+class _PacedBody(SansIOHTTPPolicy):
+    """Sends request bodies in blocks charged to the handler's throttle as they are written.
+
+    It runs on every attempt, after the SDK has taken the MD5 of the body
+    for ``validate_content``, so the hash covers the real bytes and a retry
+    sends them again from the start.
+    """
+
+    def __init__(self, handler):
+        self._handler = handler
+
+    def on_request(self, request):
+        body = request.context.setdefault("cloudfile_mover_body", request.http_request.data)
+        throttle = self._handler.throttle
+        # A file body would otherwise be read on aiohttp's thread pool.
+        if hasattr(body, "read") or (throttle and isinstance(body, bytes) and body):
+            request.http_request.data = async_body(body, throttle)
+
+def async_blob_client(blob_client, session, handler):
+    """An ``azure.storage.blob.aio`` client for the same blob, sending through aiohttp ``session``."""
+    from azure.core.pipeline.transport import AioHttpTransport
+    from azure.storage.blob.aio import BlobClient as AsyncBlobClient
+    credential = _SharedCredential(blob_client.credential) if blob_client.credential is not None else None
+    return AsyncBlobClient.from_blob_url(blob_client.url, credential=credential,
+                                         transport=AioHttpTransport(session=session, session_owner=False),
+                                         _additional_pipeline_policies=[_PacedBody(handler)])
+
+class _AsyncClient(AsyncSession):
+    _aio_client = None
+
+    def _async_client(self):
+        if self._aio_client is None:
+            self._aio_client = async_blob_client(self.blob_client, self._async_session(), self)
+        return self._aio_client
+
+    async def aclose(self):
+        if self._aio_client is not None:
+            client, self._aio_client = self._aio_client, None
+            await client.close()
+        await super().aclose()
+
+class AzureSource(_AsyncClient):
+    provider = "azure"
+    cancel_token = None
+    throttle = None
+    content_md5 = None
+
+    def __init__(self, account, container, blob_name):
+        self.service = azure_service(account)
+        self.blob_client = self.service.get_blob_client(container, blob_name)
+        props = self.blob_client.get_blob_properties()
+        self.size = props.size
+        self.etag = props.etag
+        self.content_md5 = props.content_settings.content_md5
+        self._presigned_url = None
+
+    def get_size(self):
+        return self.size
+
+    def read_range(self, offset, length, buffer=None):
+        downloader = self.blob_client.download_blob(offset=offset, length=length)
+        if buffer is not None:
+            writer = BufferWriter(memoryview(buffer)[:length], self.cancel_token, self.throttle)
+            downloader.readinto(writer)
+            return writer.filled()
+        if self.cancel_token is None and not self.throttle:
+            return downloader.readall()
+        pieces = []
+        for piece in downloader.chunks():
+            if self.cancel_token:
+                self.cancel_token.raise_if_cancelled()
+            if self.throttle:
+                self.throttle.consume(len(piece))
+            pieces.append(piece)
+        return b"".join(pieces)
+
+    async def read_range_async(self, offset, length, buffer=None):
+        downloader = await self._async_client().download_blob(offset=offset, length=length)
+        return await read_chunks_async(downloader.chunks(), length, buffer, self.cancel_token, self.throttle)
+
+    def open_range(self, offset, length):
+        downloader = self.blob_client.download_blob(offset=offset, length=length)
+        return RangeStream(ChunkReader(downloader.chunks()), length, self.cancel_token, throttle=self.throttle)
+
+    def identity(self):
+        return f"{self.size}:{self.etag}"
+
+    def probe(self):
+        self.blob_client.get_blob_properties()
+
+    def stored_checksums(self):
+        # Content-MD5 is only set for blobs uploaded in one request (or by tools that set it).
+        return {'md5': bytes(self.content_md5)} if self.content_md5 else {}
+
+    def presigned_url(self):
+        # A user-delegation SAS is signed with an Entra ID key rather than the
+        # account key, and lets a destination in another storage account read
+        # the blob.
+        if self._presigned_url is None:
+            start = datetime.now(timezone.utc) - timedelta(minutes=5)
+            expiry = start + timedelta(seconds=PRESIGNED_URL_EXPIRY)
+            key = self.service.get_user_delegation_key(start, expiry)
+            sas = generate_blob_sas(self.blob_client.account_name, self.blob_client.container_name,
+                                    self.blob_client.blob_name, user_delegation_key=key,
+                                    permission=BlobSasPermissions(read=True), start=start, expiry=expiry)
+            self._presigned_url = f"{self.blob_client.url}?{sas}"
+        return self._presigned_url
+
+    def delete(self):
+        self.blob_client.delete_blob()
+
+class AzureDest(_AsyncClient):
+    provider = "azure"
+    cancel_token = None
+    throttle = None
+    # Set once put_object has written the whole blob.
+    whole_object = False
+    # {(part, part): crc32c} of the blocks a resumed upload already holds.
+    resumed_checksums = {}
+    # Set when resuming blocks staged before IDs carried a CRC32C; IDs within
+    # one blob must all be the same length.
+    _short_ids = False
+
+    def __init__(self, account, container, blob_name):
+        self.blob_client = azure_service(account).get_blob_client(container, blob_name)
+        self.block_ids = []
+        self.copied = False
+        self._copy_id = None
+        # Block IDs carry a per-transfer session so a resumed upload never picks
+        # up blocks staged by an unrelated attempt at the same blob.
+        self.session = uuid.uuid4().hex[:12]
+
+    def _block_id(self, part_number, checksum=None):
+        # The ID also records the block's CRC32C, so a resumed run can verify
+        # blocks an earlier run staged; Azure keeps no CRC32C of its own.
+        if self._short_ids:
+            return base64.b64encode(f"{self.session}-{part_number:06d}".encode()).decode()
+        crc = f"{checksum:08x}" if checksum is not None else NO_CHECKSUM
+        return base64.b64encode(f"{self.session}-{part_number:06d}-{crc}".encode()).decode()
+
+    @staticmethod
+    def _parse_block_id(block_id):
+        # (part number, CRC32C or None) of "<session>-<part>[-<crc32c>]".
+        fields = base64.b64decode(block_id).decode().split("-")
+        crc = fields[2] if len(fields) > 2 else NO_CHECKSUM
+        return int(fields[1]), (int(crc, 16) if crc != NO_CHECKSUM else None)
+
+    @classmethod
+    def _part_number(cls, block_id):
+        return cls._parse_block_id(block_id)[0]
+
+    def upload_part(self, part_number, data, checksum=None):
+        block_id = self._block_id(part_number, checksum)
+        # Stage Block takes a transactional MD5 rather than a CRC32C; with
+        # validate_content the SDK sends one and Azure rejects a corrupted block.
+        extra = {'validate_content': True} if checksum is not None else {}
+        if isinstance(data, bytes) and not self.throttle:
+            self.blob_client.stage_block(block_id=block_id, data=data, **extra)
+        else:
+            self.blob_client.stage_block(block_id=block_id, data=as_file(data, self.throttle), length=len(data),
+                                         **extra)
+        self.block_ids.append(block_id)
+
+    async def upload_part_async(self, part_number, data, checksum=None):
+        block_id = self._block_id(part_number, checksum)
+        extra = {'validate_content': True} if checksum is not None else {}
+        # Paced by _PacedBody as the block is sent.
+        body = data if isinstance(data, bytes) else as_file(data)
+        await self._async_client().stage_block(block_id=block_id, data=body, length=len(data), **extra)
+        self.block_ids.append(block_id)
+
+    def put_object(self, data, checksum=None):
+        """Write a small blob in one Put Blob, with no blocks to stage and commit."""
+        extra = {'validate_content': True} if checksum is not None else {}
+        self.blob_client.upload_blob(as_file(data, self.throttle), length=len(data), overwrite=True, **extra)
+        self.whole_object = True
+
+    def upload_part_stream(self, part_number, stream, length):
+        block_id = self._block_id(part_number)
+        self.blob_client.stage_block(block_id=block_id, data=throttled(stream, self.throttle), length=length)
+        self.block_ids.append(block_id)
+
+    def session_state(self):
+        return {'session': self.session}
+
+    def resume(self, state, plan):
+        """Reuse the uncommitted blocks staged under ``state``; returns {part_number: size}.
+
+        Blocks staged with a checksum carry their CRC32C in the block ID, and
+        those are reported in ``resumed_checksums``.
+        """
+        self.session = state['session']
+        _, uncommitted = self.blob_client.get_block_list('uncommitted')
+        prefix = f"{self.session}-"
+        found, self.resumed_checksums = {}, {}
+        for block in uncommitted:
+            name = base64.b64decode(block.id).decode()
+            if name.startswith(prefix):
+                part_number, crc = self._parse_block_id(block.id)
+                found[part_number] = block.size
+                if crc is not None:
+                    self.resumed_checksums[(part_number, part_number)] = crc
+                self._short_ids = name.count("-") == 1
+                self.block_ids.append(block.id)
+        return found
+
+    def probe(self):
+        self.blob_client.exists()
+
+    def existing(self):
+        """Size and stored checksums of a blob already at the name, or None; one HEAD."""
+        try:
+            props = self.blob_client.get_blob_properties()
+        except ResourceNotFoundError:
+            return None
+        except HttpResponseError as e:
+            if e.status_code == 403:
+                return None
+            raise
+        md5 = props.content_settings.content_md5
+        return props.size, ({'md5': bytes(md5)} if md5 else {})
+
+    def can_copy_from(self, src):
+        return hasattr(src, "presigned_url")
+
+    def copy_part(self, part_number, src, offset, length):
+        # Put Block From URL: Azure fetches the range from the presigned source
+        # URL itself, so only control-plane traffic touches this host.
+        block_id = self._block_id(part_number)
+        self.blob_client.stage_block_from_url(block_id=block_id, source_url=src.presigned_url(),
+                                              source_offset=offset, source_length=length)
+        self.block_ids.append(block_id)
+
+    def copy_from(self, src, progress=None):
+        if getattr(src, "provider", None) == "azure":
+            self._copy_blob(src, progress)
+        else:
+            self.blob_client.upload_blob_from_url(src.presigned_url(), overwrite=True)
+            if progress:
+                progress(src.size)
+        self.copied = True
+
+    def _copy_blob(self, src, progress):
+        # Copy Blob: synchronous for small blobs, otherwise Azure copies in the
+        # background and the copy status is polled into the progress bar.
+        if src.size <= AZURE_SYNC_COPY_LIMIT:
+            self.blob_client.start_copy_from_url(src.presigned_url(), requires_sync=True)
+            if progress:
+                progress(src.size)
+            return
+        self._copy_id = self.blob_client.start_copy_from_url(src.presigned_url())['copy_id']
+        reported = 0
+        while True:
+            copy = self.blob_client.get_blob_properties().copy
+            if copy.progress:
+                copied = int(copy.progress.split('/')[0])
+                if progress:
+                    progress(copied - reported)
+                reported = copied
+            if copy.status != 'pending':
+                break
+            if self.cancel_token:
+                self.cancel_token.wait(AZURE_COPY_POLL_INTERVAL)
+                self.cancel_token.raise_if_cancelled()
+            else:
+                time.sleep(AZURE_COPY_POLL_INTERVAL)
+        self._copy_id = None
+        if copy.status != 'success':
+            raise RuntimeError(f"Azure copy {copy.status}: {copy.status_description}")
+
+    def complete(self):
+        if self.copied or self.whole_object:
+            return
+        if not self.block_ids:
+            self.blob_client.upload_blob(b"", overwrite=True)
+        else:
+            # Base64 IDs do not sort like the part numbers they encode, and a
+            # part staged again under another ID must be committed only once.
+            by_part = {self._part_number(block_id): block_id for block_id in self.block_ids}
+            self.block_ids = [by_part[n] for n in sorted(by_part)]
+            self.blob_client.commit_block_list(self.block_ids)
+
+    def abort(self):
+        if self._copy_id is not None:
+            try:
+                self.blob_client.abort_copy(self._copy_id)
+            except Exception:
+                pass
+        try:
+            self.blob_client.delete_blob()
+        except Exception:
+            pass
+
+class AzureLister:
+    def __init__(self, account, container):
+        self.container_client = azure_service(account).get_container_client(container)
+
+    def list_page(self, prefix, delimiter="/", token=None):
+        """One page of blobs under ``prefix``: ``([(name, size)], sub-prefixes, next token)``."""
+        pages = self.container_client.walk_blobs(name_starts_with=prefix or None,
+                                                 delimiter=delimiter).by_page(continuation_token=token)
+        objects, prefixes = [], []
+        for item in next(pages, []):
+            # Sub-prefixes come back as BlobPrefix items, which have no size.
+            if isinstance(item, BlobPrefix):
+                prefixes.append(item.name)
+            else:
+                objects.append((item.name, item.size))
+        return objects, prefixes, pages.continuation_token
+
+if not async_available():
+    # The asyncio engine runs the synchronous methods on its thread pool instead.
+    del AzureSource.read_range_async, AzureDest.upload_part_async
+
+Source, Dest, Lister = AzureSource, AzureDest, AzureLister
@@ -0,0 +1,463 @@
+"""Google Cloud Storage source and destination handlers."""
+
+import base64
+import io
+import logging
+import re
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import quote
+
+from google.cloud import storage
+from google.api_core import exceptions as gcs_exceptions
+
+from ..buffers import PASSTHROUGH_WINDOW, BufferWriter, ChunkReader, RangeStream, as_file, async_body, throttled
+from ..cancel import CancellableWriter, read_chunks_async
+from ..checksums import decode_crc32c, encode_crc32c
+from ..clients import AsyncSession, async_available, mount_pool, registry
+from . import PRESIGNED_URL_EXPIRY
+
+logger = logging.getLogger("cloudfile_mover")
+
+# Ranged GET size used when a part is streamed through from GCS; larger than
+# the passthrough window so a part costs a handful of requests, not hundreds.
+PASSTHROUGH_STREAM_CHUNK = 16 * PASSTHROUGH_WINDOW
+
+def gcs_client():
+    def build(pool):
+        client = storage.Client()
+        mount_pool(client._http, pool)
+        return client
+    return registry.get(("gcs", None, None), build)
+
+def _xml_url(client, bucket, name):
+    # The XML API takes plain GETs and PUTs of the object, with CRC32Cs as headers.
+    return f"{client._connection.API_BASE_URL}/{bucket}/{quote(name, safe='')}"
+
+async def _auth_headers(client):
+    credentials = client._credentials
+    if not credentials.valid:
+        import asyncio
+        from google.auth.transport.requests import Request
+        # A blocking request, needed about once an hour per process.
+        await asyncio.get_running_loop().run_in_executor(None, credentials.refresh, Request())
+    return {'Authorization': f"Bearer {credentials.token}"} if credentials.token else {}
+
+class GCSSource(AsyncSession):
+    provider = "gcs"
+    cancel_token = None
+    throttle = None
+    # Bytes a streamed part holds in memory at once: one ranged GET's worth.
+    stream_window = PASSTHROUGH_STREAM_CHUNK
+
+    def __init__(self, bucket: str, blob_name: str):
+        self.client = gcs_client()
+        self.bucket = self.client.bucket(bucket)
+        self.blob = self.bucket.blob(blob_name)
+        self.blob.reload()
+        if self.blob.size is None:
+            raise FileNotFoundError(f"GCS object gs://{bucket}/{blob_name} not found")
+        self.size = self.blob.size
+        self._presigned_url = None
+
+    def get_size(self):
+        return self.size
+
+    def read_range(self, offset, length, buffer=None):
+        if buffer is not None:
+            writer = BufferWriter(memoryview(buffer)[:length], self.cancel_token, self.throttle)
+            self.blob.download_to_file(writer, start=offset, end=offset+length-1)
+            return writer.filled()
+        buffer = io.BytesIO()
+        target = (CancellableWriter(buffer, self.cancel_token, self.throttle)
+                  if self.cancel_token or self.throttle else buffer)
+        self.blob.download_to_file(target, start=offset, end=offset+length-1)
+        # getvalue() hands over the buffer's bytes; read() would copy the part again.
+        return buffer.getvalue()
+
+    async def read_range_async(self, offset, length, buffer=None):
+        headers = await _auth_headers(self.client)
+        headers.update({'Range': f"bytes={offset}-{offset + length - 1}",
+                        'x-goog-if-generation-match': str(self.blob.generation)})
+        url = _xml_url(self.client, self.bucket.name, self.blob.name)
+        async with self._async_session().get(url, headers=headers) as resp:
+            resp.raise_for_status()
+            return await read_chunks_async(resp.content.iter_any(), length, buffer, self.cancel_token, self.throttle)
+
+    def open_range(self, offset, length):
+        # Ranged GETs of at most PASSTHROUGH_STREAM_CHUNK bytes, each fetched
+        # as the upload reaches it and none reaching past the part's end.
+        end = offset + length
+        windows = (self.blob.download_as_bytes(start=start, end=min(start + PASSTHROUGH_STREAM_CHUNK, end) - 1)
+                   for start in range(offset, end, PASSTHROUGH_STREAM_CHUNK))
+        return RangeStream(ChunkReader(windows), length, self.cancel_token, throttle=self.throttle)
+
+    def identity(self):
+        return f"{self.size}:{self.blob.generation}"
+
+    def probe(self):
+        self.blob.reload()
+
+    def stored_checksums(self):
+        return _stored_checksums(self.blob)
+
+    def presigned_url(self):
+        # V4 signing needs credentials that can sign (a service account key or
+        # the IAM signBlob permission).
+        if self._presigned_url is None:
+            self._presigned_url = self.blob.generate_signed_url(
+                version="v4", method="GET", expiration=timedelta(seconds=PRESIGNED_URL_EXPIRY))
+        return self._presigned_url
+
+    def delete(self):
+        self.blob.delete()
+
+def _stored_checksums(blob):
+    # Every object has a CRC32C; composite objects have no MD5.
+    found = {}
+    if blob.crc32c:
+        found['crc32c'] = decode_crc32c(blob.crc32c)
+    if blob.md5_hash:
+        found['md5'] = base64.b64decode(blob.md5_hash)
+    return found
+
+# GCS accepts at most this many source objects per compose request.
+COMPOSE_FAN_IN = 32
+
+class GCSComposeTree:
+    """Composes uploaded parts into one object through a tree of composites.
+
+    Parts are combined in aligned groups of 32 into level-1 composites, those
+    into level-2 composites, and so on. A full group is composed as soon as its
+    last member lands, while later parts are still uploading; compose calls
+    run concurrently and consumed sources are deleted in the background, so
+    finishing costs about one round trip per remaining level. Up to
+    ``threads`` of each run at once; the pools start on first use, so
+    ``threads`` can still be lowered before then.
+    """
+
+    def __init__(self, bucket, prefix, threads=16):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._levels = []      # level -> {index: object name}
+        self._wide = set()     # levels known to hold more than one group
+        self._composes = {}    # (level, group) -> Future
+        self._deletes = []
+        self._created = set()  # temporary objects that may still exist
+        self.threads = threads
+        self._pool_lock = threading.Lock()
+        self._executor = self._cleanup = None
+
+    def _pools(self):
+        # Not under self._lock, which _submit_group already holds.
+        with self._pool_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="compose")
+                self._cleanup = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="compose-cleanup")
+            return self._executor, self._cleanup
+
+    def add(self, level, index, name):
+        with self._lock:
+            while len(self._levels) <= level:
+                self._levels.append({})
+            self._levels[level][index] = name
+            self._created.add(name)
+            if index >= COMPOSE_FAN_IN:
+                self._wide.add(level)
+            # Levels that fit in one compose go straight into the final object.
+            if level in self._wide:
+                for group in {0, index // COMPOSE_FAN_IN}:
+                    self._submit_group(level, group, (group + 1) * COMPOSE_FAN_IN)
+
+    def restore(self, level, index, name):
+        """Re-register an object found after a restart, with the groups it covers."""
+        done = Future()
+        done.set_result(None)
+        with self._lock:
+            while len(self._levels) <= level:
+                self._levels.append({})
+            self._levels[level][index] = name
+            self._created.add(name)
+            if index >= COMPOSE_FAN_IN:
+                self._wide.add(level)
+            span = 1
+            for lower in range(level - 1, -1, -1):
+                for group in range(index * span, (index + 1) * span):
+                    self._composes[(lower, group)] = done
+                span *= COMPOSE_FAN_IN
+
+    def finish(self, count, final_name):
+        level = 0
+        while count > COMPOSE_FAN_IN:
+            groups = -(-count // COMPOSE_FAN_IN)
+            with self._lock:
+                for group in range(groups):
+                    self._submit_group(level, group, count)
+                futures = [self._composes[(level, group)] for group in range(groups)]
+            for future in futures:
+                future.result()
+            level, count = level + 1, groups
+        with self._lock:
+            names = [self._levels[level][i] for i in range(count)]
+        self.bucket.blob(final_name).compose([self.bucket.blob(n) for n in names])
+        self._discard(names)
+        for future in list(self._deletes):
+            future.result()
+        self._shutdown()
+
+    def abort(self):
+        for future in list(self._composes.values()):
+            future.cancel()
+        self._pools()[0].shutdown(wait=True)
+        with self._lock:
+            leftovers = sorted(self._created)
+        self._discard(leftovers)
+        self._shutdown()
+
+    def _submit_group(self, level, group, count):
+        # Called with the lock held; ``count`` bounds the group when it is the tail.
+        if (level, group) in self._composes:
+            return
+        items = self._levels[level]
+        indexes = range(group * COMPOSE_FAN_IN, min(count, (group + 1) * COMPOSE_FAN_IN))
+        if not indexes or any(i not in items for i in indexes):
+            return
+        names = [items[i] for i in indexes]
+        self._composes[(level, group)] = self._pools()[0].submit(self._compose, level, group, names)
+
+    def _compose(self, level, group, names):
+        target = f"{self.prefix}L{level + 1}-{group}"
+        with self._lock:
+            self._created.add(target)
+        self.bucket.blob(target).compose([self.bucket.blob(n) for n in names])
+        logger.debug(f"Composed {len(names)} objects into {target}")
+        self.add(level + 1, group, target)
+        self._discard(names)
+
+    def _discard(self, names):
+        for name in names:
+            self._deletes.append(self._pools()[1].submit(self._delete, name))
+
+    def _delete(self, name):
+        try:
+            self.bucket.blob(name).delete()
+        except Exception:
+            pass
+        with self._lock:
+            self._created.discard(name)
+
+    def _shutdown(self):
+        for pool in self._pools():
+            pool.shutdown(wait=True)
+
+class GCSDest(AsyncSession):
+    provider = "gcs"
+    cancel_token = None
+    throttle = None
+    # The object written by put_object, if it was.
+    _whole_blob = None
+    # Set once the parts have been composed into the object.
+    completed = False
+    # {(first, last): crc32c} of the parts and composites a resumed upload already holds.
+    resumed_checksums = {}
+
+    def __init__(self, bucket, blob_name, compose_threads=16):
+        self.client = gcs_client()
+        self.bucket = self.client.bucket(bucket)
+        self.final_blob_name = blob_name
+        self.part_prefix = f"{blob_name}.part-{uuid.uuid4().hex}-"
+        self.part_count = 0
+        self.copied = False
+        self.consumed_source = False
+        self._rewrite_token = None
+        self._rewritten = 0
+        self._lock = threading.Lock()
+        self._tree = GCSComposeTree(self.bucket, self.part_prefix, threads=compose_threads)
+
+    @property
+    def compose_threads(self):
+        """Compose and cleanup requests run at once; lowered by a transfer to its upload threads."""
+        return self._tree.threads
+
+    @compose_threads.setter
+    def compose_threads(self, threads):
+        self._tree.threads = threads
+
+    def upload_part(self, part_number, data, checksum=None):
+        self.upload_part_stream(part_number, as_file(data), len(data), checksum)
+
+    def upload_part_stream(self, part_number, stream, length, checksum=None):
+        part_name = f"{self.part_prefix}{part_number}"
+        blob = self.bucket.blob(part_name)
+        if checksum is not None:
+            # GCS refuses to create the part object if its data does not match.
+            blob.crc32c = encode_crc32c(checksum)
+        blob.upload_from_file(throttled(stream, self.throttle), size=length)
+        with self._lock:
+            self.part_count += 1
+        self._tree.add(0, part_number - 1, part_name)
+
+    async def upload_part_async(self, part_number, data, checksum=None):
+        part_name = f"{self.part_prefix}{part_number}"
+        headers = await _auth_headers(self.client)
+        headers['Content-Length'] = str(len(data))
+        if checksum is not None:
+            # GCS refuses to create the part object if its data does not match.
+            headers['x-goog-hash'] = f"crc32c={encode_crc32c(checksum)}"
+        body = async_body(data, self.throttle) if self.throttle else data
+        async with self._async_session().put(_xml_url(self.client, self.bucket.name, part_name), data=body,
+                                             headers=headers) as resp:
+            resp.raise_for_status()
+        with self._lock:
+            self.part_count += 1
+        self._tree.add(0, part_number - 1, part_name)
+
+    def put_object(self, data, checksum=None):
+        """Write a small object in one upload, with no part objects to compose or delete."""
+        blob = self.bucket.blob(self.final_blob_name)
+        if checksum is not None:
+            blob.crc32c = encode_crc32c(checksum)
+        blob.upload_from_file(as_file(data, self.throttle), size=len(data))
+        self._whole_blob = blob
+
+    def session_state(self):
+        return {'part_prefix': self.part_prefix}
+
+    def resume(self, state, plan):
+        """Pick up the part objects under the prefix in ``state``; returns {part_number: size}.
+
+        Composites already built from earlier parts stand in for those parts,
+        and any part they cover that was not yet deleted is cleaned up.
+        """
+        self.part_prefix = state['part_prefix']
+        self._tree = GCSComposeTree(self.bucket, self.part_prefix, threads=self.compose_threads)
+        found = {}
+        for blob in self.client.list_blobs(self.bucket, prefix=self.part_prefix):
+            suffix = blob.name[len(self.part_prefix):]
+            m = re.fullmatch(r'L(\d+)-(\d+)', suffix)
+            if m:
+                found[(int(m.group(1)), int(m.group(2)))] = (blob.name, blob.size, blob.crc32c)
+            elif suffix.isdigit():
+                found[(0, int(suffix) - 1)] = (blob.name, blob.size, blob.crc32c)
+        top = max((level for level, _ in found), default=0)
+
+        def covered(level, index):
+            return any((higher, index // COMPOSE_FAN_IN ** (higher - level)) in found
+                       for higher in range(level + 1, top + 1))
+
+        lengths = {n: length for n, _, length in plan}
+        parts, stale, self.resumed_checksums = {}, [], {}
+        for (level, index), (name, size, crc) in found.items():
+            if covered(level, index):
+                stale.append(name)
+                continue
+            span = COMPOSE_FAN_IN ** level
+            first, last = index * span + 1, min((index + 1) * span, plan.num_parts)
+            if level == 0:
+                # A part of the wrong size is uploaded again under the same name.
+                if lengths.get(index + 1) != size:
+                    continue
+                self._tree.restore(0, index, name)
+                parts[index + 1] = size
+            else:
+                self._tree.restore(level, index, name)
+                for n in range(first, last + 1):
+                    parts[n] = lengths[n]
+            if crc:
+                # What GCS stored, to verify against the source before deleting it.
+                self.resumed_checksums[(first, last)] = decode_crc32c(crc)
+        self._tree._discard(stale)
+        self.part_count = len(parts)
+        return parts
+
+    def probe(self):
+        self.bucket.blob(self.final_blob_name).exists()
+
+    def existing(self):
+        """Size and stored checksums of an object already at the name, or None; one GET of its metadata."""
+        blob = self.bucket.blob(self.final_blob_name)
+        try:
+            blob.reload()
+        except (gcs_exceptions.NotFound, gcs_exceptions.Forbidden):
+            return None
+        return blob.size, _stored_checksums(blob)
+
+    def can_copy_from(self, src):
+        return getattr(src, "provider", None) == "gcs"
+
+    def copy_from(self, src, progress=None):
+        generation = src.blob.generation
+        if src.bucket.name == self.bucket.name:
+            # Same-bucket moves are an atomic rename, a metadata-only operation.
+            try:
+                self.bucket.move_blob(src.blob, self.final_blob_name, if_source_generation_match=generation)
+            except (gcs_exceptions.BadRequest, gcs_exceptions.MethodNotImplemented) as e:
+                logger.debug(f"Object move unavailable, falling back to rewrite: {e}")
+            else:
+                self.copied = self.consumed_source = True
+                if progress:
+                    progress(src.size)
+                return
+        # Rewrite copies server-side, possibly across locations and storage
+        # classes, over several calls chained by a continuation token. The token
+        # is kept so a retried call resumes where the last one stopped.
+        blob = self.bucket.blob(self.final_blob_name)
+        while True:
+            self._rewrite_token, rewritten, total = blob.rewrite(
+                src.blob, token=self._rewrite_token, if_source_generation_match=generation)
+            if progress:
+                progress(rewritten - self._rewritten)
+            self._rewritten = rewritten
+            logger.debug(f"Rewrote {rewritten} of {total} bytes")
+            if self._rewrite_token is None:
+                break
+        self.copied = True
+
+    def complete(self):
+        if self.copied or self._whole_blob is not None:
+            return
+        if self.part_count == 0:
+            self.bucket.blob(self.final_blob_name).upload_from_string(b"")
+            return
+        self._tree.finish(self.part_count, self.final_blob_name)
+        self.completed = True
+
+    def stored_checksums(self):
+        """Checksums of the completed object; compose derives its CRC32C from the parts'."""
+        if self._whole_blob is not None:
+            # The upload's response already carries them.
+            return _stored_checksums(self._whole_blob)
+        blob = self.bucket.blob(self.final_blob_name)
+        blob.reload()
+        return _stored_checksums(blob)
+
+    def abort(self):
+        self._tree.abort()
+        if self._whole_blob is not None:
+            # Written by put_object and then found not to match the source.
+            self._whole_blob.delete()
+        elif self.completed:
+            self.bucket.blob(self.final_blob_name).delete()
+
+class GCSLister:
+    def __init__(self, bucket):
+        self.client = gcs_client()
+        self.bucket = self.client.bucket(bucket)
+
+    def list_page(self, prefix, delimiter="/", token=None):
+        """One page of objects under ``prefix``: ``([(name, size)], sub-prefixes, next token)``."""
+        blobs = self.client.list_blobs(self.bucket, prefix=prefix, delimiter=delimiter, page_token=token)
+        page = next(blobs.pages, None)
+        if page is None:
+            return [], [], None
+        objects = [(blob.name, blob.size) for blob in page]
+        return objects, sorted(page.prefixes), blobs.next_page_token
+
+if not async_available():
+    # The asyncio engine runs the synchronous methods on its thread pool instead.
+    del GCSSource.read_range_async, GCSDest.upload_part_async
+
+Source, Dest, Lister = GCSSource, GCSDest, GCSLister
@@ -0,0 +1,302 @@
+"""AWS S3 source and destination handlers."""
+
+import logging
+import re
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import boto3
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import ClientError
+
+from ..buffers import RangeStream, as_file, async_body, throttled
+from ..cancel import read_chunks_async, read_stream, read_stream_into
+from ..checksums import crc32c, decode_crc32c, encode_crc32c
+from ..clients import AsyncSession, async_available, registry
+from . import PRESIGNED_URL_EXPIRY
+
+logger = logging.getLogger("cloudfile_mover")
+
+def s3_client():
+    return registry.get(("s3", None, None),
+                        lambda pool: boto3.client('s3', config=BotoConfig(max_pool_connections=pool)))
+
+class S3Source(AsyncSession):
+    provider = "s3"
+    cancel_token = None
+    throttle = None
+    etag = None
+    _head = {}
+
+    def __init__(self, bucket: str, key: str):
+        self.bucket, self.key = bucket, key
+        self.client = s3_client()
+        head = self._head = self.client.head_object(Bucket=bucket, Key=key, ChecksumMode='ENABLED')
+        self.size = head['ContentLength']
+        self.etag = head.get('ETag')
+        self._presigned_url = None
+
+    def get_size(self):
+        return self.size
+
+    def read_range(self, offset, length, buffer=None):
+        end = offset + length - 1
+        resp = self.client.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={offset}-{end}")
+        if buffer is None:
+            return read_stream(resp['Body'], length, self.cancel_token, throttle=self.throttle)
+        view = memoryview(buffer)[:length]
+        return view[:read_stream_into(resp['Body'], view, self.cancel_token, throttle=self.throttle)]
+
+    async def read_range_async(self, offset, length, buffer=None):
+        # A plain GET of a URL presigned locally, so the request runs on the event loop.
+        url = self.client.generate_presigned_url('get_object', Params={'Bucket': self.bucket, 'Key': self.key},
+                                                 ExpiresIn=PRESIGNED_URL_EXPIRY)
+        headers = {'Range': f"bytes={offset}-{offset + length - 1}"}
+        async with self._async_session().get(url, headers=headers) as resp:
+            resp.raise_for_status()
+            return await read_chunks_async(resp.content.iter_any(), length, buffer, self.cancel_token, self.throttle)
+
+    def open_range(self, offset, length):
+        end = offset + length - 1
+        resp = self.client.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={offset}-{end}")
+        return RangeStream(resp['Body'], length, self.cancel_token, throttle=self.throttle)
+
+    def identity(self):
+        return f"{self.size}:{self.etag}"
+
+    def probe(self):
+        self.client.head_object(Bucket=self.bucket, Key=self.key)
+
+    def stored_checksums(self):
+        """Whole-object checksums S3 holds for the source, from the HEAD in ``__init__``."""
+        return _stored_checksums(self._head)
+
+    def copy_source(self):
+        return {'Bucket': self.bucket, 'Key': self.key}
+
+    def presigned_url(self):
+        if self._presigned_url is None:
+            self._presigned_url = self.client.generate_presigned_url(
+                'get_object', Params={'Bucket': self.bucket, 'Key': self.key},
+                ExpiresIn=PRESIGNED_URL_EXPIRY)
+        return self._presigned_url
+
+    def delete(self):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key)
+
+def _stored_checksums(head):
+    found = {}
+    crc = head.get('ChecksumCRC32C')
+    # A composite checksum ("...-N") covers the original part layout, not the object.
+    if crc and head.get('ChecksumType', 'FULL_OBJECT') == 'FULL_OBJECT' and '-' not in crc:
+        found['crc32c'] = decode_crc32c(crc)
+    etag = (head.get('ETag') or '').strip('"')
+    # ETags are only derived from MD5s without SSE-KMS/SSE-C: the object's own
+    # for a single-part upload, or its parts' ("<md5 of part MD5s>-N").
+    if head.get('ServerSideEncryption') != 'aws:kms' and 'SSECustomerAlgorithm' not in head:
+        if re.fullmatch(r'[0-9a-f]{32}', etag):
+            found['md5'] = bytes.fromhex(etag)
+        elif re.fullmatch(r'[0-9a-f]{32}-\d+', etag):
+            found['etag'] = etag
+    return found
+
+class S3Dest(AsyncSession):
+    provider = "s3"
+    cancel_token = None
+    throttle = None
+    # Set before the first part to open the upload with full-object CRC32C checksums.
+    send_checksums = False
+    _checksummed = False
+    # Set once put_object has written the whole object.
+    whole_object = False
+    # Set once the multipart upload has been assembled into the object.
+    completed = False
+    # {(first, last): crc32c} of the parts a resumed upload already holds.
+    resumed_checksums = {}
+
+    def __init__(self, bucket, key):
+        self.bucket, self.key = bucket, key
+        self.client = s3_client()
+        self.upload_id = None
+        self.parts = []
+        self.copied = False
+        self._lock = threading.Lock()
+
+    def _ensure_upload(self):
+        # The multipart upload is only opened once a part needs it, so
+        # single-request copies never leave an empty upload behind.
+        with self._lock:
+            if self.upload_id is None:
+                extra = {}
+                if self.send_checksums:
+                    extra = {'ChecksumAlgorithm': 'CRC32C', 'ChecksumType': 'FULL_OBJECT'}
+                    self._checksummed = True
+                self.upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key,
+                                                                     **extra)['UploadId']
+            return self.upload_id
+
+    def upload_part(self, part_number, data, checksum=None):
+        upload_id = self._ensure_upload()
+        extra = {}
+        if self._checksummed:
+            # S3 rejects the part (BadDigest, retried) if it arrives corrupted;
+            # without a precomputed value botocore hashes it itself.
+            extra = ({'ChecksumCRC32C': encode_crc32c(checksum)} if checksum is not None
+                     else {'ChecksumAlgorithm': 'CRC32C'})
+        resp = self.client.upload_part(Bucket=self.bucket, Key=self.key,
+                                       UploadId=upload_id, PartNumber=part_number,
+                                       Body=(data if isinstance(data, bytes) and not self.throttle
+                                             else as_file(data, self.throttle)), **extra)
+        self._add_part(part_number, resp)
+
+    async def upload_part_async(self, part_number, data, checksum=None):
+        if self.upload_id is None:
+            import asyncio
+            # Once per upload, and usually already done for the resume journal.
+            await asyncio.get_running_loop().run_in_executor(None, self._ensure_upload)
+        params = {'Bucket': self.bucket, 'Key': self.key, 'UploadId': self.upload_id, 'PartNumber': part_number}
+        if self._checksummed:
+            params['ChecksumCRC32C'] = encode_crc32c(checksum if checksum is not None else crc32c(data))
+        url = self.client.generate_presigned_url('upload_part', Params=params, ExpiresIn=PRESIGNED_URL_EXPIRY)
+        headers = {'Content-Length': str(len(data))}
+        signed = parse_qs(urlsplit(url).query).get('X-Amz-SignedHeaders', [''])[0].split(';')
+        if 'x-amz-checksum-crc32c' in signed:
+            # SigV4 signs the checksum as a header the PUT must carry; SigV2 moves it into the query.
+            headers['x-amz-checksum-crc32c'] = params['ChecksumCRC32C']
+        body = async_body(data, self.throttle) if self.throttle else data
+        async with self._async_session().put(url, data=body, headers=headers) as resp:
+            resp.raise_for_status()
+            self._add_part(part_number, {'ETag': resp.headers['ETag'],
+                                         'ChecksumCRC32C': resp.headers.get('x-amz-checksum-crc32c')})
+
+    def _add_part(self, part_number, resp):
+        part = {'ETag': resp['ETag'].strip('"'), 'PartNumber': part_number}
+        if resp.get('ChecksumCRC32C'):
+            part['ChecksumCRC32C'] = resp['ChecksumCRC32C']
+        self.parts.append(part)
+
+    def put_object(self, data, checksum=None):
+        """Write a small object in one PutObject, with no multipart upload at all."""
+        extra = {'ChecksumCRC32C': encode_crc32c(checksum)} if checksum is not None else {}
+        self.client.put_object(Bucket=self.bucket, Key=self.key,
+                               Body=(data if isinstance(data, bytes) and not self.throttle
+                                     else as_file(data, self.throttle)), **extra)
+        self.whole_object = True
+
+    def upload_part_stream(self, part_number, stream, length):
+        upload_id = self._ensure_upload()
+        extra = {'ChecksumAlgorithm': 'CRC32C'} if self._checksummed else {}
+        resp = self.client.upload_part(Bucket=self.bucket, Key=self.key,
+                                       UploadId=upload_id, PartNumber=part_number,
+                                       Body=throttled(stream, self.throttle), ContentLength=length, **extra)
+        self._add_part(part_number, resp)
+
+    def probe(self):
+        # A 404 (or 403 without s3:ListBucket) still leaves a warm connection.
+        self.client.head_object(Bucket=self.bucket, Key=self.key)
+
+    def existing(self):
+        """Size and stored checksums of an object already at the key, or None; one HEAD."""
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.key, ChecksumMode='ENABLED')
+        except ClientError as e:
+            # Without s3:ListBucket a missing key is a 403.
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', '403', 'AccessDenied'):
+                return None
+            raise
+        return head['ContentLength'], _stored_checksums(head)
+
+    def can_copy_from(self, src):
+        return getattr(src, "provider", None) == "s3"
+
+    def copy_part(self, part_number, src, offset, length):
+        # UploadPartCopy: S3 copies the byte range server-side, across buckets
+        # and regions, without the data passing through this host.
+        extra = {'CopySourceIfMatch': src.etag} if src.etag else {}
+        resp = self.client.upload_part_copy(Bucket=self.bucket, Key=self.key,
+                                            UploadId=self._ensure_upload(), PartNumber=part_number,
+                                            CopySource=src.copy_source(),
+                                            CopySourceRange=f"bytes={offset}-{offset + length - 1}",
+                                            **extra)
+        etag = resp['CopyPartResult']['ETag'].strip('"')
+        self.parts.append({'ETag': etag, 'PartNumber': part_number})
+
+    def session_state(self):
+        return {'upload_id': self._ensure_upload()}
+
+    def resume(self, state, plan):
+        """Reattach to the multipart upload in ``state``; returns {part_number: size}."""
+        self.upload_id = state.get('upload_id')
+        found, self.resumed_checksums = {}, {}
+        try:
+            paginator = self.client.get_paginator('list_parts')
+            for page in paginator.paginate(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id):
+                # Parts must match the checksum mode the upload was opened with.
+                self._checksummed = page.get('ChecksumAlgorithm') == 'CRC32C'
+                for part in page.get('Parts', []):
+                    found[part['PartNumber']] = part['Size']
+                    self._add_part(part['PartNumber'], part)
+                    if part.get('ChecksumCRC32C'):
+                        # What S3 stored, to verify against the source before deleting it.
+                        self.resumed_checksums[(part['PartNumber'], part['PartNumber'])] = \
+                            decode_crc32c(part['ChecksumCRC32C'])
+        except self.client.exceptions.NoSuchUpload:
+            logger.info("Previous multipart upload no longer exists; starting over.")
+            self.upload_id, self.parts = None, []
+            return {}
+        return found
+
+    def copy_from(self, src, progress=None):
+        extra = {'CopySourceIfMatch': src.etag} if src.etag else {}
+        self.client.copy_object(Bucket=self.bucket, Key=self.key, CopySource=src.copy_source(), **extra)
+        self.copied = True
+        if progress:
+            progress(src.size)
+
+    def complete(self, checksum=None):
+        if self.whole_object:
+            return
+        if self.copied or not self.parts:
+            # An upload opened up front for the resume journal was never needed.
+            self.abort()
+            if not self.copied:
+                self.client.put_object(Bucket=self.bucket, Key=self.key, Body=b"")
+            return
+        # A part uploaded again after a resume replaces the listed one.
+        parts = {p['PartNumber']: p for p in self.parts}
+        self.parts = [parts[n] for n in sorted(parts)]
+        extra = {}
+        if self._checksummed and checksum is not None:
+            # S3 refuses to assemble an object whose CRC32C differs from the
+            # one combined from the data that was read.
+            extra = {'ChecksumCRC32C': encode_crc32c(checksum), 'ChecksumType': 'FULL_OBJECT'}
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key,
+                                              UploadId=self.upload_id,
+                                              MultipartUpload={'Parts': self.parts}, **extra)
+        self.completed = True
+
+    def abort(self):
+        if self.upload_id is not None and not self.completed:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        if self.whole_object or self.completed:
+            # Written, and then found not to match the source.
+            self.client.delete_object(Bucket=self.bucket, Key=self.key)
+
+class S3Lister:
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.client = s3_client()
+
+    def list_page(self, prefix, delimiter="/", token=None):
+        """One page of keys under ``prefix``: ``([(key, size)], sub-prefixes, next token)``."""
+        extra = {'ContinuationToken': token} if token else {}
+        resp = self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix, Delimiter=delimiter, **extra)
+        objects = [(obj['Key'], obj['Size']) for obj in resp.get('Contents', [])]
+        prefixes = [p['Prefix'] for p in resp.get('CommonPrefixes', [])]
+        return objects, prefixes, resp.get('NextContinuationToken')
+
+if not async_available():
+    # The asyncio engine runs the synchronous methods on its thread pool instead.
+    del S3Source.read_range_async, S3Dest.upload_part_async
+
+Source, Dest, Lister = S3Source, S3Dest, S3Lister
@@ -0,0 +1,193 @@
+"""Process-wide bandwidth limits enforced with token buckets."""
+
+import re
+import threading
+import time
+
+from .planner import parse_size
+
+# A bucket holds this many seconds of traffic, which bounds bursts after an idle spell.
+BURST_SECONDS = 0.1
+
+DIRECTIONS = ("read", "write")
+
+_BITS_RE = re.compile(r"^\s*([\d.]+)\s*([KMGT]?)(?:bit|bps|b/s)\s*$", re.IGNORECASE)
+_BIT_UNITS = {"": 1, "K": 10 ** 3, "M": 10 ** 6, "G": 10 ** 9, "T": 10 ** 12}
+# "2Gb" is gigabits to a network engineer and bytes to parse_size; it is refused.
+_AMBIGUOUS_RE = re.compile(r"^\s*[\d.]+\s*[KMGTkmgt]?[iI]?b\s*$")
+
+
+def parse_rate(value):
+    """Parse a rate in bytes per second such as ``"200MiB"``, or bits with ``"2Gbit"``.
+
+    Bit rates use decimal units, as network links are quoted. ``None``,
+    ``0`` and ``"unlimited"`` mean no limit and are returned as ``None``.
+    """
+    if value is None or (isinstance(value, str) and value.strip().lower() in ("", "unlimited", "none")):
+        return None
+    if isinstance(value, str) and _AMBIGUOUS_RE.match(value):
+        raise ValueError(f"Ambiguous rate {value!r}: write bits as '2Gbit' or bytes as '2GB' or '2GiB'")
+    m = _BITS_RE.match(value) if isinstance(value, str) else None
+    rate = int(float(m.group(1)) * _BIT_UNITS[m.group(2).upper()] / 8) if m else parse_size(value)
+    if rate == "auto":
+        raise ValueError(f"Invalid rate: {value!r}")
+    return rate or None
+
+
+class TokenBucket:
+    """Byte-granular token bucket refilled at ``rate`` bytes per second.
+
+    ``consume`` never refuses: it takes the bytes (going into debt when the
+    bucket is short) and sleeps until the debt is paid off, so callers that
+    consume block by block are paced smoothly. ``set_rate`` takes effect
+    for the next call.
+    """
+
+    def __init__(self, rate, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stamp = clock()
+        self.rate = None
+        self._tokens = 0.0
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            if rate:
+                self._tokens = min(self._tokens, rate * BURST_SECONDS)
+
+    def _refill(self):
+        now = self._clock()
+        if self.rate:
+            self._tokens = min(self.rate * BURST_SECONDS, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def reserve(self, nbytes):
+        """Take ``nbytes``; returns the seconds to wait before sending them."""
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            self._refill()
+            self._tokens -= nbytes
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def consume(self, nbytes, cancel_token=None):
+        delay = self.reserve(nbytes)
+        if delay > 0:
+            if cancel_token:
+                cancel_token.wait(delay)
+            else:
+                time.sleep(delay)
+
+
+class BandwidthLimiter:
+    """Token buckets keyed by provider and direction (``"read"`` or ``"write"``).
+
+    A limit may be set globally, per direction, per provider or per provider
+    and direction. Bytes are charged to every bucket that matches, so the
+    tightest applicable limit wins. Limits can be changed at any time,
+    including while transfers are running.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def set_limit(self, rate, provider=None, direction=None):
+        """Limit matching traffic to ``rate`` (see ``parse_rate``); ``None`` removes the limit."""
+        if direction not in (None,) + DIRECTIONS:
+            raise ValueError(f"Direction must be 'read' or 'write', got {direction!r}")
+        rate = parse_rate(rate)
+        key = (provider, direction)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if rate is None:
+                self._buckets.pop(key, None)
+            elif bucket is None:
+                self._buckets[key] = TokenBucket(rate)
+            else:
+                bucket.set_rate(rate)
+
+    def limits(self):
+        """The configured limits in bytes per second, keyed by ``(provider, direction)``."""
+        with self._lock:
+            return {key: bucket.rate for key, bucket in self._buckets.items()}
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def reserve(self, provider, direction, nbytes):
+        """Charge ``nbytes`` to every matching bucket; returns the seconds to wait before sending them."""
+        if not self._buckets:
+            return 0.0
+        # A set, so a bucket is charged once even for traffic with no provider.
+        with self._lock:
+            buckets = [self._buckets.get(key) for key in
+                       {(None, None), (None, direction), (provider, None), (provider, direction)}]
+        return max([bucket.reserve(nbytes) for bucket in buckets if bucket is not None], default=0.0)
+
+    def consume(self, provider, direction, nbytes, cancel_token=None):
+        delay = self.reserve(provider, direction, nbytes)
+        if delay > 0:
+            if cancel_token:
+                cancel_token.wait(delay)
+            else:
+                time.sleep(delay)
+
+    def throttle(self, provider, direction, cancel_token=None):
+        return Throttle(self, provider, direction, cancel_token)
+
+
+class Throttle:
+    """The limits that apply to one handler's traffic in one direction."""
+
+    def __init__(self, limiter, provider, direction, cancel_token=None):
+        self.limiter, self.provider, self.direction = limiter, provider, direction
+        self.cancel_token = cancel_token
+
+    def __bool__(self):
+        # False while no limit is configured, so handlers skip the accounting.
+        return bool(self.limiter._buckets)
+
+    def consume(self, nbytes):
+        self.limiter.consume(self.provider, self.direction, nbytes, self.cancel_token)
+
+    async def consume_async(self, nbytes):
+        # For handlers running on an event loop: the wait must not block it.
+        delay = self.limiter.reserve(self.provider, self.direction, nbytes)
+        if delay > 0:
+            import asyncio
+            await asyncio.sleep(delay)
+
+
+limiter = BandwidthLimiter()
+set_bandwidth_limit = limiter.set_limit
+
+
+def load_limits(path, target=limiter):
+    """Replace ``target``'s limits with those listed in ``path``, one spec per line.
+
+    Blank lines and lines starting with ``#`` are ignored. Nothing changes
+    unless every line parses.
+    """
+    with open(path) as f:
+        specs = [parse_limit_spec(line.strip()) for line in f if line.strip() and not line.lstrip().startswith("#")]
+    target.clear()
+    for rate, provider, direction in specs:
+        target.set_limit(rate, provider, direction)
+
+
+def parse_limit_spec(spec):
+    """Parse a CLI limit such as ``"2Gbit"``, ``"write=2Gbit"`` or ``"s3:read=500MiB"``.
+
+    Returns ``(rate, provider, direction)`` for ``set_limit``.
+    """
+    scope, _, rate = spec.rpartition("=")
+    provider, _, direction = scope.rpartition(":")
+    if direction and direction not in DIRECTIONS:
+        # "s3=1Gbit" names a provider, not a direction.
+        provider, direction = direction, ""
+    return parse_rate(rate), provider or None, direction or None
@@ -0,0 +1,187 @@
+"""Retry policy with error classification and full-jitter back-off."""
+
+import logging
+import random
+import time
+from collections import namedtuple
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger("cloudfile_mover")
+
+# HTTP statuses worth retrying: timeouts, throttling and server-side failures.
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+THROTTLING_STATUSES = {429, 503}
+
+# Provider error codes that mean "slow down" (S3, GCS and Azure spellings).
+THROTTLING_CODES = {
+    "SlowDown", "Throttling", "ThrottlingException", "RequestLimitExceeded", "TooManyRequests",
+    "ServerBusy", "rateLimitExceeded", "userRateLimitExceeded", "OperationTimedOut",
+}
+RETRYABLE_CODES = THROTTLING_CODES | {
+    "RequestTimeout", "InternalError", "ServiceUnavailable", "InternalServerError", "BadDigest",
+    "IncompleteBody", "backendError",
+}
+
+# Exception class names raised by the SDKs and their HTTP stacks when a
+# connection drops or times out; matched by name so no SDK has to be imported.
+_TRANSIENT_NAMES = (
+    "ConnectionError", "ConnectionClosedError", "EndpointConnectionError", "ReadTimeoutError",
+    "ConnectTimeoutError", "ProtocolError", "IncompleteRead", "RemoteDisconnected", "ChunkedEncodingError",
+    "ServiceRequestError", "ServiceResponseError", "ResponseStreamingError", "Timeout",
+)
+
+ErrorInfo = namedtuple("ErrorInfo", ["retryable", "throttled", "retry_after"])
+
+
+def classify(error):
+    """Classify ``error`` as retryable and/or throttling, with any Retry-After hint.
+
+    Errors carrying an HTTP status or provider error code are judged on it:
+    throttling, timeouts and 5xx are retried while other 4xx fail at once.
+    Connection resets and timeouts are retried. Anything unrecognised is
+    retried too, as it was before errors were classified.
+    """
+    status, code, headers = _describe(error)
+    retry_after = _retry_after(headers)
+    throttled = code in THROTTLING_CODES or status in THROTTLING_STATUSES
+    if code is not None and code in RETRYABLE_CODES:
+        return ErrorInfo(True, throttled, retry_after)
+    if status is not None:
+        return ErrorInfo(status in RETRYABLE_STATUSES, throttled, retry_after)
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return ErrorInfo(True, False, None)
+    if any(cls.__name__.endswith(_TRANSIENT_NAMES) for cls in type(error).__mro__):
+        return ErrorInfo(True, False, None)
+    return ErrorInfo(True, False, retry_after)
+
+
+def _describe(error):
+    # botocore ClientError
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        meta = response.get("ResponseMetadata", {})
+        return meta.get("HTTPStatusCode"), response.get("Error", {}).get("Code"), meta.get("HTTPHeaders") or {}
+    # azure.core HttpResponseError
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        headers = getattr(response, "headers", None) or {}
+        return status, getattr(error, "error_code", None), headers
+    # google.api_core GoogleAPICallError
+    status = getattr(error, "code", None)
+    if isinstance(status, int) and "google" in type(error).__module__:
+        headers = getattr(response, "headers", None) or {}
+        reason = getattr(error, "reason", None)
+        return status, reason, headers
+    # aiohttp ClientResponseError, from the handlers' async methods
+    status = getattr(error, "status", None)
+    if isinstance(status, int) and type(error).__module__.startswith("aiohttp"):
+        return status, None, getattr(error, "headers", None) or {}
+    return None, None, {}
+
+
+def _retry_after(headers):
+    try:
+        millis = headers.get("x-ms-retry-after-ms")
+        value = headers.get("Retry-After") or headers.get("retry-after")
+    except AttributeError:
+        return None
+    if millis is not None:
+        return _to_float(millis, 1000.0)
+    if value is None:
+        return None
+    seconds = _to_float(value, 1.0)
+    if seconds is not None:
+        return seconds
+    # Retry-After may also be an HTTP date.
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value, divisor):
+    try:
+        return max(0.0, float(value) / divisor)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryError(RuntimeError):
+    """Raised once an operation has failed for good."""
+
+
+class RetryPolicy:
+    """Retries one operation with capped exponential back-off and full jitter.
+
+    Each delay is drawn uniformly from ``[0, min(max_delay, base_delay * 2**n)]``,
+    which spreads retries from many workers instead of having them hit a
+    throttled endpoint in lockstep. A Retry-After hint from the server is used
+    as the minimum delay, and throttling errors start from a longer base.
+    """
+
+    def __init__(self, max_attempts=5, base_delay=0.5, max_delay=30.0, throttle_base_delay=2.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.throttle_base_delay = throttle_base_delay
+
+    def delay(self, attempt, info):
+        base = self.throttle_base_delay if info.throttled else self.base_delay
+        delay = random.uniform(0, min(self.max_delay, base * (2 ** attempt)))
+        if info.retry_after is not None:
+            delay = max(delay, min(info.retry_after, self.max_delay))
+        return delay
+
+    def call(self, action, description, cancel_token=None, on_retry=None):
+        """Run ``action`` until it succeeds, fails permanently or runs out of attempts.
+
+        ``on_retry(error, info)`` is called before each retry, and
+        ``cancel_token`` stops retrying (and cuts the back-off short) once the
+        transfer has been cancelled.
+        """
+        for attempt in range(self.max_attempts):
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            try:
+                return action()
+            except Exception as e:
+                if cancel_token:
+                    cancel_token.raise_if_cancelled()
+                info = classify(e)
+                if not info.retryable:
+                    raise RetryError(f"Failed to {description}: {e}") from e
+                if attempt + 1 == self.max_attempts:
+                    raise RetryError(f"Failed to {description} after {self.max_attempts} attempts") from e
+                if on_retry:
+                    on_retry(e, info)
+                delay = self.delay(attempt, info)
+                logger.warning(f"Retry {description}, attempt {attempt+1} in {delay:.1f}s: {e}")
+                if cancel_token:
+                    cancel_token.wait(delay)
+                else:
+                    time.sleep(delay)
+
+    async def call_async(self, action, description, cancel_token=None, on_retry=None):
+        """Like ``call`` for a coroutine function ``action``, sleeping without blocking the loop.
+
+        Cancelling the awaiting task cuts the back-off short.
+        """
+        import asyncio  # kept out of module import time, which the CLI pays on every launch
+        for attempt in range(self.max_attempts):
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            try:
+                return await action()
+            except Exception as e:
+                if cancel_token:
+                    cancel_token.raise_if_cancelled()
+                info = classify(e)
+                if not info.retryable:
+                    raise RetryError(f"Failed to {description}: {e}") from e
+                if attempt + 1 == self.max_attempts:
+                    raise RetryError(f"Failed to {description} after {self.max_attempts} attempts") from e
+                if on_retry:
+                    on_retry(e, info)
+                delay = self.delay(attempt, info)
+                logger.warning(f"Retry {description}, attempt {attempt+1} in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
@@ -17,6 +17,10 @@ setup(
         "azure-identity",
         "tqdm"
     ],
+    extras_require={
+        # Native asyncio requests in the built-in handlers, for move_file_async.
+        "async": ["aiohttp"]
+    },
     entry_points={
         "console_scripts": [
             "cloudfile-mover = cloudfile_mover.__main__:main"
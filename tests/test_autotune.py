@@ -0,0 +1,84 @@
+import threading
+import time
+from cloudfile_mover import autotune, pipeline, planner
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+def window(tuner, clock, nbytes, latency=0.1):
+    clock.now += tuner.interval
+    tuner.record(nbytes, latency)
+
+def test_ramps_up_while_throughput_grows():
+    clock = Clock()
+    tuner = autotune.ConcurrencyTuner("upload", max_workers=6, initial=2, clock=clock)
+    for step in range(1, 8):
+        window(tuner, clock, step * 1000)
+    assert tuner.limit == 6
+
+def test_gives_back_a_step_that_did_not_pay_off():
+    clock = Clock()
+    tuner = autotune.ConcurrencyTuner("upload", max_workers=16, initial=4, clock=clock)
+    window(tuner, clock, 1000)
+    assert tuner.limit == 5
+    window(tuner, clock, 1000)
+    assert tuner.limit == 4
+
+def test_backs_off_on_throttling_within_bounds():
+    clock = Clock()
+    tuner = autotune.ConcurrencyTuner("download", max_workers=16, min_workers=3, initial=12, clock=clock)
+    tuner.throttled()
+    assert tuner.limit == 6
+    # Retries of the same burst count once, and hold the limit for the window.
+    clock.now += autotune.THROTTLE_COOLDOWN / 2
+    tuner.throttled()
+    assert tuner.limit == 6
+    window(tuner, clock, 1000)
+    assert tuner.limit == 6
+    clock.now += autotune.THROTTLE_COOLDOWN
+    tuner.throttled()
+    tuner.throttled()
+    assert tuner.limit == 3
+
+def test_slots_are_limited():
+    tuner = autotune.ConcurrencyTuner("upload", max_workers=8, initial=1)
+    assert tuner.try_acquire()
+    assert not tuner.try_acquire()
+    tuner.release()
+    assert tuner.try_acquire()
+
+class Source:
+    cancel_token = None
+    def __init__(self, data):
+        self.data = data
+    def read_range(self, offset, length):
+        return self.data[offset:offset + length]
+
+class CountingDest:
+    cancel_token = None
+    def __init__(self):
+        self.parts = {}
+        self.active = self.peak = 0
+        self.lock = threading.Lock()
+    def upload_part(self, part_number, data):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.002)
+        self.parts[part_number] = bytes(data)
+        with self.lock:
+            self.active -= 1
+
+def test_pipeline_respects_tuned_limit():
+    data = bytes(range(256)) * 64
+    dest = CountingDest()
+    run = pipeline.TransferPipeline(Source(data), dest, planner.PartPlan(len(data), 512),
+                                    download_threads=8, upload_threads=8, autotune=True)
+    run.tuners["upload"].limit = 2
+    run.tuners["upload"].interval = 60
+    run.run()
+    assert b"".join(dest.parts[n] for n in sorted(dest.parts)) == data
+    assert dest.peak <= 2
@@ -0,0 +1,82 @@
+import threading
+import time
+import pytest
+from cloudfile_mover import batch, core
+from cloudfile_mover.retry import RetryPolicy
+
+def test_read_manifest(tmp_path):
+    path = tmp_path / "manifest.jsonl"
+    path.write_text('{"src": "s3://a/1", "dst": "gs://b/1"}\n\n{"src": "s3://a/2", "dst": "gs://b/2"}\n')
+    assert list(batch.read_manifest(str(path))) == [("s3://a/1", "gs://b/1"), ("s3://a/2", "gs://b/2")]
+    path.write_text('{"src": "s3://a/1", "dst": "gs://b/1"}\n{"src": "s3://a/2"}\n')
+    with pytest.raises(ValueError, match="line 2"):
+        list(batch.read_manifest(str(path)))
+
+class Store:
+    """In-memory objects, counting the uploads in flight across every transfer."""
+    def __init__(self, objects):
+        self.objects = objects
+        self.lock = threading.Lock()
+        self.active = self.peak = self.peak_threads = 0
+
+    def source(self, bucket, key):
+        store = self
+        class Source:
+            provider = "mem"
+            cancel_token = throttle = None
+            def get_size(self):
+                return len(store.objects[key])
+            def read_range(self, offset, length):
+                if key == "broken":
+                    raise ValueError("unreadable")
+                return store.objects[key][offset:offset + length]
+            def delete(self):
+                del store.objects[key]
+        return Source()
+
+    def dest(self, bucket, key):
+        store = self
+        class Dest:
+            cancel_token = throttle = None
+            parts = {}
+            def upload_part(self, part_number, data):
+                with store.lock:
+                    store.active += 1
+                    store.peak = max(store.peak, store.active)
+                    store.peak_threads = max(store.peak_threads, threading.active_count())
+                time.sleep(0.01)
+                with store.lock:
+                    store.active -= 1
+                self.parts[part_number] = data
+            def complete(self):
+                store.objects["moved/" + key] = b"".join(self.parts[n] for n in sorted(self.parts))
+            def abort(self):
+                pass
+        return Dest()
+
+def test_batch_shares_request_slots_across_files(monkeypatch):
+    store = Store({f"obj-{n}": bytes([n]) * 4096 for n in range(6)})
+    store.objects["broken"] = b"x" * 10
+    monkeypatch.setattr(core, "parse_cloud_url", lambda url: ("gcs", "bucket", url.rsplit("/", 1)[-1]))
+    monkeypatch.setattr(core, "GCSSource", store.source)
+    monkeypatch.setattr(core, "GCSDest", store.dest)
+    pairs = [(f"gs://bucket/{key}", f"gs://bucket/moved/{key}") for key in list(store.objects)]
+    result = batch.move_batch(iter(pairs), files=4, threads=4, total_threads=2, chunk_size="1KiB",
+                              show_progress=False, verify_checksums=False, hedge_tail=False,
+                              retry=RetryPolicy(max_attempts=1))
+    assert result["moved"] == 6 and list(result["failed"]) == ["gs://bucket/broken"]
+    assert store.objects["moved/obj-3"] == bytes([3]) * 4096 and "obj-3" not in store.objects
+    assert store.peak <= 2
+
+def test_batch_caps_each_object_pools_at_the_shared_limit(monkeypatch):
+    store = Store({f"obj-{n}": bytes([n]) * 8192 for n in range(4)})
+    monkeypatch.setattr(core, "parse_cloud_url", lambda url: ("gcs", "bucket", url.rsplit("/", 1)[-1]))
+    monkeypatch.setattr(core, "GCSSource", store.source)
+    monkeypatch.setattr(core, "GCSDest", store.dest)
+    pairs = [(f"gs://bucket/{key}", f"gs://bucket/moved/{key}") for key in list(store.objects)]
+    before = threading.active_count()
+    result = batch.move_batch(iter(pairs), files=4, threads=32, upload_threads=32, total_threads=2,
+                              chunk_size="1KiB", show_progress=False, verify_checksums=False, hedge_tail=False)
+    assert result["moved"] == 4
+    # 4 file threads and 2 + 2 workers per object, rather than 4 * 64 workers.
+    assert store.peak_threads - before <= 4 + 4 * 4
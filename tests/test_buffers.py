@@ -0,0 +1,135 @@
+import io
+from cloudfile_mover import buffers, memory, pipeline, planner
+from cloudfile_mover.providers import s3
+
+def test_buffer_reader_reads_and_seeks_without_copying_the_view():
+    data = bytearray(b"0123456789")
+    reader = buffers.BufferReader(memoryview(data)[2:8])
+    assert len(reader) == 6
+    assert reader.read(3) == b"234"
+    reader.seek(0)
+    assert reader.read() == b"234567"
+    assert reader.seek(0, io.SEEK_END) == 6 and reader.read() == b""
+
+def test_buffer_writer_fills_view_in_place():
+    buffer = bytearray(8)
+    writer = buffers.BufferWriter(memoryview(buffer)[:6])
+    writer.write(b"abc")
+    writer.write(b"def")
+    assert bytes(writer.filled()) == b"abcdef" and buffer[:6] == b"abcdef"
+
+class BufferSource:
+    cancel_token = None
+    def __init__(self, data):
+        self.data, self.seen = data, set()
+    def read_range(self, offset, length, buffer=None):
+        self.seen.add(id(buffer))
+        buffer[:length] = self.data[offset:offset + length]
+        return memoryview(buffer)[:length]
+
+class CopyingDest:
+    cancel_token = None
+    def __init__(self):
+        self.parts = {}
+    def upload_part(self, part_number, data):
+        assert isinstance(data, memoryview)
+        self.parts[part_number] = bytes(data)
+
+def test_pipeline_recycles_a_bounded_set_of_buffers():
+    data = bytes(range(256)) * 256  # 64 KiB in 64 parts
+    src, dest = BufferSource(data), CopyingDest()
+    p = pipeline.TransferPipeline(src, dest, planner.PartPlan(len(data), 1024),
+                                  download_threads=2, upload_threads=2, read_ahead=2)
+    p.run()
+    assert b"".join(dest.parts[n] for n in sorted(dest.parts)) == data
+    assert len(src.seen) <= 6 and p.buffers._allocated <= 6
+
+class FakeS3:
+    def __init__(self, data):
+        self.data = data
+    def get_object(self, Bucket, Key, Range):
+        start, end = map(int, Range[len("bytes="):].split("-"))
+        return {"Body": io.BytesIO(self.data[start:end + 1])}
+
+def test_s3_source_reads_range_into_buffer():
+    source = s3.S3Source.__new__(s3.S3Source)
+    source.client, source.bucket, source.key = FakeS3(b"abcdefghij"), "b", "k"
+    buffer = bytearray(8)
+    view = source.read_range(2, 5, buffer=buffer)
+    assert bytes(view) == b"cdefg" and view.obj is buffer
+
+def test_range_stream_caps_reads_and_detects_short_responses():
+    stream = buffers.RangeStream(io.BytesIO(b"abcdef"), 4, window=3)
+    assert stream.read() == b"abc" and stream.read() == b"d" and stream.read() == b""
+    short = buffers.RangeStream(io.BytesIO(b"ab"), 4)
+    short.read()
+    import pytest
+    with pytest.raises(ConnectionError):
+        short.read()
+
+def test_chunk_reader_reads_across_chunks():
+    reader = buffers.ChunkReader([b"abc", b"de"])
+    assert reader.read(2) == b"ab" and reader.read(5) == b"c" and reader.read() == b"de" and reader.read() == b""
+
+class StreamingSource:
+    cancel_token = None
+    def __init__(self, data):
+        self.data, self.opened = data, 0
+    def read_range(self, offset, length):
+        raise AssertionError("passthrough must not buffer whole parts")
+    def open_range(self, offset, length):
+        self.opened += 1
+        return buffers.RangeStream(io.BytesIO(self.data[offset:offset + length]), length, window=256)
+
+class StreamingDest:
+    cancel_token = None
+    def __init__(self):
+        self.parts, self.largest_read, self.failed = {}, 0, False
+    def upload_part_stream(self, part_number, stream, length):
+        pieces = []
+        while True:
+            piece = stream.read(4096)
+            if not piece:
+                break
+            self.largest_read = max(self.largest_read, len(piece))
+            pieces.append(piece)
+            if part_number == 2 and not self.failed:
+                self.failed = True
+                raise ConnectionError("reset")
+        self.parts[part_number] = b"".join(pieces)
+
+def test_passthrough_pipes_parts_through_a_small_window(monkeypatch):
+    monkeypatch.setattr(pipeline.CancellationToken, "wait", lambda self, timeout: False)
+    data = bytes(range(256)) * 32  # 8 KiB in 2 KiB parts
+    src, dest = StreamingSource(data), StreamingDest()
+    p = pipeline.TransferPipeline(src, dest, planner.PartPlan(len(data), 2048), upload_threads=2, passthrough=True)
+    p.run()
+    assert b"".join(dest.parts[n] for n in sorted(dest.parts)) == data
+    assert dest.largest_read == 256
+    # The failed part was streamed again from a fresh source response.
+    assert src.opened == 5 and p.retries["upload"] == 1
+
+def test_gcs_streamed_range_stays_inside_the_part(monkeypatch):
+    from cloudfile_mover.providers import gcs
+    monkeypatch.setattr(gcs, "PASSTHROUGH_STREAM_CHUNK", 1000)
+    data = bytes(range(256)) * 40
+    requests = []
+    class Blob:
+        def download_as_bytes(self, start, end):
+            requests.append((start, end))
+            return data[start:end + 1]
+    src = gcs.GCSSource.__new__(gcs.GCSSource)
+    src.blob = Blob()
+    stream = src.open_range(2500, 2600)
+    assert b"".join(iter(lambda: stream.read(4096), b"")) == data[2500:5100]
+    assert requests == [(2500, 3499), (3500, 4499), (4500, 5099)]
+
+def test_passthrough_reserves_the_source_window():
+    class WideSource(StreamingSource):
+        stream_window = 1024
+    data = bytes(range(256)) * 32
+    budget, dest = memory.MemoryBudget(1 << 20), StreamingDest()
+    dest.failed = True  # no injected reset
+    pipeline.TransferPipeline(WideSource(data), dest, planner.PartPlan(len(data), 4096),
+                              upload_threads=1, passthrough=True, memory=budget).run()
+    assert budget.peak == 1024
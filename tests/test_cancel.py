@@ -0,0 +1,66 @@
+import threading
+import time
+import pytest
+from cloudfile_mover import cancel, pipeline
+
+class BlockingStream:
+    """A response body whose read blocks until the stream is closed."""
+    def __init__(self):
+        self.closed = threading.Event()
+    def read(self, n=-1):
+        self.closed.wait(5)
+        raise ConnectionError("connection closed")
+    def close(self):
+        self.closed.set()
+
+def test_cancel_interrupts_blocked_read():
+    token = cancel.CancellationToken()
+    stream = BlockingStream()
+    threading.Timer(0.05, token.cancel, args=("stop",)).start()
+    started = time.monotonic()
+    with pytest.raises(cancel.TransferCancelled):
+        cancel.read_stream(stream, 1024, token)
+    assert time.monotonic() - started < 1
+
+def test_read_stream_reads_in_blocks():
+    import io
+    token = cancel.CancellationToken()
+    assert cancel.read_stream(io.BytesIO(b"abcdef"), 6, token, block_size=4) == b"abcdef"
+
+class CountingSource:
+    cancel_token = None
+    def __init__(self):
+        self.reads = 0
+    def read_range(self, offset, length):
+        self.reads += 1
+        return b"x" * length
+
+class FailingDest:
+    cancel_token = None
+    def upload_part(self, part_number, data):
+        if part_number == 3:
+            raise ValueError("bad part")
+        time.sleep(0.001)
+
+def test_failure_stops_queued_parts(monkeypatch):
+    monkeypatch.setattr(pipeline.CancellationToken, "wait", lambda self, timeout: False)
+    src = CountingSource()
+    parts = [(i + 1, i * 10, 10) for i in range(5000)]
+    engine = pipeline.TransferPipeline(src, FailingDest(), parts, download_threads=4, upload_threads=4)
+    with pytest.raises(RuntimeError, match="part 3"):
+        engine.run()
+    assert src.reads < 100
+
+def test_external_cancel_stops_transfer():
+    token = cancel.CancellationToken()
+    src = CountingSource()
+    class SlowDest:
+        cancel_token = None
+        def upload_part(self, part_number, data):
+            if part_number == 10:
+                token.cancel("user request")
+    parts = [(i + 1, i * 10, 10) for i in range(5000)]
+    with pytest.raises(cancel.TransferCancelled, match="user request"):
+        pipeline.TransferPipeline(src, SlowDest(), parts, download_threads=2, upload_threads=1,
+                                  cancel_token=token).run()
+    assert src.reads < 100
@@ -0,0 +1,89 @@
+import hashlib
+import os
+import pytest
+from cloudfile_mover import checksums, core, pipeline, planner
+
+google_crc32c = pytest.importorskip("google_crc32c")
+
+def test_part_crcs_combine_into_object_crc():
+    data = os.urandom(10_000)
+    parts = [(google_crc32c.value(data[i:i + 3000]), len(data[i:i + 3000])) for i in range(0, len(data), 3000)]
+    assert checksums.combine_parts(parts) == google_crc32c.value(data)
+    assert checksums.crc32c(memoryview(bytearray(data))) == google_crc32c.value(data)
+    assert checksums.decode_crc32c(checksums.encode_crc32c(0xE3069283)) == 0xE3069283
+
+class Source:
+    provider = "mem"
+    cancel_token = throttle = None
+    def __init__(self, data, stored):
+        self.data, self.stored = data, stored
+        self.deleted = False
+    def get_size(self):
+        return len(self.data)
+    def read_range(self, offset, length):
+        return self.data[offset:offset + length]
+    def stored_checksums(self):
+        return self.stored
+    def delete(self):
+        self.deleted = True
+
+class Dest:
+    cancel_token = throttle = None
+    send_checksums = False
+    def __init__(self):
+        self.parts, self.sent = {}, {}
+        self.completed_with = self.aborted = None
+    def upload_part(self, part_number, data, checksum=None):
+        self.parts[part_number] = bytes(data)
+        self.sent[part_number] = checksum
+    def complete(self, checksum=None):
+        self.completed_with = checksum
+    def abort(self):
+        self.aborted = True
+
+def run_move(monkeypatch, src, dest, chunk_size="1MiB"):
+    monkeypatch.setattr(core, "parse_cloud_url", lambda url: ("gcs", "bucket", url.rsplit("/", 1)[-1]))
+    monkeypatch.setattr(core, "GCSSource", lambda bucket, key: src)
+    monkeypatch.setattr(core, "GCSDest", lambda bucket, key: dest)
+    return core.move_file("gs://bucket/a", "gs://bucket/b", show_progress=False, native_copy=False,
+                          chunk_size=chunk_size)
+
+def test_parts_carry_crcs_and_object_is_verified(monkeypatch):
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    src, dest = Source(data, {"crc32c": google_crc32c.value(data)}), Dest()
+    assert run_move(monkeypatch, src, dest)
+    assert dest.send_checksums
+    assert dest.sent == {n: google_crc32c.value(dest.parts[n]) for n in dest.parts}
+    assert dest.completed_with == google_crc32c.value(data)
+    assert src.deleted
+
+def test_mismatch_keeps_source_and_aborts(monkeypatch):
+    data = os.urandom(2 * 1024 * 1024)
+    src, dest = Source(data, {"crc32c": google_crc32c.value(data) ^ 1}), Dest()
+    with pytest.raises(checksums.ChecksumError):
+        run_move(monkeypatch, src, dest)
+    assert dest.aborted and dest.completed_with is None
+    assert not src.deleted
+
+def test_single_part_object_is_checked_by_md5(monkeypatch):
+    data = os.urandom(1000)
+    src, dest = Source(data, {"md5": hashlib.md5(b"something else").digest()}), Dest()
+    with pytest.raises(checksums.ChecksumError, match="MD5"):
+        run_move(monkeypatch, src, dest)
+    assert not src.deleted
+
+def test_streamed_parts_are_hashed_in_passing():
+    data = os.urandom(5000)
+    class StreamSource(Source):
+        def open_range(self, offset, length):
+            import io
+            return io.BytesIO(self.data[offset:offset + length])
+    class StreamDest(Dest):
+        def upload_part_stream(self, part_number, stream, length):
+            self.parts[part_number] = stream.read(length)
+    dest = StreamDest()
+    run = pipeline.TransferPipeline(StreamSource(data, {}), dest, planner.PartPlan(len(data), 2048),
+                                    passthrough=True, checksums=("crc32c",))
+    run.run()
+    assert {n: d["crc32c"] for n, d in run.part_checksums.items()} == \
+        {n: google_crc32c.value(part) for n, part in dest.parts.items()}
@@ -0,0 +1,40 @@
+from cloudfile_mover import clients
+from cloudfile_mover.providers import s3
+
+def test_registry_shares_clients_and_grows_pools():
+    registry = clients.ClientRegistry()
+    built = []
+    def factory(pool):
+        built.append(pool)
+        return object()
+    first = registry.get(("s3", None, None), factory)
+    assert registry.get(("s3", None, None), factory) is first
+    assert built == [clients.DEFAULT_POOL_SIZE]
+    # Another key gets its own client.
+    registry.get(("azure", "acct", None), factory)
+    assert len(built) == 2
+    # A transfer needing more connections than the pool holds gets a new client.
+    registry.reserve("s3", 32)
+    assert registry.get(("s3", None, None), factory) is not first
+    assert built[-1] == 32
+    registry.reserve("s3", 8)
+    assert len(built) == 3 and registry.get(("s3", None, None), factory) is not first
+
+def test_handlers_share_one_client(monkeypatch):
+    monkeypatch.setattr(s3, "registry", clients.ClientRegistry())
+    monkeypatch.setattr(s3.boto3, "client", lambda *args, **kwargs: object())
+    assert s3.s3_client() is s3.s3_client()
+
+def test_mount_pool_sizes_requests_adapter():
+    import requests
+    session = clients.mount_pool(requests.Session(), 48)
+    assert session.get_adapter("https://storage.googleapis.com")._pool_maxsize == 48
+
+def test_prewarm_runs_probes_concurrently():
+    import threading
+    barrier = threading.Barrier(4, timeout=2)
+    calls = []
+    def probe():
+        calls.append(barrier.wait())
+    clients.prewarm(probe, 4)
+    assert sorted(calls) == [0, 1, 2, 3]
@@ -0,0 +1,57 @@
+import threading
+from cloudfile_mover import core
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket, self.name = bucket, name
+    def compose(self, sources):
+        assert 1 <= len(sources) <= core.COMPOSE_FAN_IN
+        with self.bucket.lock:
+            data = b"".join(self.bucket.objects[s.name] for s in sources)
+            self.bucket.objects[self.name] = data
+            self.bucket.compose_calls += 1
+    def delete(self):
+        with self.bucket.lock:
+            del self.bucket.objects[self.name]
+
+class FakeBucket:
+    def __init__(self):
+        self.objects = {}
+        self.compose_calls = 0
+        self.lock = threading.Lock()
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+def compose_parts(count):
+    bucket = FakeBucket()
+    tree = core.GCSComposeTree(bucket, "obj.part-x-", threads=4)
+    expected = b""
+    for i in range(count):
+        name = f"obj.part-x-{i + 1}"
+        data = f"<{i}>".encode()
+        bucket.objects[name] = data
+        expected += data
+        tree.add(0, i, name)
+    tree.finish(count, "obj")
+    return bucket, expected
+
+def test_compose_tree_small_upload_is_single_compose():
+    bucket, expected = compose_parts(5)
+    assert bucket.objects == {"obj": expected}
+    assert bucket.compose_calls == 1
+
+def test_compose_tree_multi_level_preserves_order_and_cleans_up():
+    bucket, expected = compose_parts(1100)
+    assert bucket.objects == {"obj": expected}
+    # 35 level-1 composites, 2 level-2 composites, 1 final compose
+    assert bucket.compose_calls == 38
+
+def test_compose_tree_abort_removes_temporary_objects():
+    bucket = FakeBucket()
+    tree = core.GCSComposeTree(bucket, "obj.part-x-", threads=4)
+    for i in range(40):
+        name = f"obj.part-x-{i + 1}"
+        bucket.objects[name] = b"x"
+        tree.add(0, i, name)
+    tree.abort()
+    assert bucket.objects == {}
@@ -0,0 +1,62 @@
+import hashlib
+import pytest
+from cloudfile_mover import core
+from cloudfile_mover.checksums import multipart_etag, same_content
+
+def test_same_content():
+    md5 = hashlib.md5(b"data").digest()
+    assert same_content(4, {"crc32c": 1}, 4, {"crc32c": 1, "md5": md5})
+    assert same_content(4, {"crc32c": 1}, 4, {"crc32c": 2}) is False
+    assert same_content(4, {"crc32c": 1}, 5, {"crc32c": 1}) is False
+    assert same_content(4, {"md5": md5}, 4, {"etag": multipart_etag([md5])})
+    assert same_content(4, {"etag": "a" * 32 + "-3"}, 4, {"etag": "a" * 32 + "-3"})
+    # Different part layouts, or nothing in common, cannot be compared.
+    assert same_content(4, {"etag": "a" * 32 + "-3"}, 4, {"etag": "b" * 32 + "-2"}) is None
+    assert same_content(4, {"md5": md5}, 4, {"crc32c": 1}) is None
+
+class Source:
+    provider = "mem"
+    cancel_token = throttle = None
+    def __init__(self, data):
+        self.data, self.deleted = data, False
+    def get_size(self):
+        return len(self.data)
+    def read_range(self, offset, length):
+        return self.data[offset:offset + length]
+    def stored_checksums(self):
+        return {"md5": hashlib.md5(self.data).digest()}
+    def delete(self):
+        self.deleted = True
+
+class Dest:
+    cancel_token = throttle = None
+    def __init__(self, held):
+        self.held, self.parts, self.aborted = held, {}, False
+    def existing(self):
+        return None if self.held is None else (len(self.held), {"md5": hashlib.md5(self.held).digest()})
+    def upload_part(self, part_number, data):
+        self.parts[part_number] = data
+    def complete(self):
+        pass
+    def abort(self):
+        self.aborted = True
+
+def run_move(monkeypatch, src, dest, if_identical):
+    monkeypatch.setattr(core, "parse_cloud_url", lambda url: ("gcs", "bucket", url.rsplit("/", 1)[-1]))
+    monkeypatch.setattr(core, "GCSSource", lambda bucket, key: src)
+    monkeypatch.setattr(core, "GCSDest", lambda bucket, key: dest)
+    return core.move_file("gs://bucket/a", "gs://bucket/b", show_progress=False, native_copy=False,
+                          verify_checksums=False, if_identical=if_identical)
+
+@pytest.mark.parametrize("if_identical, deleted", [("skip", False), ("delete-source", True)])
+def test_identical_destination_moves_no_data(monkeypatch, if_identical, deleted):
+    src, dest = Source(b"x" * 1000), Dest(b"x" * 1000)
+    assert run_move(monkeypatch, src, dest, if_identical)
+    assert dest.parts == {} and not dest.aborted
+    assert src.deleted == deleted
+
+def test_different_destination_is_overwritten(monkeypatch):
+    src, dest = Source(b"x" * 1000), Dest(b"y" * 1000)
+    run_move(monkeypatch, src, dest, "skip")
+    assert b"".join(dest.parts[n] for n in sorted(dest.parts)) == src.data
+    assert src.deleted
@@ -0,0 +1,32 @@
+import json
+import subprocess
+import sys
+
+SDK_PACKAGES = ("boto3", "botocore", "google", "azure")
+# Importing the package and building the CLI parser must stay cheap: the CLI is
+# launched by job schedulers thousands of times an hour. The SDKs alone take
+# several times this long.
+IMPORT_BUDGET = 0.5
+
+def run(code):
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def loaded_sdks(statement):
+    return run(f"""
+import json, sys, time
+started = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - started
+print(json.dumps([elapsed, sorted({{m.split('.')[0] for m in sys.modules}} & {set(SDK_PACKAGES)!r})]))
+""")
+
+def test_cli_import_loads_no_sdk():
+    elapsed, sdks = loaded_sdks("import cloudfile_mover.__main__")
+    assert sdks == []
+    assert elapsed < IMPORT_BUDGET
+
+def test_provider_loads_only_its_own_sdk():
+    _, sdks = loaded_sdks("from cloudfile_mover import core, providers\n"
+                          "providers.load(core.parse_cloud_url('s3://bucket/key')[0])")
+    assert sdks == ["boto3", "botocore"]
@@ -0,0 +1,166 @@
+import types
+import pytest
+from cloudfile_mover import checksums, core, journal
+from cloudfile_mover.providers.azure import AzureDest
+from cloudfile_mover.retry import RetryError, RetryPolicy
+
+def test_journal_round_trip(tmp_path):
+    path = str(tmp_path / "journal.sqlite")
+    j = journal.TransferJournal(path)
+    record = j.begin("s3://a/k", "etag-1", "gs://b/k", 100, 10, {"part_prefix": "p-"})
+    j.record_part(record.id, 1)
+    j.record_part(record.id, 3)
+    j.close()
+
+    j = journal.TransferJournal(path)
+    found = j.find("s3://a/k", "etag-1", "gs://b/k")
+    assert (found.size, found.chunk_size, found.state, found.parts) == (100, 10, {"part_prefix": "p-"}, {1, 3})
+    # A changed source is a different transfer.
+    assert j.find("s3://a/k", "etag-2", "gs://b/k") is None
+    j.finish(found.id)
+    assert j.find("s3://a/k", "etag-1", "gs://b/k") is None
+    j.close()
+
+class MemorySource:
+    provider = "s3"
+    cancel_token = None
+    def __init__(self, data):
+        self.data, self.size, self.reads = data, len(data), []
+    def get_size(self):
+        return self.size
+    def identity(self):
+        return "v1"
+    def read_range(self, offset, length):
+        self.reads.append(offset)
+        return self.data[offset:offset + length]
+    def delete(self):
+        self.data = None
+
+class SessionDest:
+    """Destination whose staged parts outlive the process, like a multipart upload."""
+    cancel_token = None
+    staged = {}
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.aborted = False
+    def session_state(self):
+        return {"session": "s1"}
+    def resume(self, state, plan):
+        assert state == {"session": "s1"}
+        return {n: len(data) for n, data in self.staged.items()}
+    def upload_part(self, part_number, data):
+        if part_number == self.fail_on:
+            raise PermissionError("denied")
+        self.staged[part_number] = data
+    def complete(self):
+        self.result = b"".join(self.staged[n] for n in sorted(self.staged))
+    def abort(self):
+        self.aborted = True
+
+def test_resume_skips_parts_already_at_destination(monkeypatch, tmp_path):
+    data = bytes(range(256)) * 4096  # 1 MiB
+    path = str(tmp_path / "journal.sqlite")
+    SessionDest.staged = {}
+    src = MemorySource(data)
+    monkeypatch.setattr(core, "S3Source", lambda bucket, key: src)
+
+    failing = SessionDest(fail_on=3)
+    monkeypatch.setattr(core, "GCSDest", lambda bucket, key: failing)
+    with pytest.raises(RetryError):
+        core.move_file("s3://a/k", "gs://b/k", threads=1, show_progress=False, chunk_size=128 * 1024,
+                       native_copy=False, resume=True, journal_path=path, retry=RetryPolicy(max_attempts=1))
+    assert not failing.aborted and src.data is not None
+    assert set(SessionDest.staged) == {1, 2}
+
+    src.reads = []
+    dest = SessionDest()
+    monkeypatch.setattr(core, "GCSDest", lambda bucket, key: dest)
+    # A different chunk size on the second run is ignored in favour of the journalled layout.
+    assert core.move_file("s3://a/k", "gs://b/k", threads=2, show_progress=False, chunk_size="auto",
+                          native_copy=False, resume=True, journal_path=path, retry=RetryPolicy(max_attempts=1))
+    assert dest.result == data
+    assert 0 not in src.reads and 128 * 1024 not in src.reads
+    assert journal.TransferJournal(path).find("s3://a/k", "v1", "gs://b/k") is None
+
+class CheckedSessionDest(SessionDest):
+    """Also reports the CRC32C it holds for each staged part, as S3's list_parts does."""
+    def resume(self, state, plan):
+        present = super().resume(state, plan)
+        self.resumed_checksums = {(n, n): checksums.crc32c(data) for n, data in self.staged.items()}
+        return present
+
+@pytest.mark.parametrize("dest_class, deleted", [(SessionDest, False), (CheckedSessionDest, True)])
+def test_source_is_deleted_after_a_resume_only_if_earlier_parts_verify(monkeypatch, tmp_path, dest_class, deleted):
+    pytest.importorskip("google_crc32c")
+    data = bytes(range(256)) * 4096
+    path = str(tmp_path / "journal.sqlite")
+    SessionDest.staged = {}
+    src = MemorySource(data)
+    monkeypatch.setattr(core, "S3Source", lambda bucket, key: src)
+    monkeypatch.setattr(core, "GCSDest", lambda bucket, key: SessionDest(fail_on=3))
+    with pytest.raises(RetryError):
+        core.move_file("s3://a/k", "gs://b/k", threads=1, show_progress=False, chunk_size=128 * 1024,
+                       native_copy=False, resume=True, journal_path=path, retry=RetryPolicy(max_attempts=1))
+
+    dest = dest_class()
+    monkeypatch.setattr(core, "GCSDest", lambda bucket, key: dest)
+    core.move_file("s3://a/k", "gs://b/k", threads=2, show_progress=False, chunk_size=128 * 1024,
+                   native_copy=False, resume=True, journal_path=path, retry=RetryPolicy(max_attempts=1))
+    assert dest.result == data
+    assert (src.data is None) == deleted
+
+class CorruptedSource(MemorySource):
+    def stored_checksums(self):
+        return {"crc32c": checksums.crc32c(self.data) ^ 1}
+
+def test_checksum_mismatch_is_never_left_for_a_resume(monkeypatch, tmp_path):
+    pytest.importorskip("google_crc32c")
+    path = str(tmp_path / "journal.sqlite")
+    SessionDest.staged = {}
+    src = CorruptedSource(bytes(range(256)) * 4096)
+    dest = SessionDest()
+    monkeypatch.setattr(core, "S3Source", lambda bucket, key: src)
+    monkeypatch.setattr(core, "GCSDest", lambda bucket, key: dest)
+    with pytest.raises(checksums.ChecksumError):
+        core.move_file("s3://a/k", "gs://b/k", threads=2, show_progress=False, chunk_size=128 * 1024,
+                       native_copy=False, resume=True, journal_path=path, retry=RetryPolicy(max_attempts=1))
+    assert dest.aborted and src.data is not None
+    assert journal.TransferJournal(path).find("s3://a/k", "v1", "gs://b/k") is None
+
+class FakeBlockBlob:
+    """An Azure blob's uncommitted blocks, which outlive the AzureDest that staged them."""
+    def __init__(self, fail_on=None):
+        self.staged, self.committed, self.fail_on = {}, None, fail_on
+    def stage_block(self, block_id, data, length=None, validate_content=False):
+        if AzureDest._part_number(block_id) == self.fail_on:
+            raise PermissionError("denied")
+        self.staged[block_id] = data.read() if hasattr(data, "read") else bytes(data)
+    def get_block_list(self, block_list_type):
+        return [], [types.SimpleNamespace(id=i, size=len(data)) for i, data in self.staged.items()]
+    def commit_block_list(self, block_ids):
+        self.committed = b"".join(self.staged[b] for b in block_ids)
+    def delete_blob(self):
+        pass
+
+def test_resumed_azure_blocks_are_verified_from_their_block_ids(monkeypatch, tmp_path):
+    pytest.importorskip("google_crc32c")
+    data = bytes(range(256)) * 4096
+    path = str(tmp_path / "journal.sqlite")
+    src, blob = MemorySource(data), FakeBlockBlob(fail_on=3)
+
+    def open_dest(account, container, key):
+        dest = AzureDest.__new__(AzureDest)
+        dest.blob_client, dest.block_ids, dest.copied, dest._copy_id = blob, [], False, None
+        dest.session = "s1"
+        return dest
+
+    monkeypatch.setattr(core, "S3Source", lambda bucket, key: src)
+    monkeypatch.setattr(core, "AzureDest", open_dest)
+    with pytest.raises(RetryError):
+        core.move_file("s3://a/k", "azure://acct@c/k", threads=1, show_progress=False, chunk_size=128 * 1024,
+                       native_copy=False, resume=True, journal_path=path, retry=RetryPolicy(max_attempts=1))
+    blob.fail_on = None
+    core.move_file("s3://a/k", "azure://acct@c/k", threads=2, show_progress=False, chunk_size=128 * 1024,
+                   native_copy=False, resume=True, journal_path=path, retry=RetryPolicy(max_attempts=1))
+    assert blob.committed == data
+    assert src.data is None
@@ -0,0 +1,85 @@
+import threading
+import pytest
+from cloudfile_mover import core, listing
+from cloudfile_mover.listing import PrefixURL, is_prefix_url, list_objects
+from cloudfile_mover.retry import RetryError, RetryPolicy
+
+def test_prefix_urls():
+    assert is_prefix_url("s3://bucket/2024/") and is_prefix_url("gs://bucket/logs/*.gz", glob=True)
+    assert not is_prefix_url("s3://bucket/2024/data.csv")
+    # Without --glob, glob characters are part of the key.
+    assert not is_prefix_url("s3://bucket/reports/file[1].csv")
+    assert PrefixURL("s3://bucket/runs[1]/").prefix == "runs[1]/"
+    url = PrefixURL("gs://bucket/logs/2024-*.gz", glob=True)
+    assert (url.provider, url.location, url.prefix, url.base) == ("gcs", "bucket", "logs/2024-", "logs/")
+    assert url.matches("logs/2024-01.gz") and not url.matches("logs/2024-01.txt")
+    assert url.relative("logs/2024-01.gz") == "2024-01.gz"
+    whole = PrefixURL("azure://acct@container/")
+    assert (whole.location, whole.prefix, whole.root) == (("acct", "container"), "", "azure://acct@container/")
+
+class Lister:
+    """Lists ``keys`` one or two per page, like a store with small pages."""
+    def __init__(self, keys, page_size=2):
+        self.keys, self.page_size = sorted(keys), page_size
+        self.requests = []
+        self.lock = threading.Lock()
+    def list_page(self, prefix, delimiter="/", token=None):
+        with self.lock:
+            self.requests.append((prefix, token))
+        entries = []
+        for key in self.keys:
+            if key.startswith(prefix):
+                head, sep, _ = key[len(prefix):].partition(delimiter)
+                entry = prefix + head + sep if sep else key
+                if entry not in entries:
+                    entries.append(entry)
+        start = token or 0
+        page = entries[start:start + self.page_size]
+        more = start + self.page_size if start + self.page_size < len(entries) else None
+        return ([(k, 1) for k in page if not k.endswith(delimiter)],
+                [p for p in page if p.endswith(delimiter)], more)
+
+KEYS = [f"data/{year}/{month:02d}/part-{n}.csv" for year in (2023, 2024) for month in (1, 2, 3) for n in range(3)] \
+    + ["data/README", "other/x"]
+
+def test_listing_fans_out_over_sub_prefixes():
+    lister = Lister(KEYS)
+    found = [key for key, _ in list_objects(lister, "data/", threads=4)]
+    assert sorted(found) == sorted(k for k in KEYS if k.startswith("data/"))
+    assert ("data/2024/02/", None) in lister.requests
+
+def test_listing_errors_are_raised():
+    class Failing(Lister):
+        def list_page(self, prefix, delimiter="/", token=None):
+            if prefix == "data/2024/":
+                raise ValueError("denied")
+            return super().list_page(prefix, delimiter, token)
+    with pytest.raises(RetryError, match="data/2024/"):
+        list(list_objects(Failing(KEYS), "data/", threads=2, retry=RetryPolicy(max_attempts=1)))
+
+def test_move_prefix_moves_matching_objects(monkeypatch):
+    moved = {}
+    def fake_move_file(src_url, dst_url, **options):
+        if src_url.endswith("part-2.csv") and "/2023/03/" in src_url:
+            raise RuntimeError("boom")
+        moved[src_url] = dst_url
+        return True
+    monkeypatch.setattr(core, "S3Lister", lambda bucket: Lister(KEYS))
+    monkeypatch.setattr(core, "move_file", fake_move_file)
+    result = core.move_prefix("s3://bucket/data/2023/*.csv", "gs://archive/2023/", files=2,
+                              show_progress=False, glob=True)
+    assert moved["s3://bucket/data/2023/01/part-0.csv"] == "gs://archive/2023/01/part-0.csv"
+    assert len(moved) == 8 and result["moved"] == 8
+    assert list(result["failed"]) == ["s3://bucket/data/2023/03/part-2.csv"]
+    with pytest.raises(ValueError):
+        core.move_prefix("s3://bucket/data/", "gs://archive/file.csv")
+
+def test_listing_stays_bounded_ahead_of_consumer(monkeypatch):
+    monkeypatch.setattr(listing, "MAX_PENDING_PAGES", 1)
+    keys = [f"flat/{n:03d}" for n in range(50)]
+    lister = Lister(keys, page_size=1)
+    results = list_objects(lister, "flat/", threads=2)
+    next(results)
+    results.close()
+    # The listing stopped with the consumer instead of running to the end.
+    assert len(lister.requests) < 50
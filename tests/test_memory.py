@@ -0,0 +1,59 @@
+import threading
+import time
+from cloudfile_mover import memory, pipeline, planner
+
+def test_budget_blocks_until_released():
+    budget = memory.MemoryBudget(100)
+    assert budget.acquire(60) == 60
+    assert budget.try_acquire(60) is None
+    done = threading.Event()
+    def waiter():
+        budget.acquire(60)
+        done.set()
+    threading.Thread(target=waiter).start()
+    assert not done.wait(0.2)
+    budget.release(60)
+    assert done.wait(1)
+    assert budget.peak == 60
+
+def test_oversized_part_runs_alone():
+    budget = memory.MemoryBudget(100)
+    assert budget.acquire(500) == 100
+    assert budget.try_acquire(1) is None
+
+def test_budget_is_shared_by_every_caller():
+    assert memory.shared_budget("1MiB") is memory.shared_budget(2 * 1024 * 1024)
+    assert memory.shared_budget("1MiB").limit == 1024 * 1024
+
+class Source:
+    cancel_token = None
+    def __init__(self, data):
+        self.data = data
+    def read_range(self, offset, length):
+        return self.data[offset:offset + length]
+
+class SlowDest:
+    cancel_token = None
+    def __init__(self):
+        self.parts = {}
+    def upload_part(self, part_number, data):
+        time.sleep(0.005)
+        self.parts[part_number] = data
+
+def test_pipeline_stays_within_budget():
+    data = bytes(range(256)) * 64  # 16 KiB in 1 KiB parts
+    budget = memory.MemoryBudget(3 * 1024)
+    dest = SlowDest()
+    plan = planner.PartPlan(len(data), 1024)
+    pipeline.TransferPipeline(Source(data), dest, plan, download_threads=8, upload_threads=2,
+                              read_ahead=8, memory=budget).run()
+    assert b"".join(dest.parts[n] for n in sorted(dest.parts)) == data
+    assert budget.peak <= 3 * 1024 and budget.used == 0
+
+def test_auto_chunk_size_shrinks_to_fit_budget():
+    plan = planner.plan_parts(1024 * planner.MiB, "s3", "gcs", parallelism=4,
+                              max_chunk_size=100 * planner.MiB // 12)
+    assert plan.chunk_size == 8 * planner.MiB
+    # The provider minimum still wins.
+    plan = planner.plan_parts(1024 * planner.MiB, "gcs", "s3", max_chunk_size=planner.MiB)
+    assert plan.chunk_size == 5 * planner.MiB
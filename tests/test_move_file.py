@@ -1,8 +1,11 @@
 import io
 import builtins
+import threading
 import types
 import pytest
-from cloudfile_mover import core
+from cloudfile_mover import core, pipeline
+from cloudfile_mover.providers import azure as azure_provider
+from cloudfile_mover.providers import s3 as s3_provider
 
 def test_parse_cloud_url():
     # S3 URL
@@ -61,6 +64,9 @@ class DummyDest(core.S3Dest):
     def upload_part(self, part_number, data):
         # Store the part data internally instead of uploading
         self.parts.append((part_number, data))
+    def put_object(self, data):
+        # Small objects are written whole rather than as parts
+        self.parts.append((1, data))
     def complete(self):
         # Upon completion, sort parts and combine data to verify integrity
         self.parts.sort(key=lambda x: x[0])
@@ -82,7 +88,8 @@ def test_move_file_dummy(monkeypatch):
     monkeypatch.setattr(core, "S3Source", lambda bucket, key: src)
     monkeypatch.setattr(core, "S3Dest", lambda bucket, key: dest)
     # Run move_file (it will use our dummy source/dest due to monkeypatch)
-    result = core.move_file("s3://dummy_bucket/dummy_key", "s3://dummy_bucket/dummy_key2", threads=4, show_progress=False)
+    result = core.move_file("s3://dummy_bucket/dummy_key", "s3://dummy_bucket/dummy_key2", threads=4, show_progress=False,
+                            native_copy=False)
     assert result is True
     # After move, source should be "deleted" (data set to None) and dest should have combined data
     assert src._data is None
@@ -90,3 +97,310 @@ def test_move_file_dummy(monkeypatch):
     # Verify data integrity
     assert hasattr(dest, "combined_data")
     assert dest.combined_data == data
+
+def test_pipeline_upload_retry_reuses_downloaded_chunk(monkeypatch):
+    monkeypatch.setattr(pipeline.CancellationToken, "wait", lambda self, timeout: False)
+    data = bytes(range(256)) * 40
+    src = DummySource(data)
+    reads = []
+    original_read = src.read_range
+    src.read_range = lambda offset, length: reads.append(offset) or original_read(offset, length)
+    dest = DummyDest()
+    failures = {2: 1}
+    original_upload = dest.upload_part
+    def flaky_upload(part_number, chunk):
+        if failures.get(part_number):
+            failures[part_number] -= 1
+            raise ConnectionError("reset by peer")
+        original_upload(part_number, chunk)
+    dest.upload_part = flaky_upload
+    parts = [(i + 1, i * 1024, min(1024, len(data) - i * 1024)) for i in range(10)]
+    pipeline.TransferPipeline(src, dest, parts, download_threads=3, upload_threads=2, read_ahead=2).run()
+    dest.complete()
+    assert dest.combined_data == data
+    # The failed upload was retried from memory; every range was read exactly once
+    assert sorted(reads) == [p[1] for p in parts]
+
+def test_pipeline_read_ahead_is_bounded():
+    data = b"x" * 4096
+    src = DummySource(data)
+    dest = DummyDest()
+    parts = [(i + 1, i * 256, 256) for i in range(16)]
+    engine = pipeline.TransferPipeline(src, dest, parts, download_threads=4, upload_threads=1, read_ahead=2)
+    seen = []
+    original_upload = dest.upload_part
+    def slow_upload(part_number, chunk):
+        seen.append(engine._chunks.qsize())
+        original_upload(part_number, chunk)
+    dest.upload_part = slow_upload
+    engine.run()
+    assert len(dest.parts) == 16
+    assert max(seen) <= 2
+
+def test_move_file_aborts_on_failure(monkeypatch):
+    monkeypatch.setattr(pipeline.CancellationToken, "wait", lambda self, timeout: False)
+    data = b"0123456789" * 100
+    src = DummySource(data)
+    dest = DummyDest()
+    def broken_upload(part_number, chunk):
+        raise IOError("destination unavailable")
+    dest.upload_part = broken_upload
+    aborted = []
+    dest.abort = lambda: aborted.append(True)
+    monkeypatch.setattr(core, "parse_cloud_url", lambda url: ("s3", "dummy_bucket", "dummy_key"))
+    monkeypatch.setattr(core, "S3Source", lambda bucket, key: src)
+    monkeypatch.setattr(core, "S3Dest", lambda bucket, key: dest)
+    with pytest.raises(RuntimeError):
+        core.move_file("s3://a/b", "s3://c/d", threads=2, show_progress=False, native_copy=False,
+                       small_object_size=0)
+    assert aborted == [True]
+    assert src._data == data
+
+class FakeS3Client:
+    """Records server-side copy calls made by S3Dest."""
+    def __init__(self, objects):
+        self.objects = objects
+        self.calls = []
+        self.uploads = {}
+    def create_multipart_upload(self, Bucket, Key):
+        self.calls.append("create_multipart_upload")
+        self.uploads["u1"] = {}
+        return {"UploadId": "u1"}
+    def upload_part_copy(self, Bucket, Key, UploadId, PartNumber, CopySource, CopySourceRange, **kw):
+        self.calls.append("upload_part_copy")
+        start, end = map(int, CopySourceRange[len("bytes="):].split("-"))
+        data = self.objects[(CopySource["Bucket"], CopySource["Key"])][start:end + 1]
+        self.uploads[UploadId][PartNumber] = data
+        return {"CopyPartResult": {"ETag": f'"etag-{PartNumber}"'}}
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.calls.append("complete_multipart_upload")
+        parts = self.uploads.pop(UploadId)
+        self.objects[(Bucket, Key)] = b"".join(parts[p["PartNumber"]] for p in MultipartUpload["Parts"])
+    def get_object(self, Bucket, Key, Range):
+        self.calls.append("get_object")
+        start, end = map(int, Range[len("bytes="):].split("-"))
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)][start:end + 1])}
+    def put_object(self, Bucket, Key, Body, **kw):
+        self.calls.append("put_object")
+        self.objects[(Bucket, Key)] = Body if isinstance(Body, bytes) else Body.read()
+        self.put_args = kw
+    def copy_object(self, Bucket, Key, CopySource, **kw):
+        self.calls.append("copy_object")
+        self.objects[(Bucket, Key)] = self.objects[(CopySource["Bucket"], CopySource["Key"])]
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.calls.append("abort_multipart_upload")
+    def delete_object(self, Bucket, Key):
+        self.calls.append("delete_object")
+        del self.objects[(Bucket, Key)]
+
+def make_s3_pair(monkeypatch, data):
+    client = FakeS3Client({("src-bucket", "big.bin"): data})
+    src = core.S3Source.__new__(core.S3Source)
+    src.bucket, src.key, src.client, src.size, src.etag = "src-bucket", "big.bin", client, len(data), '"abc"'
+    dest = core.S3Dest.__new__(core.S3Dest)
+    dest.bucket, dest.key, dest.client = "dst-bucket", "moved.bin", client
+    dest.upload_id, dest.parts, dest.copied, dest._lock = None, [], False, threading.Lock()
+    monkeypatch.setattr(core, "S3Source", lambda bucket, key: src)
+    monkeypatch.setattr(core, "S3Dest", lambda bucket, key: dest)
+    return client
+
+def test_move_file_s3_to_s3_uses_upload_part_copy(monkeypatch):
+    data = bytes(range(256)) * (64 * 1024)  # 16 MiB
+    client = make_s3_pair(monkeypatch, data)
+    core.move_file("s3://src-bucket/big.bin", "s3://dst-bucket/moved.bin", threads=4, show_progress=False)
+    assert client.objects == {("dst-bucket", "moved.bin"): data}
+    assert "upload_part_copy" in client.calls
+    assert "copy_object" not in client.calls
+
+def test_move_file_s3_to_s3_small_object_uses_copy_object(monkeypatch):
+    data = b"small object"
+    client = make_s3_pair(monkeypatch, data)
+    core.move_file("s3://src-bucket/big.bin", "s3://dst-bucket/moved.bin", show_progress=False)
+    assert client.objects == {("dst-bucket", "moved.bin"): data}
+    assert client.calls == ["copy_object", "delete_object"]
+
+def test_small_object_moves_in_one_get_and_one_put(monkeypatch):
+    data = b"small object"
+    client = make_s3_pair(monkeypatch, data)
+    core.move_file("s3://src-bucket/big.bin", "s3://dst-bucket/moved.bin", show_progress=False, native_copy=False)
+    assert client.objects == {("dst-bucket", "moved.bin"): data}
+    # No multipart upload to open, complete or abort.
+    assert client.calls == ["get_object", "put_object", "delete_object"]
+
+def test_failed_source_delete_keeps_the_verified_destination(monkeypatch):
+    data = b"small object"
+    client = make_s3_pair(monkeypatch, data)
+    delete_object = client.delete_object
+    def delete(Bucket, Key):
+        if Bucket == "src-bucket":
+            raise PermissionError("AccessDenied")
+        delete_object(Bucket, Key)
+    client.delete_object = delete
+    with pytest.raises(PermissionError):
+        core.move_file("s3://src-bucket/big.bin", "s3://dst-bucket/moved.bin", show_progress=False,
+                       native_copy=False)
+    assert client.objects == {("src-bucket", "big.bin"): data, ("dst-bucket", "moved.bin"): data}
+
+def test_small_object_read_is_verified_before_it_is_written(monkeypatch):
+    from cloudfile_mover import checksums
+    data = b"small object"
+    client = make_s3_pair(monkeypatch, data)
+    client.objects[("dst-bucket", "moved.bin")] = b"previous version"
+    # The source's stored CRC32C does not match what is read.
+    wrong = checksums.digest(b"something else", ("crc32c",))["crc32c"]
+    monkeypatch.setattr(s3_provider.S3Source, "_head", {"ChecksumCRC32C": checksums.encode_crc32c(wrong)})
+    with pytest.raises(checksums.ChecksumError):
+        core.move_file("s3://src-bucket/big.bin", "s3://dst-bucket/moved.bin", show_progress=False,
+                       native_copy=False)
+    assert client.calls == ["get_object"]
+    assert client.objects[("dst-bucket", "moved.bin")] == b"previous version"
+    assert client.objects[("src-bucket", "big.bin")] == data
+
+class FakeGCSBlob:
+    def __init__(self, bucket, name):
+        self.bucket, self.name = bucket, name
+        self.generation = 7
+    def rewrite(self, source, token=None, if_source_generation_match=None):
+        # Hand back a token after each 1000 bytes like a slow cross-location rewrite
+        data = source.bucket.store[(source.bucket.name, source.name)]
+        done = (token or 0) + 1000
+        if done < len(data):
+            return done, done, len(data)
+        self.bucket.store[(self.bucket.name, self.name)] = data
+        self.bucket.calls.append("rewrite")
+        return None, len(data), len(data)
+    def delete(self):
+        del self.bucket.store[(self.bucket.name, self.name)]
+
+class FakeGCSBucket:
+    def __init__(self, name, store, calls):
+        self.name, self.store, self.calls = name, store, calls
+    def blob(self, name):
+        return FakeGCSBlob(self, name)
+    def move_blob(self, blob, new_name, if_source_generation_match=None):
+        self.calls.append("move_blob")
+        self.store[(self.name, new_name)] = self.store.pop((self.name, blob.name))
+
+def make_gcs_pair(monkeypatch, data, src_bucket, dst_bucket):
+    store, calls = {(src_bucket, "obj"): data}, []
+    src = core.GCSSource.__new__(core.GCSSource)
+    src.bucket = FakeGCSBucket(src_bucket, store, calls)
+    src.blob, src.size = src.bucket.blob("obj"), len(data)
+    dest = core.GCSDest.__new__(core.GCSDest)
+    dest.bucket, dest.final_blob_name = FakeGCSBucket(dst_bucket, store, calls), "moved"
+    dest.copied = dest.consumed_source = False
+    dest._rewrite_token, dest._rewritten, dest.part_count = None, 0, 0
+    dest._tree = core.GCSComposeTree(dest.bucket, "moved.part-x-")
+    monkeypatch.setattr(core, "GCSSource", lambda bucket, key: src)
+    monkeypatch.setattr(core, "GCSDest", lambda bucket, key: dest)
+    return store, calls
+
+class CountingProgress:
+    def __init__(self, *args, **kwargs):
+        self.n = 0
+    def update(self, n):
+        self.n += n
+    def close(self):
+        pass
+
+def test_move_file_gcs_same_bucket_is_a_rename(monkeypatch):
+    store, calls = make_gcs_pair(monkeypatch, b"payload", "bkt", "bkt")
+    core.move_file("gs://bkt/obj", "gs://bkt/moved", show_progress=False)
+    assert store == {("bkt", "moved"): b"payload"}
+    assert calls == ["move_blob"]
+
+def test_move_file_gcs_cross_bucket_rewrites_with_tokens(monkeypatch):
+    data = b"z" * 3500
+    store, calls = make_gcs_pair(monkeypatch, data, "src", "dst")
+    progress = CountingProgress()
+    monkeypatch.setattr(core, "tqdm", lambda *a, **k: progress)
+    core.move_file("gs://src/obj", "gs://dst/moved", show_progress=True)
+    assert store == {("dst", "moved"): data}
+    assert calls == ["rewrite"]
+    assert progress.n == len(data)
+
+class FakeAzureBlobClient:
+    def __init__(self, sources):
+        self.sources = sources
+        self.staged = {}
+        self.committed = None
+        self.calls = []
+    def _fetch(self, url, offset=0, length=None):
+        data = self.sources[url]
+        return data[offset:offset + length] if length is not None else data
+    def stage_block(self, block_id, data):
+        self.staged[block_id] = bytes(data)
+    def stage_block_from_url(self, block_id, source_url, source_offset, source_length):
+        self.calls.append("stage_block_from_url")
+        self.staged[block_id] = self._fetch(source_url, source_offset, source_length)
+    def upload_blob_from_url(self, source_url, overwrite=False):
+        self.calls.append("upload_blob_from_url")
+        self.committed = self._fetch(source_url)
+    def commit_block_list(self, block_ids):
+        self.committed = b"".join(self.staged[b] for b in block_ids)
+    def delete_blob(self):
+        self.committed = None
+
+def make_azure_dest(client):
+    dest = core.AzureDest.__new__(core.AzureDest)
+    dest.blob_client, dest.block_ids, dest.copied, dest._copy_id = client, [], False, None
+    dest.session = "test"
+    return dest
+
+def test_move_file_ingests_into_azure_from_presigned_url(monkeypatch):
+    data = bytes(range(256)) * (64 * 1024)  # 16 MiB -> several blocks
+    src = DummySource(data)
+    src.presigned_url = lambda: "https://example-bucket.s3.amazonaws.com/big.bin?X-Amz-Signature=x"
+    client = FakeAzureBlobClient({src.presigned_url(): data})
+    dest = make_azure_dest(client)
+    src.read_range = None  # the host must never read the data
+    monkeypatch.setattr(core, "S3Source", lambda bucket, key: src)
+    monkeypatch.setattr(core, "AzureDest", lambda account, container, blob: dest)
+    core.move_file("s3://example-bucket/big.bin", "azure://acct@container/big.bin",
+                   threads=4, show_progress=False, ingest_from_url=True)
+    assert client.committed == data
+    assert set(client.calls) == {"stage_block_from_url"}
+    assert src._data is None
+
+def test_azure_dest_commits_blocks_in_part_order():
+    client = FakeAzureBlobClient({})
+    dest = make_azure_dest(client)
+    for part_number in reversed(range(1, 12001)):
+        dest.upload_part(part_number, part_number.to_bytes(2, "big"))
+    dest.complete()
+    assert client.committed == b"".join(n.to_bytes(2, "big") for n in range(1, 12001))
+
+class FakeCopyingBlobClient(FakeAzureBlobClient):
+    """Simulates an asynchronous Copy Blob that advances on every status poll."""
+    def __init__(self, sources, step):
+        super().__init__(sources)
+        self.step = step
+        self.copied = 0
+        self.total = 0
+    def start_copy_from_url(self, source_url, requires_sync=False):
+        self.calls.append("start_copy_from_url")
+        self.pending = self._fetch(source_url)
+        self.total = len(self.pending)
+        return {"copy_id": "c1", "copy_status": "pending"}
+    def get_blob_properties(self):
+        self.copied = min(self.total, self.copied + self.step)
+        status = "success" if self.copied == self.total else "pending"
+        if status == "success":
+            self.committed = self.pending
+        copy = types.SimpleNamespace(status=status, progress=f"{self.copied}/{self.total}", status_description=None)
+        return types.SimpleNamespace(copy=copy)
+
+def test_azure_to_azure_large_copy_polls_status_into_progress(monkeypatch):
+    monkeypatch.setattr(azure_provider, "AZURE_COPY_POLL_INTERVAL", 0)
+    monkeypatch.setattr(azure_provider, "AZURE_SYNC_COPY_LIMIT", 100)
+    data = b"q" * 1000
+    src = types.SimpleNamespace(provider="azure", size=len(data),
+                                presigned_url=lambda: "https://a.blob.core.windows.net/c/b?sig=x")
+    client = FakeCopyingBlobClient({src.presigned_url(): data}, step=300)
+    dest = make_azure_dest(client)
+    seen = []
+    dest.copy_from(src, progress=seen.append)
+    dest.complete()
+    assert client.committed == data
+    assert seen == [300, 300, 300, 100]
+    assert client.calls == ["start_copy_from_url"]
@@ -0,0 +1,54 @@
+import pytest
+from cloudfile_mover import planner
+from cloudfile_mover.planner import MiB, GiB, TiB
+
+def test_parse_size():
+    assert planner.parse_size("64MiB") == 64 * MiB
+    assert planner.parse_size("64M") == 64 * MiB
+    assert planner.parse_size("1.5GiB") == int(1.5 * GiB)
+    assert planner.parse_size("1048576") == MiB
+    assert planner.parse_size(4096) == 4096
+    assert planner.parse_size("auto") == "auto"
+    assert planner.parse_size(None) == "auto"
+    with pytest.raises(ValueError):
+        planner.parse_size("lots")
+
+def test_auto_plan_small_object_is_single_part():
+    plan = planner.plan_parts(10 * 1024, "s3", "s3", parallelism=8)
+    assert plan.num_parts == 1
+    assert list(plan) == [(1, 0, 10 * 1024)]
+
+def test_auto_plan_spreads_medium_objects_over_workers():
+    plan = planner.plan_parts(100 * MiB, "gcs", "s3", parallelism=4)
+    assert plan.chunk_size == 25 * MiB
+    assert plan.num_parts == 4
+
+def test_auto_plan_respects_s3_part_count_limit():
+    size = 2 * TiB
+    plan = planner.plan_parts(size, "gcs", "s3", parallelism=8)
+    assert plan.num_parts <= 10000
+    assert plan.chunk_size % MiB == 0
+    parts = list(plan)
+    assert sum(length for _, _, length in parts) == size
+    assert parts[-1][1] + parts[-1][2] == size
+
+def test_auto_plan_large_gcs_object_keeps_default_chunk():
+    plan = planner.plan_parts(50 * GiB, "s3", "gcs", parallelism=8)
+    assert plan.chunk_size == planner.DEFAULT_CHUNK_SIZE
+    assert plan.num_parts == 800
+
+def test_explicit_chunk_size_is_validated():
+    assert planner.plan_parts(100 * MiB, "s3", "azure", chunk_size="10MiB").num_parts == 10
+    with pytest.raises(ValueError):
+        planner.plan_parts(100 * MiB, "azure", "s3", chunk_size="1MiB")
+    with pytest.raises(ValueError):
+        planner.plan_parts(1 * TiB, "azure", "s3", chunk_size="64MiB")
+    with pytest.raises(ValueError):
+        planner.plan_parts(6 * TiB, "azure", "s3")
+    # A chunk size larger than the object still leaves one part that must fit.
+    with pytest.raises(ValueError):
+        planner.plan_parts(6 * GiB, "s3", "s3", chunk_size="10GiB")
+    assert planner.plan_parts(1 * MiB, "gcs", "s3", chunk_size="10GiB").num_parts == 1
+
+def test_empty_object_has_no_parts():
+    assert list(planner.plan_parts(0, "s3", "gcs")) == []
@@ -0,0 +1,91 @@
+import io
+import time
+import pytest
+from cloudfile_mover import pipeline, planner, ratelimit
+from cloudfile_mover.buffers import as_file
+from cloudfile_mover.cancel import read_stream
+
+@pytest.fixture(autouse=True)
+def no_limits():
+    ratelimit.limiter.clear()
+    yield
+    ratelimit.limiter.clear()
+
+def test_parse_rate_and_specs():
+    assert ratelimit.parse_rate("2Gbit") == 250_000_000
+    assert ratelimit.parse_rate("200MiB") == 200 * 1024 * 1024
+    assert ratelimit.parse_rate("unlimited") is None
+    with pytest.raises(ValueError, match="Ambiguous"):
+        ratelimit.parse_rate("2Gb")
+    assert ratelimit.parse_limit_spec("1Gbit") == (125_000_000, None, None)
+    assert ratelimit.parse_limit_spec("write=1MiB") == (1024 * 1024, None, "write")
+    assert ratelimit.parse_limit_spec("s3=1MiB") == (1024 * 1024, "s3", None)
+    assert ratelimit.parse_limit_spec("gcs:read=1MiB") == (1024 * 1024, "gcs", "read")
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+def test_bucket_paces_to_rate():
+    clock = Clock()
+    bucket = ratelimit.TokenBucket(1000, clock=clock)
+    assert bucket.reserve(500) == pytest.approx(0.5)
+    clock.now = 0.5
+    assert bucket.reserve(100) == pytest.approx(0.1)
+    # Debt carries over a rate change.
+    bucket.set_rate(100)
+    assert bucket.reserve(10) == pytest.approx(1.1)
+
+def test_tightest_matching_limit_applies():
+    limiter = ratelimit.BandwidthLimiter()
+    limiter.set_limit("1MiB")
+    limiter.set_limit("10KiB", provider="s3", direction="write")
+    throttle = limiter.throttle("s3", "write")
+    started = time.monotonic()
+    # Each KiB takes 0.1s at 10 KiB/s; buckets start empty.
+    throttle.consume(1024)
+    throttle.consume(1024)
+    assert time.monotonic() - started >= 0.18
+    assert limiter.limits()[("s3", "write")] == 10 * 1024
+    limiter.set_limit(None, provider="s3", direction="write")
+    assert list(limiter.limits()) == [(None, None)]
+
+def test_upload_body_is_charged_once():
+    charged = []
+    class Recorder:
+        def consume(self, n):
+            charged.append(n)
+    body = as_file(b"x" * 100, Recorder())
+    assert len(body) == 100
+    body.read()
+    body.seek(0)
+    body.read(60)
+    assert sum(charged) == 100
+
+class Source:
+    provider = "mem"
+    cancel_token = throttle = None
+    def __init__(self, data):
+        self.data = data
+    def read_range(self, offset, length):
+        return read_stream(io.BytesIO(self.data[offset:offset + length]), length, self.cancel_token,
+                           block_size=1024, throttle=self.throttle)
+
+class Dest:
+    cancel_token = throttle = None
+    def __init__(self):
+        self.parts = {}
+    def upload_part(self, part_number, data):
+        self.parts[part_number] = data
+
+def test_pipeline_reads_are_limited():
+    ratelimit.set_bandwidth_limit("40KiB", provider="mem", direction="read")
+    data = bytes(16 * 1024)
+    dest = Dest()
+    started = time.monotonic()
+    pipeline.TransferPipeline(Source(data), dest, planner.PartPlan(len(data), 4096), download_threads=4).run()
+    # 16 KiB at 40 KiB/s.
+    assert time.monotonic() - started >= 0.35
+    assert b"".join(dest.parts[n] for n in sorted(dest.parts)) == data
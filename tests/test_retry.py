@@ -0,0 +1,63 @@
+import pytest
+from cloudfile_mover import retry
+
+class FakeClientError(Exception):
+    """Shaped like botocore.exceptions.ClientError."""
+    def __init__(self, code, status, headers=None):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code},
+                         "ResponseMetadata": {"HTTPStatusCode": status, "HTTPHeaders": headers or {}}}
+
+class FakeAzureError(Exception):
+    """Shaped like azure.core.exceptions.HttpResponseError."""
+    def __init__(self, status, error_code, headers):
+        super().__init__(error_code)
+        self.status_code, self.error_code = status, error_code
+        self.response = type("Response", (), {"headers": headers})()
+
+class ReadTimeoutError(Exception):
+    pass
+
+def test_classify_throttling_with_retry_after():
+    info = retry.classify(FakeClientError("SlowDown", 503, {"retry-after": "3"}))
+    assert info == retry.ErrorInfo(True, True, 3.0)
+    info = retry.classify(FakeAzureError(503, "ServerBusy", {"x-ms-retry-after-ms": "1500"}))
+    assert info == retry.ErrorInfo(True, True, 1.5)
+
+def test_classify_permanent_and_transient_errors():
+    assert not retry.classify(FakeClientError("AccessDenied", 403)).retryable
+    assert not retry.classify(FakeClientError("NoSuchKey", 404)).retryable
+    assert retry.classify(FakeClientError("InternalError", 500)).retryable
+    assert retry.classify(ConnectionResetError()).retryable
+    assert retry.classify(ReadTimeoutError()).retryable
+
+def test_full_jitter_delay_bounds():
+    policy = retry.RetryPolicy(base_delay=1.0, max_delay=8.0)
+    plain = retry.ErrorInfo(True, False, None)
+    assert all(0 <= policy.delay(10, plain) <= 8.0 for _ in range(100))
+    assert all(0 <= policy.delay(1, plain) <= 2.0 for _ in range(100))
+    hinted = retry.ErrorInfo(True, True, 5.0)
+    assert all(policy.delay(0, hinted) >= 5.0 for _ in range(100))
+
+def test_call_fails_fast_on_permanent_error(monkeypatch):
+    monkeypatch.setattr(retry.time, "sleep", lambda s: None)
+    calls = []
+    def action():
+        calls.append(1)
+        raise FakeClientError("AccessDenied", 403)
+    with pytest.raises(retry.RetryError):
+        retry.RetryPolicy(max_attempts=5).call(action, "upload part 1")
+    assert len(calls) == 1
+
+def test_call_retries_transient_errors(monkeypatch):
+    monkeypatch.setattr(retry.time, "sleep", lambda s: None)
+    outcomes = [ConnectionResetError(), FakeClientError("SlowDown", 503), "ok"]
+    retried = []
+    def action():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    result = retry.RetryPolicy().call(action, "download part 1", on_retry=lambda e, info: retried.append(info.throttled))
+    assert result == "ok"
+    assert retried == [False, True]
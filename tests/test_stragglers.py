@@ -0,0 +1,79 @@
+import threading
+import time
+import pytest
+from cloudfile_mover import pipeline, planner
+
+@pytest.fixture(autouse=True)
+def small_ranges(monkeypatch):
+    monkeypatch.setattr(pipeline, "SPLIT_MIN_SIZE", 1024)
+    monkeypatch.setattr(pipeline, "HEDGE_MIN_DELAY", 0.05)
+
+class Source:
+    cancel_token = None
+    def __init__(self, data, stall_at=None, delay=0.01, slow_at=None):
+        self.data = data
+        self.stall_at = stall_at
+        self.slow_at = slow_at
+        self.delay = delay
+        self.reads = []
+        self.lock = threading.Lock()
+    def read_range(self, offset, length):
+        with self.lock:
+            first = all(o != offset for o, _ in self.reads)
+            self.reads.append((offset, length))
+        if offset == self.stall_at and first:
+            # A stuck connection: only an interruption gets it moving.
+            self.cancel_token.wait(10)
+            raise ConnectionError("read interrupted")
+        if offset == self.slow_at and first:
+            # A slow stream, which like the real handlers stops between blocks once interrupted.
+            if self.cancel_token.wait(1.5):
+                raise ConnectionError("read interrupted")
+        time.sleep(self.delay)
+        return self.data[offset:offset + length]
+
+class Dest:
+    cancel_token = None
+    def __init__(self):
+        self.parts = {}
+    def upload_part(self, part_number, data):
+        self.parts[part_number] = bytes(data)
+
+def test_last_part_is_split_but_uploaded_whole():
+    data = bytes(range(256)) * 32
+    src, dest = Source(data), Dest()
+    plan = planner.PartPlan(len(data), 4096)
+    pipeline.TransferPipeline(src, dest, plan, download_threads=4, upload_threads=2).run()
+    assert dest.parts == {1: data[:4096], 2: data[4096:]}
+    assert (0, 4096) in src.reads
+    assert max(length for offset, length in src.reads if offset >= 4096) < 4096
+
+def test_slow_whole_part_is_hedged_by_idle_workers():
+    data = bytes(range(256)) * 320
+    # Many more parts than workers, so the last part is taken while all are busy.
+    src, dest = Source(data, slow_at=19 * 4096), Dest()
+    run = pipeline.TransferPipeline(src, dest, planner.PartPlan(len(data), 4096), download_threads=4)
+    started = time.monotonic()
+    run.run()
+    assert time.monotonic() - started < 1.0
+    assert dest.parts == {n + 1: data[n * 4096:(n + 1) * 4096] for n in range(20)}
+    assert (19 * 4096, 4096) in src.reads
+    assert run.hedges["issued"] >= 1 and run.hedges["won"] >= 1
+
+def test_straggling_range_is_hedged():
+    data = bytes(range(256)) * 32
+    src, dest = Source(data, stall_at=2048), Dest()
+    run = pipeline.TransferPipeline(src, dest, planner.PartPlan(len(data), len(data)),
+                                    download_threads=4, upload_threads=1)
+    started = time.monotonic()
+    run.run()
+    assert time.monotonic() - started < 5
+    assert dest.parts == {1: data}
+    assert run.hedges == {"issued": 1, "won": 1}
+
+def test_no_splitting_without_hedge_tail():
+    data = bytes(range(256)) * 32
+    src, dest = Source(data), Dest()
+    pipeline.TransferPipeline(src, dest, planner.PartPlan(len(data), 4096), download_threads=4,
+                              hedge_tail=False).run()
+    assert sorted(src.reads) == [(0, 4096), (4096, 4096)]